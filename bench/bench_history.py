@@ -0,0 +1,88 @@
+"""
+Storage growth of the snapshot history.
+
+Appends synthetic polls for W wallets, of which a fraction changes on each poll,
+and reports rows and bytes after each stage against a naive store that keeps one full
+JSON snapshot per poll. Quiet wallets should cost one row regardless of poll count.
+
+    python bench/bench_history.py --wallets 200 --polls 100 1000 5000 --change-rate 0.05
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.dirname(HERE))
+
+import hyperdash_telegram_bot_mtproto_coinglass as bot_mod  # noqa: E402
+from fake_upstream import SyntheticWallet  # noqa: E402
+
+
+def snapshot(w: SyntheticWallet) -> "bot_mod.Snapshot":
+    tokens, positions = w.copy()
+    return bot_mod.normalize_snapshot({
+        "usd_total": sum(tokens.values()),
+        "tokens": tokens,
+        "positions": [{"symbol": sym, "side": side, "size_usd": size} for sym, (side, size) in positions.items()],
+    })
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--wallets", type=int, default=200)
+    ap.add_argument("--polls", type=int, nargs="+", default=[100, 1000, 3000])
+    ap.add_argument("--change-rate", type=float, default=0.05, help="share of wallets changing per poll")
+    ap.add_argument("--tokens", type=int, default=8)
+    ap.add_argument("--positions", type=int, default=3)
+    ap.add_argument("--interval", type=float, default=300, help="simulated seconds between polls")
+    args = ap.parse_args()
+
+    rng = random.Random(1)
+    path = os.path.join(tempfile.mkdtemp(prefix="signalbot-history-"), "history.db")
+    store = bot_mod.HistoryStore(path)
+    addrs = [f"0x{i:040x}" for i in range(args.wallets)]
+    wallets = [SyntheticWallet(a, args.tokens, args.positions) for a in addrs]
+    snaps = [snapshot(w) for w in wallets]
+    naive_bytes = 0
+    t0 = time.time() - max(args.polls) * args.interval
+    done = 0
+    t_append = 0.0
+    print(f"wallets={args.wallets} change_rate={args.change_rate} tokens={args.tokens} positions={args.positions}")
+    for target in sorted(args.polls):
+        for poll in range(done, target):
+            now = t0 + poll * args.interval
+            for i, w in enumerate(wallets):
+                if rng.random() < args.change_rate:
+                    w.step(0.3)
+                    snaps[i] = snapshot(w)
+                naive_bytes += len(json.dumps(snaps[i].to_state(), separators=(",", ":")))
+                a0 = time.perf_counter()
+                store.append(addrs[i], snaps[i], now)
+                t_append += time.perf_counter() - a0
+            store.flush()
+        done = target
+        rows = store._conn.execute("SELECT COUNT(*), SUM(key), SUM(LENGTH(data)) FROM history").fetchone()
+        polls = target * args.wallets
+        print(f"  {target:>6} polls/wallet: {rows[0]} rows ({rows[1]} keyframes), {rows[2] / 1024:.0f} KB payload "
+              f"({rows[2] / polls:.1f} B/poll) vs naive {naive_bytes / 1024:.0f} KB; "
+              f"append {t_append / polls * 1e6:.0f}µs/poll")
+    q0 = time.perf_counter()
+    for addr in addrs[:50]:
+        store.at(addr, t0 + done * args.interval / 2)
+    print(f"  point-in-time query: {(time.perf_counter() - q0) / min(50, len(wallets)) * 1000:.2f}ms/wallet")
+    m0 = time.perf_counter()
+    n = store.maintain(retention=done * args.interval, downsample_after=done * args.interval / 2,
+                       bucket=args.interval * 12, now=t0 + done * args.interval)
+    rows = store._conn.execute("SELECT COUNT(*), SUM(LENGTH(data)) FROM history").fetchone()
+    print(f"  downsampling the older half to {args.interval * 12 / 60:.0f}min buckets: {n} wallets rewritten "
+          f"in {time.perf_counter() - m0:.2f}s -> {rows[0]} rows, {rows[1] / 1024:.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
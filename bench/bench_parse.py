@@ -0,0 +1,179 @@
+"""
+Peak memory and parse time for the HyperDash and DexScreener fetchers on large payloads,
+streaming parsers vs the old buffer-everything approach (r.text + regex + json.loads).
+
+Fixtures are generated in memory and served from the local fake upstream; each variant
+fetches the same URL through the bot's HTTP session, `--threads` at a time, so the peak
+reflects concurrent fetches the way the poll engine issues them. The "large trader"
+page puts the bulk into the trader object itself (the value that is decoded), which is
+where decode time has to stay linear.
+
+    python bench/bench_parse.py --page-mb 4 --pairs 20000 --threads 8
+    python bench/bench_parse.py --trader-positions 32000
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.dirname(HERE))
+
+from fake_upstream import FakeUpstream, hyperdash_page  # noqa: E402
+
+ADDRESS = "0x" + "ab" * 20
+BIG_TRADER_ADDRESS = "0x" + "cd" * 20
+
+
+def hyperdash_fixture(page_mb: float, positions: int, fills: int, address: str = ADDRESS) -> bytes:
+    """A trader page with filler markup and a large pageProps (fill history) around the trader."""
+    rng = random.Random(1)
+    trader = {"address": address, "positions": [
+        {"symbol": f"C{i}", "notional": round(rng.uniform(50, 50000), 2), "side": rng.choice(["long", "short"])}
+        for i in range(positions)
+    ]}
+    history = [{"coin": f"C{rng.randrange(positions or 1)}", "px": str(rng.uniform(1, 100)), "sz": str(rng.uniform(0, 10)),
+                "time": 1700000000000 + i, "hash": "0x" + "%064x" % rng.getrandbits(256)} for i in range(fills)]
+    data = {"props": {"pageProps": {"fills": history, "trader": trader, "leaderboard": history[: fills // 4]}},
+            "page": "/trader/[address]", "buildId": "bench"}
+    return hyperdash_page(data, int(page_mb * 1024 * 1024)).encode()
+
+
+def dexscreener_fixture(pairs: int) -> bytes:
+    rng = random.Random(2)
+    return json.dumps({"schemaVersion": "1.0.0", "pairs": [{
+        "chainId": "ethereum", "dexId": "uniswap", "url": "https://dexscreener.com/ethereum/0x%040x" % i,
+        "pairAddress": "0x%040x" % i,
+        "baseToken": {"address": "0x%040x" % rng.getrandbits(160), "name": f"Token {i % 500}", "symbol": f"T{i % 500}"},
+        "quoteToken": {"address": "0x%040x" % rng.getrandbits(160), "name": "Wrapped Ether", "symbol": "WETH"},
+        "priceNative": str(rng.random()), "priceUsd": str(rng.random() * 3000),
+        "txns": {"h24": {"buys": rng.randrange(1000), "sells": rng.randrange(1000)}},
+        "volume": {"h24": rng.uniform(0, 1e6)}, "priceChange": {"h24": rng.uniform(-50, 50)},
+        "liquidity": {"usd": round(rng.uniform(0, 1e6), 2), "base": rng.uniform(0, 1e6), "quote": rng.uniform(0, 500)},
+    } for i in range(pairs)]}).encode()
+
+
+def legacy_hyperdash(bot_mod, url):
+    r = bot_mod.app.session.get(url, timeout=30)
+    m = re.search(r'<script id="__NEXT_DATA__" type="application/json">(.+?)</script>', r.text, re.S)
+    data = json.loads(m.group(1))
+    trader = data.get("props", {}).get("pageProps", {}).get("trader")
+    return len(trader.get("positions") or [])
+
+
+def legacy_dexscreener(bot_mod, url):
+    r = bot_mod.app.session.get(url, timeout=30)
+    tokens = {}
+    for p in r.json().get("pairs") or []:
+        base = (p.get("baseToken") or {}).get("symbol")
+        if base:
+            tokens[base] = tokens.get(base, 0.0) + float((p.get("liquidity") or {}).get("usd") or 0)
+    return len(tokens)
+
+
+def streaming_hyperdash(bot_mod, url):
+    r = bot_mod.app.session.get(url, timeout=30, stream=True)
+    return len(bot_mod._parse_streamed(r, bot_mod.parse_hyperdash_positions))
+
+
+def streaming_dexscreener(bot_mod, url):
+    r = bot_mod.app.session.get(url, timeout=30, stream=True)
+    return len(bot_mod._parse_streamed(r, bot_mod.parse_dexscreener_pairs))
+
+
+def run_threads(fn, bot_mod, url, threads: int):
+    results, times = [], []
+    barrier = threading.Barrier(threads)
+
+    def work():
+        barrier.wait()
+        t0 = time.perf_counter()
+        results.append(fn(bot_mod, url))
+        times.append(time.perf_counter() - t0)
+
+    ts = [threading.Thread(target=work) for _ in range(threads)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    return results, times
+
+
+def measure(fn, bot_mod, url, threads: int, rounds: int):
+    """Timings from untraced rounds, then one traced round for the peak (tracemalloc skews time)."""
+    times = []
+    for _ in range(rounds):
+        results, t = run_threads(fn, bot_mod, url, threads)
+        times.extend(t)
+    tracemalloc.start()
+    run_threads(fn, bot_mod, url, threads)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    times.sort()
+    return {"result": results[0], "p50_s": times[len(times) // 2], "max_s": times[-1], "peak_mb": peak / 1e6}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--page-mb", type=float, default=2.0, help="HyperDash filler markup")
+    ap.add_argument("--fills", type=int, default=20000, help="fill history entries in the HyperDash page props")
+    ap.add_argument("--positions", type=int, default=50)
+    ap.add_argument("--trader-positions", type=int, default=20000, help="positions in the large-trader page (0 = skip)")
+    ap.add_argument("--pairs", type=int, default=10000, help="DexScreener pairs")
+    ap.add_argument("--threads", type=int, default=4, help="concurrent fetches per measurement")
+    ap.add_argument("--rounds", type=int, default=3)
+    args = ap.parse_args()
+
+    srv = FakeUpstream().start()
+    workdir = tempfile.mkdtemp(prefix="signalbot-parse-")
+    os.environ.update(srv.env())
+    os.environ.update({
+        "STATE_DB": os.path.join(workdir, "state.db"),
+        "STATE_FILE": os.path.join(workdir, "state.json"),
+        "WALLETS_FILE": os.path.join(workdir, "wallets.json"),
+        "AUTHORIZED_CHATS_FILE": os.path.join(workdir, "chats.json"),
+        "SUBSCRIPTIONS_FILE": os.path.join(workdir, "subscriptions.json"),
+        "HISTORY_DB": os.path.join(workdir, "history.db"),
+        "SCRAPE_MAX_BYTES": str(1 << 30),
+    })
+    import hyperdash_telegram_bot_mtproto_coinglass as bot_mod
+
+    page = hyperdash_fixture(args.page_mb, args.positions, args.fills)
+    search = dexscreener_fixture(args.pairs)
+    srv.recorded[("hyperdash", ADDRESS)] = [page]
+    srv.recorded[("dexscreener", ADDRESS)] = [search]
+    env = srv.env()
+    hd_url = f"{env['HYPERDASH_BASE']}/trader/{ADDRESS}"
+    ds_url = env["DEXSCREENER_API"] + ADDRESS
+    cases = [("hyperdash", hd_url, legacy_hyperdash, streaming_hyperdash),
+             ("dexscreener", ds_url, legacy_dexscreener, streaming_dexscreener)]
+
+    print(f"hyperdash page {len(page) / 1e6:.1f} MB, dexscreener search {len(search) / 1e6:.1f} MB, "
+          f"{args.threads} concurrent fetches")
+    if args.trader_positions:
+        big = hyperdash_fixture(0, args.trader_positions, 0, BIG_TRADER_ADDRESS)
+        srv.recorded[("hyperdash", BIG_TRADER_ADDRESS)] = [big]
+        cases.insert(1, ("large trader", f"{env['HYPERDASH_BASE']}/trader/{BIG_TRADER_ADDRESS}",
+                         legacy_hyperdash, streaming_hyperdash))
+        print(f"large-trader page {len(big) / 1e6:.1f} MB ({args.trader_positions} positions)")
+    for name, url, legacy, streaming in cases:
+        old = measure(legacy, bot_mod, url, args.threads, args.rounds)
+        new = measure(streaming, bot_mod, url, args.threads, args.rounds)
+        if old["result"] != new["result"]:
+            print(f"  {name}: MISMATCH legacy={old['result']} streaming={new['result']}")
+        for label, m in (("buffered", old), ("streaming", new)):
+            print(f"  {name:12s} {label:9s}  peak {m['peak_mb']:7.1f} MB  p50 {m['p50_s'] * 1000:6.0f}ms  "
+                  f"max {m['max_s'] * 1000:6.0f}ms  ({m['result']} items)")
+    srv.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Throughput benchmark for the poll pipeline against the local fake upstream.
+
+Drives N synthetic wallets through the poll engine (run_poll_cycle -> process_wallet,
+the same path poller_thread uses) for a few cycles and reports cycle time, p50/p99
+per-wallet latency, peak memory, state-write cost and Telegram sends.
+
+    python bench/bench_poller.py --wallets 500 --workers 16 --latency 0.05 --cycles 3
+    python bench/bench_poller.py --wallets 200 --fail-rate 0.05 --env FETCH_MODE=parallel
+"""
+
+import argparse
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.dirname(HERE))
+
+from fake_upstream import FakeUpstream  # noqa: E402
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def bench_wallets(n: int):
+    return [f"0x{i:040x}" for i in range(1, n + 1)]
+
+
+def configure_env(srv: FakeUpstream, workdir: str, args) -> None:
+    """Everything the bot module reads at import time must be set before importing it."""
+    os.environ.update(srv.env())
+    os.environ.update({
+        "POLL_INTERVAL": str(args.interval),
+        "POLL_WORKERS": str(args.workers),
+        "STATE_DB": os.path.join(workdir, "state.db"),
+        "STATE_FILE": os.path.join(workdir, "state.json"),
+        "WALLETS_FILE": os.path.join(workdir, "wallets.json"),
+        "AUTHORIZED_CHATS_FILE": os.path.join(workdir, "chats.json"),
+        "SUBSCRIPTIONS_FILE": os.path.join(workdir, "subscriptions.json"),
+        "HISTORY_DB": os.path.join(workdir, "history.db"),
+        "TELEGRAM_CHAT_INTERVAL": "0",
+        "TELEGRAM_GLOBAL_RPS": "10000",
+        # the benchmark measures the pipeline, not our own throttling
+        "RATE_LIMIT_MAX_WAIT": "0",
+    })
+    for name in ("COINGLASS", "DEBANK", "DEXSCREENER", "HYPERLIQUID", "HYPERDASH"):
+        os.environ.setdefault(f"{name}_RPS", "100000")
+        os.environ.setdefault(f"{name}_BURST", "100000")
+    if not args.cache:
+        # back-to-back benchmark cycles would otherwise be served from the response cache
+        for name in ("COINGLASS", "DEBANK", "DEXSCREENER", "HYPERLIQUID", "HYPERDASH"):
+            os.environ[f"CACHE_TTL_{name}"] = "0"
+    for kv in args.env:
+        k, _, v = kv.partition("=")
+        os.environ[k] = v
+    with open(os.environ["WALLETS_FILE"], "w") as f:
+        json.dump(bench_wallets(args.wallets), f)
+    with open(os.environ["AUTHORIZED_CHATS_FILE"], "w") as f:
+        json.dump(list(range(1, args.chats + 1)), f)
+
+
+def run(args) -> dict:
+    srv = FakeUpstream(latency=args.latency, jitter=args.jitter, fail_rate=args.fail_rate,
+                       throttle_rate=args.throttle_rate, change_rate=args.change_rate,
+                       tokens=args.tokens, positions=args.positions).start()
+    workdir = tempfile.mkdtemp(prefix="signalbot-bench-")
+    configure_env(srv, workdir, args)
+
+    tracemalloc.start()
+    t_import = time.perf_counter()
+    import hyperdash_telegram_bot_mtproto_coinglass as bot_mod
+    t_import = time.perf_counter() - t_import
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+    if not args.verbose:
+        logging.getLogger("signal_bot").setLevel(logging.WARNING)
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    durations = []
+    # batch detection only fetches per wallet; events are detected once per cycle
+    task = "_fetch_wallet_task" if bot_mod.DETECT_MODE == "batch" else "process_wallet"
+    original = getattr(bot_mod, task)
+
+    def timed_task(addr):
+        t0 = time.perf_counter()
+        try:
+            return original(addr)
+        finally:
+            durations.append(time.perf_counter() - t0)
+
+    setattr(bot_mod, task, timed_task)
+    bot_mod.app.outbound.start()
+
+    wallets = bot_mod.load_shard_wallets()
+    pool = ThreadPoolExecutor(max_workers=bot_mod.POLL_WORKERS)
+    cycles = []
+    flushes = []
+    for i in range(args.cycles):
+        durations.clear()
+        t0 = time.perf_counter()
+        bot_mod.prefetch_hyperliquid(wallets)
+        stats = bot_mod.run_poll_cycle(pool, wallets, args.deadline or 1e9)
+        cycle_s = time.perf_counter() - t0
+        f0 = time.perf_counter()
+        rows = bot_mod.app.state_store.flush()
+        flushes.append((time.perf_counter() - f0, rows))
+        cycles.append({
+            "cycle": i + 1,
+            "seconds": round(cycle_s, 3),
+            "wallets_per_s": round(len(wallets) / cycle_s, 1) if cycle_s else None,
+            "p50_wallet_s": round(percentile(durations, 0.5), 4),
+            "p99_wallet_s": round(percentile(durations, 0.99), 4),
+            "events": stats.get("events"),
+            "done": stats["done"],
+            "cancelled": stats["cancelled"],
+        })
+    # give the sender a moment to drain what the last cycle queued
+    drain_until = time.time() + 5
+    while bot_mod.app.outbound.pending() and time.time() < drain_until:
+        time.sleep(0.05)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    pool.shutdown(wait=True)
+    srv.stop()
+    return {
+        "config": {k: v for k, v in vars(args).items() if k != "json"},
+        "import_s": round(t_import, 3),
+        "shard_wallets": len(wallets),
+        "cycles": cycles,
+        "state_flush": [{"seconds": round(s, 4), "rows": r} for s, r in flushes],
+        "state_db_bytes": os.path.getsize(os.environ["STATE_DB"]),
+        "telegram_messages": len(srv.sent_messages),
+        "upstream_requests": dict(srv.counts),
+        "peak_traced_mb": round(peak / 1e6, 1),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--wallets", type=int, default=200)
+    ap.add_argument("--workers", type=int, default=8)
+    ap.add_argument("--cycles", type=int, default=3)
+    ap.add_argument("--interval", type=int, default=300)
+    ap.add_argument("--deadline", type=float, default=0, help="per-cycle deadline (0 = wait for all)")
+    ap.add_argument("--chats", type=int, default=2)
+    ap.add_argument("--latency", type=float, default=0.02)
+    ap.add_argument("--jitter", type=float, default=0.02)
+    ap.add_argument("--fail-rate", type=float, default=0.0)
+    ap.add_argument("--throttle-rate", type=float, default=0.0)
+    ap.add_argument("--change-rate", type=float, default=0.1)
+    ap.add_argument("--tokens", type=int, default=8)
+    ap.add_argument("--positions", type=int, default=3)
+    ap.add_argument("--cache", action="store_true", help="keep the response cache enabled between cycles")
+    ap.add_argument("--env", action="append", default=[], help="extra KEY=VALUE for the bot")
+    ap.add_argument("--json", action="store_true", help="print the raw JSON report")
+    ap.add_argument("--verbose", action="store_true", help="keep the bot's INFO logging (signals, cycles)")
+    args = ap.parse_args()
+
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"wallets={args.wallets} workers={args.workers} latency={args.latency}s fail={args.fail_rate} "
+          f"(import {report['import_s']}s)")
+    for c in report["cycles"]:
+        print(f"  cycle {c['cycle']}: {c['seconds']:.2f}s  {c['wallets_per_s']} wallets/s  "
+              f"p50 {c['p50_wallet_s'] * 1000:.0f}ms  p99 {c['p99_wallet_s'] * 1000:.0f}ms  "
+              f"events {c['events']}  done {c['done']}  cancelled {c['cancelled']}")
+    for i, f in enumerate(report["state_flush"], 1):
+        print(f"  state flush {i}: {f['rows']} rows in {f['seconds'] * 1000:.1f}ms")
+    print(f"  state db: {report['state_db_bytes'] / 1024:.0f} KB, telegram messages: {report['telegram_messages']}")
+    print(f"  upstream requests: {report['upstream_requests']}")
+    print(f"  peak traced memory: {report['peak_traced_mb']} MB, max RSS: {report['max_rss_mb']} MB")
+
+
+if __name__ == "__main__":
+    main()
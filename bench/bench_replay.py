@@ -0,0 +1,224 @@
+"""
+Replay recorded snapshot sequences through compare_and_generate_events, both as a
+detection benchmark and as a regression check.
+
+A recording is JSONL, one snapshot per line in poll order:
+
+    {"wallet": "0x...", "snapshot": {"tokens": {...}, "positions": [...], "usd_total": ..., "source": ...},
+     "events": ["🟢 BUY detected: ...", ...]}      # optional expected output
+
+    python bench/bench_replay.py --generate 200 --steps 50 --out /tmp/replay.jsonl   # synthetic recording
+    python bench/bench_replay.py /tmp/replay.jsonl --record                          # store current output as expected
+    python bench/bench_replay.py /tmp/replay.jsonl                                   # replay, diff against expected
+    python bench/bench_replay.py /tmp/replay.jsonl --batch                           # batch vs per-wallet detection
+
+With --batch, consecutive lines are grouped into poll cycles (a cycle ends where a
+wallet repeats) and each cycle is detected both per wallet and with diff_events_batch.
+Detection is timed without message formatting, which is the same for both; the first
+cycle diffs against empty state and is reported separately. Before the recording, a fixed
+set of edge cases (NaN and inf balances and token values, duplicate position keys) is
+checked the same way.
+
+Exits with status 1 if any replayed line's events differ from the recorded ones, or
+with --batch, if the two detection paths disagree.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.dirname(HERE))
+
+from fake_upstream import SyntheticWallet  # noqa: E402
+
+
+def generate(path: str, wallets: int, steps: int, tokens: int, positions: int, change_rate: float):
+    ws = [(f"0x{i:040x}", SyntheticWallet(f"0x{i:040x}", tokens, positions)) for i in range(1, wallets + 1)]
+    with open(path, "w", encoding="utf-8") as f:
+        for _ in range(steps):
+            for addr, w in ws:
+                w.step(change_rate)
+                toks, pos = w.copy()
+                snap = {
+                    "usd_total": round(sum(toks.values()) + sum(s for _, s in pos.values()), 2),
+                    "tokens": toks,
+                    "positions": [{"symbol": s, "size_usd": size, "side": side} for s, (side, size) in pos.items()],
+                    "source": "coinglass",
+                }
+                f.write(json.dumps({"wallet": addr, "snapshot": snap}, ensure_ascii=False) + "\n")
+
+
+def load_bot():
+    workdir = tempfile.mkdtemp(prefix="signalbot-replay-")
+    os.environ.setdefault("BOT_TOKEN", "123456:replay")
+    os.environ["STATE_DB"] = os.path.join(workdir, "state.db")
+    os.environ["STATE_FILE"] = os.path.join(workdir, "state.json")
+    os.environ["WALLETS_FILE"] = os.path.join(workdir, "wallets.json")
+    os.environ["AUTHORIZED_CHATS_FILE"] = os.path.join(workdir, "chats.json")
+    os.environ["SUBSCRIPTIONS_FILE"] = os.path.join(workdir, "subscriptions.json")
+    os.environ["HISTORY_DB"] = os.path.join(workdir, "history.db")
+    import hyperdash_telegram_bot_mtproto_coinglass as bot_mod
+    return bot_mod
+
+
+def replay(path: str, record: bool, show: int) -> int:
+    bot_mod = load_bot()
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    timings = []
+    mismatches = 0
+    total_events = 0
+    for i, rec in enumerate(lines):
+        addr, snap = rec["wallet"], rec["snapshot"]
+        t0 = time.perf_counter()
+        events = bot_mod.compare_and_generate_events(addr, snap)
+        timings.append(time.perf_counter() - t0)
+        bot_mod.set_wallet_state(addr, bot_mod.build_wallet_state(snap))
+        total_events += len(events)
+        if record:
+            rec["events"] = events
+        elif "events" in rec and rec["events"] != events:
+            mismatches += 1
+            if mismatches <= show:
+                print(f"line {i + 1} ({addr}) differs:\n  expected: {rec['events']}\n  got:      {events}")
+    if record:
+        with open(path, "w", encoding="utf-8") as f:
+            for rec in lines:
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    timings.sort()
+    n = len(timings) or 1
+    total = sum(timings)
+    print(f"{len(lines)} snapshots, {total_events} events, {total * 1000:.1f}ms in detection "
+          f"({len(lines) / total if total else 0:.0f} snapshots/s, p50 {timings[n // 2] * 1e6:.0f}µs, "
+          f"p99 {timings[min(n - 1, int(n * 0.99))] * 1e6:.0f}µs)")
+    if record:
+        print(f"recorded expected events into {path}")
+    elif mismatches:
+        print(f"{mismatches} snapshot(s) produced different events")
+    return 1 if mismatches else 0
+
+
+def cycles(lines):
+    """Split poll-ordered lines into cycles: a cycle ends where a wallet repeats."""
+    cycle, seen = [], set()
+    for rec in lines:
+        if rec["wallet"] in seen:
+            yield cycle
+            cycle, seen = [], set()
+        cycle.append(rec)
+        seen.add(rec["wallet"])
+    if cycle:
+        yield cycle
+
+
+NAN, INF = float("nan"), float("inf")
+EDGE_CASES = [
+    # (prev, now) raw snapshots
+    ({"usd_total": NAN}, {"usd_total": NAN}),
+    ({"usd_total": INF}, {"usd_total": INF}),
+    ({"usd_total": 1}, {"usd_total": NAN}),
+    ({"usd_total": NAN}, {"usd_total": 1}),
+    ({"usd_total": 1}, {"usd_total": INF}),
+    ({"usd_total": INF}, {"usd_total": 1}),
+    ({"usd_total": -INF}, {"usd_total": INF}),
+    ({"tokens": {"A": NAN, "B": INF, "C": 5}}, {"tokens": {"A": NAN, "B": INF, "C": NAN}}),
+    ({"tokens": {"A": 5}}, {"tokens": {"A": INF, "D": NAN, "E": INF}}),
+    ({"positions": [{"symbol": "BTC", "side": "long", "size_usd": NAN}]},
+     {"positions": [{"symbol": "BTC", "side": "long", "size_usd": INF}, {"symbol": "ETH", "side": "short", "size_usd": NAN}]}),
+    ({"positions": [{"symbol": "BTC", "side": "long", "size_usd": 900}, {"symbol": "BTC", "side": "long", "size_usd": 10}]},
+     {"positions": [{"symbol": "BTC", "side": "long", "size_usd": 20}, {"symbol": "BTC", "side": "long", "size_usd": 950}]}),
+]
+
+
+def check_edge_cases(bot_mod, show: int) -> int:
+    """Batch vs per-wallet detection on EDGE_CASES; returns the number that differ."""
+    pairs = [(bot_mod.normalize_snapshot(p), bot_mod.normalize_snapshot(n)) for p, n in EDGE_CASES]
+    expected = [[e.text("0x0") for e in bot_mod.diff_events(p, n)] for p, n in pairs]
+    got = [[e.text("0x0") for e in es] for es in bot_mod.diff_events_batch(pairs)]
+    mismatches = 0
+    for case, exp, events in zip(EDGE_CASES, expected, got):
+        if exp != events:
+            mismatches += 1
+            if mismatches <= show:
+                print(f"edge case {case} differs:\n  per wallet: {exp}\n  batch:      {events}")
+    print(f"{len(EDGE_CASES)} edge cases, {mismatches} differ")
+    return mismatches
+
+
+def replay_batch(path: str, show: int) -> int:
+    bot_mod = load_bot()
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    t_wallet = [0.0, 0.0]       # first cycle, later cycles
+    t_batch = [0.0, 0.0]
+    mismatches = check_edge_cases(bot_mod, show)
+    total_events = 0
+    n_cycles = 0
+    for cycle in cycles(lines):
+        n_cycles += 1
+        addrs = [rec["wallet"] for rec in cycle]
+        nows = [bot_mod.normalize_snapshot(rec["snapshot"]) for rec in cycle]
+        prevs = [bot_mod.get_wallet_snapshot(a) for a in addrs]
+        t0 = time.perf_counter()
+        per_wallet = [bot_mod.diff_events(p, n) for p, n in zip(prevs, nows)]
+        t1 = time.perf_counter()
+        batch = bot_mod.diff_events_batch(list(zip(prevs, nows)))
+        t2 = time.perf_counter()
+        steady = n_cycles > 1
+        t_wallet[steady] += t1 - t0
+        t_batch[steady] += t2 - t1
+        expected = [[e.text(a) for e in es] for a, es in zip(addrs, per_wallet)]
+        got = [[e.text(a) for e in es] for a, es in zip(addrs, batch)]
+        for a, exp, events in zip(addrs, expected, got):
+            total_events += len(exp)
+            if exp != events:
+                mismatches += 1
+                if mismatches <= show:
+                    print(f"cycle {n_cycles} ({a}) differs:\n  per wallet: {exp}\n  batch:      {events}")
+        for a, n in zip(addrs, nows):
+            bot_mod.set_wallet_state(a, n)
+    backend = "numpy" if bot_mod._numpy() is not None else "pure Python fallback"
+    print(f"{len(lines)} snapshots in {n_cycles} cycles, {total_events} events, batch detection with {backend}")
+    for name, i in (("first cycle", 0), ("later cycles", 1)):
+        if t_batch[i]:
+            print(f"  {name}: per wallet {t_wallet[i] * 1000:.1f}ms, batch {t_batch[i] * 1000:.1f}ms "
+                  f"({t_wallet[i] / t_batch[i]:.2f}x)")
+    if mismatches:
+        print(f"{mismatches} snapshot(s) produced different events in batch mode")
+    return 1 if mismatches else 0
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("recording", nargs="?")
+    ap.add_argument("--record", action="store_true", help="write current output into the recording as expected events")
+    ap.add_argument("--batch", action="store_true", help="compare batch detection against the per-wallet path")
+    ap.add_argument("--show", type=int, default=5, help="mismatches to print")
+    ap.add_argument("--generate", type=int, metavar="WALLETS", help="write a synthetic recording instead of replaying")
+    ap.add_argument("--steps", type=int, default=20)
+    ap.add_argument("--tokens", type=int, default=8)
+    ap.add_argument("--positions", type=int, default=3)
+    ap.add_argument("--change-rate", type=float, default=0.2)
+    ap.add_argument("--out")
+    args = ap.parse_args()
+    if args.generate:
+        out = args.out or args.recording
+        if not out:
+            ap.error("--generate needs --out")
+        generate(out, args.generate, args.steps, args.tokens, args.positions, args.change_rate)
+        print(f"wrote {args.generate * args.steps} snapshots to {out}")
+        return 0
+    if not args.recording:
+        ap.error("recording path required")
+    if args.batch:
+        return replay_batch(args.recording, args.show)
+    return replay(args.recording, args.record, args.show)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""
+Multi-process scaling check for sharded polling.
+
+For each shard count K, starts K bench_poller.py processes at once with
+SHARD_COUNT=K and SHARD_INDEX=0..K-1 on one shared state database, and reports how
+the wallets were split and the aggregate throughput (all wallets / slowest shard's
+cycle time). Each process runs its own fake upstream, so the numbers show how far
+the bot itself scales once it is no longer confined to one interpreter.
+
+    python bench/bench_shards.py --wallets 2000 --shards 1 2 4
+    python bench/bench_shards.py --wallets 1000 --shards 1 4 --latency 0 -- --tokens 40
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_shards(k: int, args, extra) -> dict:
+    workdir = tempfile.mkdtemp(prefix=f"signalbot-shards{k}-")
+    state_db = os.path.join(workdir, "state.db")
+    procs = []
+    t0 = time.perf_counter()
+    for i in range(k):
+        cmd = [sys.executable, os.path.join(HERE, "bench_poller.py"), "--json",
+               "--wallets", str(args.wallets), "--workers", str(args.workers),
+               "--cycles", str(args.cycles), "--latency", str(args.latency),
+               "--env", f"SHARD_COUNT={k}", "--env", f"SHARD_INDEX={i}",
+               "--env", "BOT_ROLE=poller", "--env", f"STATE_DB={state_db}", *extra]
+        procs.append(subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True))
+    reports = []
+    for p in procs:
+        out, _ = p.communicate()
+        if p.returncode:
+            raise SystemExit(f"shard process exited with {p.returncode}")
+        reports.append(json.loads(out))
+    wall = time.perf_counter() - t0
+    # compare steady-state cycles: the slowest shard bounds the aggregate
+    last = [r["cycles"][-1] for r in reports]
+    slowest = max(c["seconds"] for c in last)
+    polled = sum(r["shard_wallets"] for r in reports)
+    return {
+        "shards": k,
+        "split": [r["shard_wallets"] for r in reports],
+        "polled": polled,
+        "cycle_s": slowest,
+        "wallets_per_s": round(polled / slowest, 1) if slowest else None,
+        "wall_s": round(wall, 2),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--wallets", type=int, default=1000)
+    ap.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    ap.add_argument("--workers", type=int, default=8)
+    ap.add_argument("--cycles", type=int, default=2)
+    ap.add_argument("--latency", type=float, default=0.0)
+    ap.add_argument("--json", action="store_true", help="print the raw JSON report")
+    args, extra = ap.parse_known_args()
+    extra = [a for a in extra if a != "--"]
+
+    results = [run_shards(k, args, extra) for k in args.shards]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    base = results[0]["wallets_per_s"] or 0
+    print(f"wallets={args.wallets} workers/process={args.workers} latency={args.latency}s")
+    for r in results:
+        speedup = f"{r['wallets_per_s'] / base:.2f}x" if base and r["wallets_per_s"] else "-"
+        ok = "" if r["polled"] == args.wallets else f"  (polled {r['polled']}, expected {args.wallets}!)"
+        print(f"  {r['shards']} shard(s): split {r['split']}  cycle {r['cycle_s']:.2f}s  "
+              f"{r['wallets_per_s']} wallets/s  ({speedup}){ok}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Startup benchmark.
+
+Measures, each in fresh interpreters:
+- importing the bot module (no BOT_TOKEN, empty working directory), and which
+  `app` components that built (should be none);
+- importing it and reaching the detection code (diff of two snapshots);
+- for `python main.py` against the local fake upstream: time until the first
+  upstream fetch and until the first Telegram getUpdates, on a cold start and on
+  a restart with persisted state.
+
+    python bench/bench_startup.py --runs 5 --wallets 200
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+
+from fake_upstream import FakeUpstream  # noqa: E402
+
+IMPORT_SNIPPET = """
+import time
+t0 = time.perf_counter()
+import hyperdash_telegram_bot_mtproto_coinglass as m
+t1 = time.perf_counter()
+a = m.normalize_snapshot({"usd_total": 100, "tokens": {"ETH": 100}})
+b = m.normalize_snapshot({"usd_total": 300, "tokens": {"ETH": 300}})
+m.diff_snapshots("0x0", a, b)
+t2 = time.perf_counter()
+import json, os
+print(json.dumps({"import": t1 - t0, "detect": t2 - t0, "built": m.app.built(), "files": os.listdir(".")}))
+"""
+
+
+def clean_env() -> dict:
+    env = {k: v for k, v in os.environ.items() if k != "BOT_TOKEN"}
+    env["PYTHONPATH"] = ROOT
+    return env
+
+
+def measure_import(runs: int) -> dict:
+    samples = []
+    for _ in range(runs):
+        workdir = tempfile.mkdtemp(prefix="signalbot-import-")
+        out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=workdir, env=clean_env(),
+                             capture_output=True, text=True, check=True).stdout
+        samples.append(json.loads(out))
+    return {
+        "import_ms": round(statistics.median(s["import"] for s in samples) * 1000, 1),
+        "to_detection_ms": round(statistics.median(s["detect"] for s in samples) * 1000, 1),
+        "built": samples[-1]["built"],
+        "files_created": samples[-1]["files"],
+    }
+
+
+def wait_for(cond, timeout: float) -> bool:
+    until = time.time() + timeout
+    while time.time() < until:
+        if cond():
+            return True
+        time.sleep(0.005)
+    return False
+
+
+def measure_start(srv: FakeUpstream, workdir: str, timeout: float) -> dict:
+    """Run main.py until it has fetched and polled Telegram once; times from spawn."""
+    env = clean_env()
+    env.update(srv.env())
+    env.update({"POLL_INTERVAL": "3600", "RATE_LIMIT_MAX_WAIT": "0"})
+    fetched0 = sum(v for k, v in srv.counts.items() if k != "telegram")
+    updates0 = len(srv.update_polls)
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, os.path.join(ROOT, "main.py")], cwd=workdir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    res = {}
+    try:
+        if wait_for(lambda: sum(v for k, v in srv.counts.items() if k != "telegram") > fetched0, timeout):
+            res["first_fetch_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        if wait_for(lambda: len(srv.update_polls) > updates0, timeout):
+            res["first_get_updates_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        # let the first cycle finish so the restart has state to start from
+        wait_for(lambda: os.path.exists(os.path.join(workdir, "state.db")), timeout)
+        time.sleep(1.0)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+    return res
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--wallets", type=int, default=50)
+    ap.add_argument("--timeout", type=float, default=30)
+    ap.add_argument("--json", action="store_true", help="print the raw JSON report")
+    args = ap.parse_args()
+
+    report = {"import": measure_import(args.runs)}
+    srv = FakeUpstream().start()
+    workdir = tempfile.mkdtemp(prefix="signalbot-startup-")
+    with open(os.path.join(workdir, "wallets.json"), "w") as f:
+        json.dump([f"0x{i:040x}" for i in range(1, args.wallets + 1)], f)
+    with open(os.path.join(workdir, "authorized_chats.json"), "w") as f:
+        json.dump([1], f)
+    report["cold_start"] = measure_start(srv, workdir, args.timeout)
+    report["restart"] = measure_start(srv, workdir, args.timeout)
+    srv.stop()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    imp = report["import"]
+    print(f"import: {imp['import_ms']}ms (to first diff {imp['to_detection_ms']}ms), "
+          f"components built: {imp['built'] or 'none'}, files created: {imp['files_created'] or 'none'}")
+    for name in ("cold_start", "restart"):
+        r = report[name]
+        fetch, updates = r.get("first_fetch_ms"), r.get("first_get_updates_ms")
+        print(f"{name}: first upstream fetch {f'{fetch}ms' if fetch else 'timed out'}, "
+              f"first getUpdates {f'{updates}ms' if updates else 'timed out'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""
+Local stand-in for the upstream APIs the bot talks to (CoinGlass, DeBank, DexScreener,
+HyperDash, the Hyperliquid info API and the Telegram Bot API), for benchmarks and offline runs.
+
+Every wallet gets deterministic synthetic holdings that drift a little on each request,
+so repeated polls produce a realistic trickle of BUY/SELL/OPEN/CLOSE events. Responses
+can also be served from a recording (JSONL lines of {"source", "address", "body"}),
+replayed in order per (source, address); the CoinGlass position endpoint uses the
+source name "coinglass_position".
+
+Latency, error rate and 429 rate are configurable per source:
+
+    srv = FakeUpstream(latency=0.05, jitter=0.02, fail_rate=0.01).start()
+    os.environ.update(srv.env())     # before importing the bot module
+    ...
+    srv.stop()
+
+Run standalone with `python bench/fake_upstream.py --port 8099`.
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import socket
+import sys
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+SOURCES = ("coinglass", "debank", "dexscreener", "hyperdash", "hyperliquid", "telegram")
+SYMBOLS = ["BTC", "ETH", "SOL", "ARB", "OP", "DOGE", "PEPE", "LINK", "AVAX", "HYPE", "WIF", "SUI"]
+
+
+class SyntheticWallet:
+    """Holdings for one wallet; step() applies a small random walk."""
+
+    def __init__(self, address: str, tokens: int, positions: int):
+        seed = int(hashlib.sha1(address.encode()).hexdigest()[:8], 16)
+        self.rng = random.Random(seed)
+        self.tokens = {sym: round(self.rng.uniform(50, 5000), 2) for sym in self.rng.sample(SYMBOLS, min(tokens, len(SYMBOLS)))}
+        for i in range(max(0, tokens - len(SYMBOLS))):
+            self.tokens[f"TKN{i}"] = round(self.rng.uniform(50, 5000), 2)
+        self.positions = {}
+        for sym in self.rng.sample(SYMBOLS, min(positions, len(SYMBOLS))):
+            self.positions[sym] = (self.rng.choice(["long", "short"]), round(self.rng.uniform(100, 50000), 2))
+        self.lock = threading.Lock()
+
+    def step(self, change_rate: float):
+        with self.lock:
+            rng = self.rng
+            for sym in list(self.tokens):
+                if rng.random() < change_rate:
+                    self.tokens[sym] = round(max(0.0, self.tokens[sym] * rng.uniform(0.8, 1.25)), 2)
+            if rng.random() < change_rate / 4:
+                self.tokens[rng.choice(SYMBOLS)] = round(rng.uniform(50, 2000), 2)
+            for sym in list(self.positions):
+                if rng.random() < change_rate / 4:
+                    del self.positions[sym]
+                elif rng.random() < change_rate:
+                    side, size = self.positions[sym]
+                    self.positions[sym] = (side, round(size * rng.uniform(0.9, 1.2), 2))
+            if rng.random() < change_rate / 4:
+                self.positions[rng.choice(SYMBOLS)] = (rng.choice(["long", "short"]), round(rng.uniform(100, 20000), 2))
+
+    def copy(self) -> Tuple[Dict[str, float], Dict[str, Tuple[str, float]]]:
+        with self.lock:
+            return dict(self.tokens), dict(self.positions)
+
+
+class _QuietServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # streaming clients hang up once they have what they need
+        if not isinstance(sys.exc_info()[1], (ConnectionError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+class FakeUpstream:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, jitter: float = 0.0,
+                 fail_rate: float = 0.0, throttle_rate: float = 0.0, change_rate: float = 0.1,
+                 tokens: int = 8, positions: int = 3, hyperdash_padding: int = 0,
+                 per_source: Optional[Dict[str, Dict[str, float]]] = None,
+                 recording: Optional[str] = None, seed: int = 1):
+        """
+        latency/jitter are seconds, *_rate are probabilities per request. per_source overrides
+        any of latency/jitter/fail_rate/throttle_rate for one source, e.g. {"debank": {"latency": 2}}.
+        hyperdash_padding adds that many bytes of filler markup around __NEXT_DATA__.
+        """
+        self.defaults = {"latency": latency, "jitter": jitter, "fail_rate": fail_rate, "throttle_rate": throttle_rate}
+        self.per_source = per_source or {}
+        self.change_rate = change_rate
+        self.n_tokens = tokens
+        self.n_positions = positions
+        self.hyperdash_padding = hyperdash_padding
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.wallets: Dict[str, SyntheticWallet] = {}
+        self.wallets_lock = threading.Lock()
+        self.counts: Dict[str, int] = defaultdict(int)
+        self.sent_messages: List[Dict[str, Any]] = []
+        self.update_polls: List[float] = []   # time of each Telegram getUpdates
+        self.recorded: Dict[Tuple[str, str], List[Any]] = defaultdict(list)
+        if recording:
+            with open(recording, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        rec = json.loads(line)
+                        self.recorded[(rec["source"], rec["address"].lower())].append(rec["body"])
+        self._server = _QuietServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    # ---- lifecycle ----
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeUpstream":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-upstream", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def env(self) -> Dict[str, str]:
+        """Environment overrides that point the bot at this server."""
+        b = self.base_url
+        return {
+            "DEXSCREENER_API": f"{b}/dexscreener/latest/dex/search?q=",
+            "DEBANK_API": f"{b}/debank/user/total_balance?id=",
+            "COINGLASS_BASE": f"{b}/coinglass",
+            "HYPERDASH_BASE": f"{b}/hyperdash",
+            "HYPERLIQUID_API": f"{b}/hyperliquid/info",
+            "TELEGRAM_API_URL": f"{b}/telegram/bot",
+            "COINGLASS_API_KEY": "bench",
+            "BOT_TOKEN": "123456:bench",
+        }
+
+    # ---- synthetic data ----
+    def wallet(self, address: str) -> SyntheticWallet:
+        address = address.lower()
+        with self.wallets_lock:
+            w = self.wallets.get(address)
+            if w is None:
+                w = self.wallets[address] = SyntheticWallet(address, self.n_tokens, self.n_positions)
+            return w
+
+    def _evolve(self, address: str) -> Tuple[Dict[str, float], Dict[str, Tuple[str, float]]]:
+        w = self.wallet(address)
+        w.step(self.change_rate)
+        return w.copy()
+
+    def body_for(self, source: str, address: str, path: str = "") -> Any:
+        # the CoinGlass position endpoint is recorded as "coinglass_position"
+        key = "coinglass_position" if source == "coinglass" and path.endswith("/position") else source
+        recorded = self.recorded.get((key, address.lower()))
+        if recorded:
+            # replay in order, then keep serving the last response
+            return recorded.pop(0) if len(recorded) > 1 else recorded[0]
+        if source == "coinglass" and path.endswith("/position"):
+            _, positions = self.wallet(address).copy()
+            return {"code": "0", "data": {"list": [
+                {"symbol": sym, "position_value_usd": size, "position_size": 1 if side == "long" else -1}
+                for sym, (side, size) in positions.items()
+            ]}}
+        tokens, positions = self._evolve(address)
+        if source == "coinglass":
+            return {"code": "0", "data": [{"symbol": sym, "balance_usd": v} for sym, v in tokens.items()]}
+        if source == "debank":
+            return {"data": {"total_usd_value": round(sum(tokens.values()), 2), "wallet_asset_list": [
+                {"symbol": sym, "price": 1.0, "amount": v} for sym, v in tokens.items()
+            ]}}
+        if source == "dexscreener":
+            return {"pairs": [{"baseToken": {"symbol": sym}, "liquidity": {"usd": v}} for sym, v in tokens.items()]}
+        if source == "hyperliquid":
+            return {"assetPositions": [
+                {"type": "oneWay", "position": {"coin": sym, "szi": str(1 if side == "long" else -1),
+                                                "positionValue": str(size)}}
+                for sym, (side, size) in positions.items()
+            ], "marginSummary": {"accountValue": str(round(sum(s for _, s in positions.values()), 2))}}
+        if source == "hyperdash":
+            data = {"props": {"pageProps": {"trader": {"positions": [
+                {"symbol": sym, "notional": size, "side": side} for sym, (side, size) in positions.items()
+            ]}}}}
+            return hyperdash_page(data, self.hyperdash_padding)
+        raise KeyError(source)
+
+    # ---- HTTP ----
+    def _conf(self, source: str, key: str) -> float:
+        return self.per_source.get(source, {}).get(key, self.defaults[key])
+
+    def _roll(self) -> float:
+        with self.rng_lock:
+            return self.rng.random()
+
+    def _handler_class(self):
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                # headers and body go out in separate writes; avoid Nagle/delayed-ACK stalls
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: Any, content_type: str = "application/json", headers=None):
+                raw = body if isinstance(body, bytes) else (body if isinstance(body, str) else json.dumps(body)).encode()
+                headers = dict(headers or {})
+                if status == 200:
+                    etag = '"%s"' % hashlib.sha1(raw).hexdigest()[:16]
+                    headers["ETag"] = etag
+                    if self.headers.get("If-None-Match") == etag:
+                        status, raw = 304, b""
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(raw)))
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def _route(self, method: str):
+                url = urlparse(self.path)
+                parts = url.path.strip("/").split("/")
+                source = parts[0] if parts else ""
+                if source not in SOURCES:
+                    return self._send(404, {"error": "unknown source"})
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = self.rfile.read(length) if length else b""
+                upstream.counts[source] += 1
+                delay = upstream._conf(source, "latency") + upstream._conf(source, "jitter") * upstream._roll()
+                if delay > 0:
+                    time.sleep(delay)
+                if source != "telegram":
+                    if upstream._roll() < upstream._conf(source, "throttle_rate"):
+                        return self._send(429, {"error": "rate limited"}, headers={"Retry-After": "1"})
+                    if upstream._roll() < upstream._conf(source, "fail_rate"):
+                        return self._send(503, {"error": "unavailable"})
+                qs = parse_qs(url.query)
+                if source == "telegram":
+                    return self._telegram(parts, payload)
+                if source == "hyperliquid":
+                    req = json.loads(payload or b"{}")
+                    return self._send(200, upstream.body_for(source, req.get("user", "")))
+                if source == "hyperdash":
+                    return self._send(200, upstream.body_for(source, parts[-1]), "text/html; charset=utf-8")
+                address = (qs.get("q") or qs.get("id") or qs.get("wallet_address") or qs.get("user") or [""])[0]
+                return self._send(200, upstream.body_for(source, address, url.path))
+
+            def _telegram(self, parts: List[str], payload: bytes):
+                method = parts[-1]
+                ctype = self.headers.get("Content-Type", "")
+                if "json" in ctype and payload:
+                    data = json.loads(payload)
+                else:
+                    data = {k: v[0] for k, v in parse_qs(payload.decode("utf-8", "replace")).items()}
+                if method == "sendMessage":
+                    upstream.sent_messages.append(data)
+                    chat_id = int(data.get("chat_id") or 0)
+                    return self._send(200, {"ok": True, "result": {
+                        "message_id": len(upstream.sent_messages), "date": int(time.time()),
+                        "chat": {"id": chat_id, "type": "private"}, "text": data.get("text", ""),
+                    }})
+                if method == "getMe":
+                    return self._send(200, {"ok": True, "result": {"id": 123456, "is_bot": True, "first_name": "bench", "username": "bench_bot"}})
+                if method == "getUpdates":
+                    upstream.update_polls.append(time.time())
+                    return self._send(200, {"ok": True, "result": []})
+                return self._send(200, {"ok": True, "result": True})
+
+            def do_GET(self):
+                self._route("GET")
+
+            def do_POST(self):
+                self._route("POST")
+
+        return Handler
+
+
+def hyperdash_page(data: Dict[str, Any], padding: int = 0) -> str:
+    """A trader page shaped like HyperDash's: filler markup plus the __NEXT_DATA__ script."""
+    filler = ("<div class=\"row\">" + "x" * 80 + "</div>\n") * (padding // 96 + 1) if padding else ""
+    return (
+        "<!DOCTYPE html><html><head><title>trader</title></head><body>\n"
+        + filler[: padding // 2]
+        + '<script id="__NEXT_DATA__" type="application/json">' + json.dumps(data) + "</script>\n"
+        + filler[padding // 2: padding]
+        + "</body></html>"
+    )
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8099)
+    ap.add_argument("--latency", type=float, default=0.05)
+    ap.add_argument("--jitter", type=float, default=0.05)
+    ap.add_argument("--fail-rate", type=float, default=0.0)
+    ap.add_argument("--throttle-rate", type=float, default=0.0)
+    ap.add_argument("--recording", help="JSONL of recorded responses to replay")
+    args = ap.parse_args()
+    srv = FakeUpstream(args.host, args.port, args.latency, args.jitter, args.fail_rate, args.throttle_rate,
+                       recording=args.recording).start()
+    print("Fake upstream on", srv.base_url)
+    for k, v in srv.env().items():
+        print(f"export {k}='{v}'")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        srv.stop()
+
+
+if __name__ == "__main__":
+    main()
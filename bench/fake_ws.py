@@ -0,0 +1,200 @@
+"""
+Minimal stdlib WebSocket server mimicking the Hyperliquid `userFills` stream, for
+exercising the bot's PositionStream offline.
+
+    ws = FakeWs().start()
+    os.environ["HYPERLIQUID_WS_URL"] = ws.url
+    ws.push_fill("0x...")         # broadcast a fill to connections subscribed to that user
+    ws.drop_connections()         # simulate a server-side disconnect
+
+Only what the bot uses is implemented: the RFC 6455 handshake, masked client text
+frames, ping/pong and close. No extensions, no fragmentation.
+"""
+
+import base64
+import hashlib
+import json
+import socket
+import socketserver
+import struct
+import threading
+import time
+from typing import Dict, List, Optional, Set
+
+GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def _encode_frame(payload: bytes, opcode: int = 0x1) -> bytes:
+    n = len(payload)
+    if n < 126:
+        head = struct.pack("!BB", 0x80 | opcode, n)
+    elif n < 1 << 16:
+        head = struct.pack("!BBH", 0x80 | opcode, 126, n)
+    else:
+        head = struct.pack("!BBQ", 0x80 | opcode, 127, n)
+    return head + payload
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = b""
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("closed")
+        buf += chunk
+    return buf
+
+
+def _read_frame(sock: socket.socket):
+    b1, b2 = _recv_exact(sock, 2)
+    opcode = b1 & 0x0F
+    n = b2 & 0x7F
+    if n == 126:
+        n = struct.unpack("!H", _recv_exact(sock, 2))[0]
+    elif n == 127:
+        n = struct.unpack("!Q", _recv_exact(sock, 8))[0]
+    mask = _recv_exact(sock, 4) if b2 & 0x80 else None
+    data = _recv_exact(sock, n)
+    if mask:
+        data = bytes(c ^ mask[i % 4] for i, c in enumerate(data))
+    return opcode, data
+
+
+class _Conn:
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.users: Set[str] = set()
+        self.lock = threading.Lock()
+
+    def send_json(self, obj) -> None:
+        with self.lock:
+            self.sock.sendall(_encode_frame(json.dumps(obj).encode()))
+
+
+class FakeWs:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host, self.port = host, port
+        self.conns: List[_Conn] = []
+        self.lock = threading.Lock()
+        self.subscribe_count = 0
+        self.connect_count = 0
+        self.server: Optional[socketserver.ThreadingTCPServer] = None
+
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}/ws"
+
+    def start(self) -> "FakeWs":
+        fake = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                fake._serve(self.request)
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.server = socketserver.ThreadingTCPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.drop_connections()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def subscribed_users(self) -> Set[str]:
+        with self.lock:
+            return set().union(*(c.users for c in self.conns)) if self.conns else set()
+
+    def push_fill(self, user: str, coin: str = "BTC") -> int:
+        """Send a live (non-snapshot) fill to every connection subscribed to `user`."""
+        user = user.lower()
+        msg = {"channel": "userFills", "data": {"user": user, "fills": [
+            {"coin": coin, "px": "1.0", "sz": "1.0", "side": "B", "time": int(time.time() * 1000)}
+        ]}}
+        sent = 0
+        with self.lock:
+            targets = [c for c in self.conns if user in c.users]
+        for c in targets:
+            try:
+                c.send_json(msg)
+                sent += 1
+            except OSError:
+                pass
+        return sent
+
+    def drop_connections(self) -> None:
+        with self.lock:
+            conns, self.conns = self.conns, []
+        for c in conns:
+            try:
+                c.sock.shutdown(socket.SHUT_RDWR)
+                c.sock.close()
+            except OSError:
+                pass
+
+    # ---- protocol ----
+    def _handshake(self, sock: socket.socket) -> bool:
+        raw = b""
+        while b"\r\n\r\n" not in raw:
+            chunk = sock.recv(4096)
+            if not chunk:
+                return False
+            raw += chunk
+        headers: Dict[str, str] = {}
+        for line in raw.decode("latin-1").split("\r\n")[1:]:
+            k, _, v = line.partition(":")
+            headers[k.strip().lower()] = v.strip()
+        key = headers.get("sec-websocket-key")
+        if not key:
+            return False
+        accept = base64.b64encode(hashlib.sha1((key + GUID).encode()).digest()).decode()
+        sock.sendall(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+        return True
+
+    def _serve(self, sock: socket.socket) -> None:
+        if not self._handshake(sock):
+            return
+        conn = _Conn(sock)
+        with self.lock:
+            self.conns.append(conn)
+            self.connect_count += 1
+        try:
+            while True:
+                opcode, data = _read_frame(sock)
+                if opcode == 0x8:
+                    break
+                if opcode == 0x9:
+                    with conn.lock:
+                        sock.sendall(_encode_frame(data, 0xA))
+                    continue
+                if opcode != 0x1:
+                    continue
+                self._on_text(conn, json.loads(data.decode()))
+        except (ConnectionError, OSError, ValueError):
+            pass
+        finally:
+            with self.lock:
+                if conn in self.conns:
+                    self.conns.remove(conn)
+
+    def _on_text(self, conn: _Conn, msg: dict) -> None:
+        method = msg.get("method")
+        if method == "ping":
+            conn.send_json({"channel": "pong"})
+            return
+        sub = msg.get("subscription") or {}
+        user = (sub.get("user") or "").lower()
+        if method == "subscribe":
+            conn.users.add(user)
+            with self.lock:
+                self.subscribe_count += 1
+            conn.send_json({"channel": "subscriptionResponse", "data": msg})
+            # Hyperliquid replays recent fills first, flagged as a snapshot
+            conn.send_json({"channel": "userFills", "data": {"isSnapshot": True, "user": user, "fills": []}})
+        elif method == "unsubscribe":
+            conn.users.discard(user)
+            conn.send_json({"channel": "subscriptionResponse", "data": msg})
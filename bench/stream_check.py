@@ -0,0 +1,125 @@
+"""
+End-to-end check of Hyperliquid position streaming against the local fakes.
+
+Baselines a few wallets, starts PositionStream on FakeWs, then opens a position on a
+fake wallet and pushes a fill: reports how long until the OPEN signal reaches the fake
+Telegram endpoint, then drops the connection and checks that subscriptions come back
+and a second fill is still delivered.
+
+    python bench/stream_check.py --wallets 5
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.dirname(HERE))
+
+from fake_upstream import FakeUpstream  # noqa: E402
+from fake_ws import FakeWs  # noqa: E402
+
+
+def wait_for(cond, timeout: float) -> bool:
+    until = time.time() + timeout
+    while time.time() < until:
+        if cond():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def fill_to_signal(srv: FakeUpstream, ws: FakeWs, addr: str, symbol: str, timeout: float) -> float:
+    """Open `symbol` on the fake wallet, push a fill and return seconds until the signal is sent."""
+    w = srv.wallet(addr)
+    with w.lock:
+        w.positions[symbol] = ("long", 12345.0)
+    before = len(srv.sent_messages)
+    t0 = time.perf_counter()
+    ws.push_fill(addr)
+    ok = wait_for(lambda: any(symbol in m.get("text", "") for m in srv.sent_messages[before:]), timeout)
+    return time.perf_counter() - t0 if ok else -1.0
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--wallets", type=int, default=5)
+    ap.add_argument("--debounce", type=float, default=0.2)
+    ap.add_argument("--timeout", type=float, default=10.0)
+    args = ap.parse_args()
+
+    srv = FakeUpstream(change_rate=0.0).start()
+    ws = FakeWs().start()
+    workdir = tempfile.mkdtemp(prefix="signalbot-stream-")
+    wallets = [f"0x{i:040x}" for i in range(1, args.wallets + 1)]
+    os.environ.update(srv.env())
+    os.environ.update({
+        "STATE_DB": os.path.join(workdir, "state.db"),
+        "STATE_FILE": os.path.join(workdir, "state.json"),
+        "WALLETS_FILE": os.path.join(workdir, "wallets.json"),
+        "AUTHORIZED_CHATS_FILE": os.path.join(workdir, "chats.json"),
+        "SUBSCRIPTIONS_FILE": os.path.join(workdir, "subscriptions.json"),
+        "HISTORY_DB": os.path.join(workdir, "history.db"),
+        "TELEGRAM_CHAT_INTERVAL": "0",
+        "STREAMING_ENABLED": "1",
+        "HYPERLIQUID_WS_URL": ws.url,
+        "STREAM_DEBOUNCE": str(args.debounce),
+        "STREAM_MAX_WALLETS": str(args.wallets),
+    })
+    for name in ("COINGLASS", "DEBANK", "DEXSCREENER", "HYPERLIQUID", "HYPERDASH"):
+        os.environ.setdefault(f"{name}_RPS", "1000")
+        os.environ.setdefault(f"{name}_BURST", "1000")
+    with open(os.environ["WALLETS_FILE"], "w") as f:
+        json.dump(wallets, f)
+    with open(os.environ["AUTHORIZED_CHATS_FILE"], "w") as f:
+        json.dump([1], f)
+
+    import hyperdash_telegram_bot_mtproto_coinglass as bot_mod
+    logging.getLogger("signal_bot").setLevel(logging.WARNING)
+
+    for addr in wallets:
+        bot_mod._baseline_wallet(addr)
+    bot_mod.app.outbound.start()
+    bot_mod.app.position_stream.start()
+    failures = 0
+
+    if not wait_for(lambda: ws.subscribed_users() == set(wallets), args.timeout):
+        print(f"FAIL: subscribed to {len(ws.subscribed_users())}/{len(wallets)} wallets")
+        return 1
+    print(f"subscribed to {len(wallets)} wallets")
+
+    latency = fill_to_signal(srv, ws, wallets[0], "STRM1", args.timeout)
+    if latency < 0:
+        failures += 1
+        print("FAIL: no signal after fill")
+    else:
+        print(f"fill -> signal: {latency * 1000:.0f}ms (debounce {args.debounce * 1000:.0f}ms)")
+
+    connects = ws.connect_count
+    ws.drop_connections()
+    if not wait_for(lambda: ws.connect_count > connects and ws.subscribed_users() == set(wallets), args.timeout):
+        failures += 1
+        print("FAIL: stream did not reconnect and resubscribe")
+    else:
+        print("reconnected and resubscribed after drop")
+        latency = fill_to_signal(srv, ws, wallets[-1], "STRM2", args.timeout)
+        if latency < 0:
+            failures += 1
+            print("FAIL: no signal after reconnect")
+        else:
+            print(f"fill -> signal after reconnect: {latency * 1000:.0f}ms")
+
+    bot_mod.app.position_stream.stop()
+    ws.stop()
+    srv.stop()
+    print("OK" if not failures else f"{failures} check(s) failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
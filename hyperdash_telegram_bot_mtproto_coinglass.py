@@ -6,25 +6,52 @@ Telegram signal bot:
 - Stores state to disk (state.json) and sends signals to authorized Telegram chats
 
 Designed for polling (not webhook). Reads secrets from ENV.
+
+Scaling out: run SHARD_COUNT processes with SHARD_INDEX=0..N-1 on a shared state
+store and wallet files. Each polls only its consistent-hash shard of the wallets;
+exactly one of them runs with BOT_ROLE=all (or a separate BOT_ROLE=telegram process)
+to own Telegram command polling, the rest use BOT_ROLE=poller.
+
+Importing the module has no side effects: the Telegram client, state store and
+registries live on `app` and are built on first use, so fetchers and event
+detection can be used without a token or any files.
 """
 
+from __future__ import annotations
+
 import os
 import json
 import time
 import logging
 import threading
 import math
-from typing import Any, Dict, List, Optional, Set
+import heapq
+import sqlite3
+import atexit
+import re
+import io
+import functools
+import itertools
+import bisect
+import codecs
+import hashlib
+import zlib
+from contextlib import contextmanager
+from operator import attrgetter, is_not
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, wait, TimeoutError as FuturesTimeout
+from typing import TYPE_CHECKING, Any, Callable, Dict, Hashable, Iterator, List, Optional, Set, Tuple, Union
 from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
-from telegram import Bot, Update
-from telegram.ext import Updater, CommandHandler, MessageHandler, Filters, CallbackContext
-from telegram.utils.request import Request
-from telegram.error import TelegramError
+if TYPE_CHECKING:  # python-telegram-bot is imported when the bot is first used
+    from telegram import Update
+    from telegram.ext import CallbackContext
 
 # ---------------- CONFIG (from ENV) ----------------
 BOT_TOKEN = os.environ.get("BOT_TOKEN")
@@ -32,20 +59,277 @@ COINGLASS_API_KEY = os.environ.get("COINGLASS_API_KEY", "")
 PROXY_URL = os.environ.get("PROXY_URL", "")  # if you use a proxy, set e.g. socks5h://...
 POLL_INTERVAL = int(os.environ.get("POLL_INTERVAL", "300"))
 MIN_POSITION_VALUE_USD = float(os.environ.get("MIN_POSITION_VALUE_USD", "10.0"))
+POLL_WORKERS = max(1, int(os.environ.get("POLL_WORKERS", "8")))
+# wallets not finished within this many seconds are left to the next cycle (default: one interval)
+POLL_CYCLE_DEADLINE = float(os.environ.get("POLL_CYCLE_DEADLINE", str(POLL_INTERVAL)))
+# adaptive per-wallet scheduling: active wallets are polled down to POLL_MIN_INTERVAL,
+# quiet ones back off up to POLL_MAX_INTERVAL (POLL_INTERVAL is the starting interval)
+ADAPTIVE_POLLING = os.environ.get("ADAPTIVE_POLLING", "0").lower() in ("1", "true", "yes", "on")
+POLL_MIN_INTERVAL = float(os.environ.get("POLL_MIN_INTERVAL", "60"))
+POLL_MAX_INTERVAL = float(os.environ.get("POLL_MAX_INTERVAL", "3600"))
+POLL_SPEEDUP = float(os.environ.get("POLL_SPEEDUP", "0.5"))   # interval factor after a poll with events
+POLL_BACKOFF = float(os.environ.get("POLL_BACKOFF", "1.5"))   # interval factor after a quiet poll
+# pinned intervals written by /interval; poller shards pick up changes to the file on their next sync
+POLL_OVERRIDES_FILE = os.environ.get("POLL_OVERRIDES_FILE", "poll_overrides.json")
+# how detect_and_build_snapshots queries sources: sequential | parallel | merge
+FETCH_MODE = os.environ.get("FETCH_MODE", "sequential").strip().lower()
+FETCH_BUDGET = float(os.environ.get("FETCH_BUDGET", "15"))  # per-wallet latency budget in parallel/merge mode
+FANOUT_WORKERS = int(os.environ.get("FANOUT_WORKERS", str(POLL_WORKERS * 4)))
+# event detection in fixed-interval cycles: wallet (as each wallet is fetched) | batch (the whole
+# cycle at once with vectorized thresholds; needs numpy, otherwise falls back to per wallet)
+DETECT_MODE = os.environ.get("DETECT_MODE", "wallet").strip().lower()
+# outbound Telegram pacing: min seconds between messages to one chat, global messages/second
+TELEGRAM_CHAT_INTERVAL = float(os.environ.get("TELEGRAM_CHAT_INTERVAL", "1.0"))
+TELEGRAM_GLOBAL_RPS = float(os.environ.get("TELEGRAM_GLOBAL_RPS", "25"))
+TELEGRAM_MAX_ATTEMPTS = int(os.environ.get("TELEGRAM_MAX_ATTEMPTS", "5"))
+HYPERLIQUID_CONCURRENCY = int(os.environ.get("HYPERLIQUID_CONCURRENCY", "16"))
+HYPERLIQUID_PREFETCH = os.environ.get("HYPERLIQUID_PREFETCH", "1").lower() in ("1", "true", "yes", "on")
+# optional Hyperliquid WebSocket streaming (needs websocket-client); polling keeps running as fallback
+STREAMING_ENABLED = os.environ.get("STREAMING_ENABLED", "0").lower() in ("1", "true", "yes", "on")
+HYPERLIQUID_WS_URL = os.environ.get("HYPERLIQUID_WS_URL", "wss://api.hyperliquid.xyz/ws")
+STREAM_MAX_WALLETS = int(os.environ.get("STREAM_MAX_WALLETS", "10"))  # Hyperliquid caps tracked users per IP
+STREAM_DEBOUNCE = float(os.environ.get("STREAM_DEBOUNCE", "1.0"))    # coalesce fill bursts per wallet
+# event aggregation: hold a wallet's events this many seconds and send them as one collapsed
+# message (0 = send each poll's events right away); identical events within
+# EVENT_DEDUPE_WINDOW seconds are sent once
+EVENT_WINDOW = float(os.environ.get("EVENT_WINDOW", "0"))
+EVENT_DEDUPE_WINDOW = float(os.environ.get("EVENT_DEDUPE_WINDOW", "900"))
+EVENT_DEDUPE_MAX = int(os.environ.get("EVENT_DEDUPE_MAX", "10000"))
+# diff against the same source's last snapshot when the answering source changes
+EVENT_SOURCE_GUARD = os.environ.get("EVENT_SOURCE_GUARD", "1").lower() in ("1", "true", "yes", "on")
+# horizontal scaling: this process polls shard SHARD_INDEX of SHARD_COUNT (consistent hashing)
+SHARD_COUNT = max(1, int(os.environ.get("SHARD_COUNT", "1")))
+SHARD_INDEX = int(os.environ.get("SHARD_INDEX", "0"))
+# all = poll + Telegram commands, poller = poll only, telegram = commands only (exactly one process may read updates)
+BOT_ROLE = os.environ.get("BOT_ROLE", "all").strip().lower()
+DISABLED_SOURCES = {x.strip().lower() for x in os.environ.get("DISABLED_SOURCES", "").split(",") if x.strip()}
 
 WALLETS_FILE = os.environ.get("WALLETS_FILE", "wallets.json")
 AUTHORIZED_CHATS_FILE = os.environ.get("AUTHORIZED_CHATS_FILE", "authorized_chats.json")
-STATE_FILE = os.environ.get("STATE_FILE", "state.json")
+# chat -> followed wallets; WALLETS_FILE is kept as the union of all chats' wallets (what gets polled)
+SUBSCRIPTIONS_FILE = os.environ.get("SUBSCRIPTIONS_FILE", "subscriptions.json")
+# chats that get signals for wallets no chat follows (e.g. added to WALLETS_FILE by hand); comma-separated
+# chat ids. Without it such signals are logged and dropped, never broadcast to every chat.
+ADMIN_CHATS = [int(x) for x in os.environ.get("ADMIN_CHATS", "").split(",") if x.strip().lstrip("-").isdigit()]
+STATE_FILE = os.environ.get("STATE_FILE", "state.json")  # legacy, imported into STATE_DB once
+STATE_DB = os.environ.get("STATE_DB", "state.db")
+# wallets/chats files: changes are written at most this many seconds after they happen,
+# and the files are checked for external edits at most every REGISTRY_RELOAD_INTERVAL seconds
+REGISTRY_SAVE_DELAY = float(os.environ.get("REGISTRY_SAVE_DELAY", "2"))
+REGISTRY_RELOAD_INTERVAL = float(os.environ.get("REGISTRY_RELOAD_INTERVAL", "5"))
+# seconds between write-behind flushes of changed wallets; <= 0 writes through on every update
+STATE_FLUSH_INTERVAL = float(os.environ.get("STATE_FLUSH_INTERVAL", "5"))
+# snapshot history ("" disables): unchanged polls only extend the last entry; entries older than
+# HISTORY_DOWNSAMPLE_AFTER hours are thinned to one per HISTORY_DOWNSAMPLE_BUCKET seconds
+HISTORY_DB = os.environ.get("HISTORY_DB", "history.db")
+HISTORY_RETENTION_DAYS = float(os.environ.get("HISTORY_RETENTION_DAYS", "90"))
+HISTORY_DOWNSAMPLE_AFTER = float(os.environ.get("HISTORY_DOWNSAMPLE_AFTER", "24"))
+HISTORY_DOWNSAMPLE_BUCKET = float(os.environ.get("HISTORY_DOWNSAMPLE_BUCKET", "3600"))
+HISTORY_KEYFRAME_EVERY = int(os.environ.get("HISTORY_KEYFRAME_EVERY", "32"))
 
 REQUEST_TIMEOUT = 12
+IMPORT_MAX_BYTES = int(os.environ.get("IMPORT_MAX_BYTES", str(1024 * 1024)))  # /import document size limit
+SCRAPE_MAX_BYTES = int(os.environ.get("SCRAPE_MAX_BYTES", str(16 * 1024 * 1024)))  # give up on larger streamed bodies
+# per-source limits: <SOURCE>_RPS / <SOURCE>_BURST (e.g. COINGLASS_RPS=0.5), see SOURCE_LIMITS
+RATE_LIMIT_MAX_WAIT = float(os.environ.get("RATE_LIMIT_MAX_WAIT", "10"))
+BREAKER_FAILURES = int(os.environ.get("BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.environ.get("BREAKER_COOLDOWN", "120"))
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL", "https://api.telegram.org/bot")
+# shared upstream response cache: CACHE_TTL_<SOURCE> seconds (0 disables for that source)
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "5000"))
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+# serve /metrics on this port; 0 disables. Shards on one host listen on METRICS_PORT + SHARD_INDEX
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
 
-if not BOT_TOKEN:
-    raise RuntimeError("BOT_TOKEN environment variable is not set. Aborting.")
+def check_config():
+    """Validate settings the bot cannot run without; called by main(), not at import."""
+    if not BOT_TOKEN:
+        raise RuntimeError("BOT_TOKEN environment variable is not set. Aborting.")
+    if not 0 <= SHARD_INDEX < SHARD_COUNT:
+        raise RuntimeError(f"SHARD_INDEX must be in 0..{SHARD_COUNT - 1}, got {SHARD_INDEX}. Aborting.")
+    if BOT_ROLE not in ("all", "poller", "telegram"):
+        raise RuntimeError(f"BOT_ROLE must be all, poller or telegram, got {BOT_ROLE!r}. Aborting.")
 
 # ---------------- logging ----------------
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+# handlers are configured by main(); importers keep their own logging setup
 logger = logging.getLogger("signal_bot")
 
+# ---------------- metrics ----------------
+class Metrics:
+    """
+    Small Prometheus-style registry (counters, gauges, histograms with labels) rendered
+    in the text exposition format. Histograms also keep a window of recent samples so
+    /status can show quantiles without scraping.
+    """
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+    RECENT = 512
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta: Dict[str, tuple] = {}             # name -> (type, help)
+        self._values: Dict[tuple, float] = {}         # (name, labels) -> counter/gauge value
+        self._hist: Dict[tuple, Dict[str, Any]] = {}  # (name, labels) -> buckets/sum/count/recent
+        self._collectors: List[Callable[[], None]] = []
+
+    def describe(self, name: str, kind: str, help_text: str):
+        self._meta[name] = (kind, help_text)
+
+    def add_collector(self, fn: Callable[[], None]):
+        """fn() is called before every render to refresh gauges from live objects."""
+        self._collectors.append(fn)
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, Any]) -> tuple:
+        return (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self._values[self._key(name, labels)] = float(value)
+
+    def observe(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            h = self._hist.get(key)
+            if h is None:
+                h = self._hist[key] = {"buckets": [0] * len(self.BUCKETS), "sum": 0.0, "count": 0,
+                                       "recent": deque(maxlen=self.RECENT)}
+            i = bisect.bisect_left(self.BUCKETS, value)
+            if i < len(self.BUCKETS):
+                h["buckets"][i] += 1
+            h["sum"] += value
+            h["count"] += 1
+            h["recent"].append(value)
+
+    @contextmanager
+    def time(self, name: str, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0, **labels)
+
+    def value(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(name, labels), 0.0)
+
+    def quantiles(self, name: str, qs=(0.5, 0.99), **labels) -> Optional[Dict[str, float]]:
+        """Quantiles over the recent samples of one histogram series, plus the last value."""
+        with self._lock:
+            h = self._hist.get(self._key(name, labels))
+            recent = sorted(h["recent"]) if h else []
+            last = h["recent"][-1] if h and h["recent"] else None
+        if not recent:
+            return None
+        out = {f"p{int(q * 100)}": recent[min(len(recent) - 1, int(q * len(recent)))] for q in qs}
+        out["last"] = last
+        out["count"] = len(recent)
+        return out
+
+    def render(self) -> str:
+        for fn in self._collectors:
+            try:
+                fn()
+            except Exception as e:
+                logger.debug("metrics collector err %s", e)
+        def fmt(labels: tuple, extra: tuple = ()) -> str:
+            items = labels + extra
+            if not items:
+                return ""
+            return "{" + ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in items) + "}"
+        lines: List[str] = []
+        with self._lock:
+            names = sorted({k[0] for k in self._values} | {k[0] for k in self._hist})
+            for name in names:
+                kind, help_text = self._meta.get(name, ("untyped", ""))
+                if help_text:
+                    lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for (n, labels), v in sorted(self._values.items()):
+                    if n == name:
+                        lines.append(f"{name}{fmt(labels)} {v:g}")
+                for (n, labels), h in sorted(self._hist.items(), key=lambda kv: kv[0]):
+                    if n != name:
+                        continue
+                    cumulative = 0
+                    for bound, c in zip(self.BUCKETS, h["buckets"]):
+                        cumulative += c
+                        lines.append(f"{name}_bucket{fmt(labels, (('le', f'{bound:g}'),))} {cumulative}")
+                    lines.append(f"{name}_bucket{fmt(labels, (('le', '+Inf'),))} {h['count']}")
+                    lines.append(f"{name}_sum{fmt(labels)} {h['sum']:g}")
+                    lines.append(f"{name}_count{fmt(labels)} {h['count']}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+metrics.describe("signalbot_fetch_seconds", "histogram", "Fetcher latency per source")
+metrics.describe("signalbot_fetch_total", "counter", "Fetcher calls per source and result (ok/empty/error)")
+metrics.describe("signalbot_wallet_seconds", "histogram", "process_wallet duration")
+metrics.describe("signalbot_cycle_seconds", "histogram", "Poll cycle duration")
+metrics.describe("signalbot_cycle_interval_ratio", "gauge", "Last poll cycle duration divided by POLL_INTERVAL")
+metrics.describe("signalbot_cycle_events", "gauge", "Events generated in the last poll cycle")
+metrics.describe("signalbot_cycle_wallets", "gauge", "Wallets per outcome in the last poll cycle")
+metrics.describe("signalbot_events_total", "counter", "Events generated")
+metrics.describe("signalbot_detect_batch_seconds", "histogram", "Batch event detection time per poll cycle")
+metrics.describe("signalbot_events_suppressed_total", "counter", "Events not sent, by reason (collapsed, duplicate, source_switch)")
+metrics.describe("signalbot_events_pending", "gauge", "Events held in the aggregation window")
+metrics.describe("signalbot_state_flush_seconds", "histogram", "State store flush duration")
+metrics.describe("signalbot_state_rows_written_total", "counter", "Wallet states written by flushes")
+metrics.describe("signalbot_history_rows_written_total", "counter", "History entries written (new or extended)")
+metrics.describe("signalbot_telegram_send_seconds", "histogram", "Telegram send_message latency")
+metrics.describe("signalbot_telegram_sent_total", "counter", "Telegram sends per result")
+metrics.describe("signalbot_telegram_queue_depth", "gauge", "Messages waiting in the outbound queue")
+metrics.describe("signalbot_source_requests_total", "counter", "Upstream requests per source and outcome")
+metrics.describe("signalbot_source_breaker_open", "gauge", "1 if the source circuit breaker is not closed")
+metrics.describe("signalbot_source_paused_seconds", "gauge", "Remaining Retry-After pause per source")
+metrics.describe("signalbot_schedule_lag_seconds", "histogram", "Delay between a wallet's due time and its poll starting (adaptive mode)")
+metrics.describe("signalbot_scheduled_wallets", "gauge", "Wallets in the adaptive schedule")
+metrics.describe("signalbot_overdue_wallets", "gauge", "Wallets past their due time (adaptive mode)")
+metrics.describe("signalbot_stream_connected", "gauge", "1 while the position stream is connected")
+metrics.describe("signalbot_stream_messages_total", "counter", "Position stream messages per channel")
+metrics.describe("signalbot_stream_reconnects_total", "counter", "Position stream reconnects")
+metrics.describe("signalbot_cache_requests_total", "counter", "Response cache lookups per source and result")
+metrics.describe("signalbot_cache_entries", "gauge", "Responses held in the cache")
+metrics.describe("signalbot_cache_bytes", "gauge", "Response bytes held in the cache")
+
+def timed_fetcher(source: str):
+    """Record latency and outcome of a fetcher that returns a snapshot or None."""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            result = "error"
+            t0 = time.perf_counter()
+            try:
+                res = fn(*args, **kwargs)
+                result = "ok" if res else "empty"
+                return res
+            finally:
+                metrics.observe("signalbot_fetch_seconds", time.perf_counter() - t0, source=source)
+                metrics.inc("signalbot_fetch_total", source=source, result=result)
+        return wrapper
+    return deco
+
+def start_metrics_server(host: str, port: int):
+    """Serve metrics.render() on http://host:port/metrics from a daemon thread (Flask)."""
+    from flask import Flask, Response
+    from werkzeug.serving import make_server
+
+    app = Flask("signalbot-metrics")
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)  # no access log line per scrape
+
+    @app.route("/metrics")
+    def _metrics():
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+    server = make_server(host, port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info("Metrics on http://%s:%s/metrics", host, server.server_port)
+    return server
+
 # ---------------- HTTP session ----------------
 def make_session(proxies: Optional[dict] = None) -> requests.Session:
     s = requests.Session()
@@ -59,13 +343,415 @@ def make_session(proxies: Optional[dict] = None) -> requests.Session:
     return s
 
 PROXIES_REQUESTS = {"http": PROXY_URL, "https": PROXY_URL} if PROXY_URL else {}
-SESSION = make_session(PROXIES_REQUESTS)
 
-# ---------------- Telegram init ----------------
-request_obj = Request(proxy_url=PROXY_URL, connect_timeout=10.0, read_timeout=15.0) if PROXY_URL else Request(connect_timeout=10.0, read_timeout=15.0)
-bot = Bot(token=BOT_TOKEN, request=request_obj)
-updater = Updater(bot=bot, use_context=True)
-dispatcher = updater.dispatcher
+# ---------------- per-source rate limiting / circuit breaking ----------------
+class SourceUnavailable(Exception):
+    """Raised instead of issuing a request when a source is throttled or its breaker is open."""
+
+class TokenBucket:
+    """Thread-safe token bucket; `pause()` blocks all tokens until a Retry-After deadline."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = max(rate, 1e-6)
+        self.burst = max(burst, 1.0)
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+
+    def paused_for(self) -> float:
+        return max(0.0, self._paused_until - time.monotonic())
+
+    def acquire(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now >= self._paused_until:
+                    self._tokens = min(self.burst, self._tokens + (now - max(self._last, self._paused_until)) * self.rate)
+                    self._last = now
+                    if self._tokens >= 1.0:
+                        self._tokens -= 1.0
+                        return True
+                    wait_for = (1.0 - self._tokens) / self.rate
+                else:
+                    wait_for = self._paused_until - now
+            if now + wait_for > deadline:
+                return False
+            time.sleep(wait_for)
+
+class CircuitBreaker:
+    """
+    closed -> open after `threshold` consecutive failures; after `cooldown` seconds one
+    trial request is let through (half-open) and its outcome closes or re-opens the breaker.
+    A trial that never reports back is replaced by a new one after another cooldown.
+    """
+
+    def __init__(self, name: str, threshold: int, cooldown: float):
+        self.name = name
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = 0.0
+        self.state = "closed"
+        self._lock = threading.Lock()
+
+    def blocked(self) -> bool:
+        """True if allow() would refuse, without claiming the half-open trial."""
+        with self._lock:
+            return self.state != "closed" and time.monotonic() - self.opened_at < self.cooldown
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            now = time.monotonic()
+            if now - self.opened_at >= self.cooldown:
+                self.state = "half_open"
+                self.opened_at = now
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.state = "closed"
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.threshold:
+                if self.state != "open":
+                    logger.warning("%s circuit opened after %d failures", self.name, self.failures)
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def record_throttled(self):
+        """A 429 says nothing about health while closed, but a half-open trial that got one failed."""
+        with self._lock:
+            if self.state == "half_open":
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+class SourceGuard:
+    def __init__(self, name: str, rate: float, burst: float):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(name, BREAKER_FAILURES, BREAKER_COOLDOWN)
+        self.counters = {"requests": 0, "ok": 0, "failures": 0, "throttled": 0, "rejected": 0}
+        self._lock = threading.Lock()
+
+    def count(self, key: str):
+        with self._lock:
+            self.counters[key] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self.counters)
+        out["breaker"] = self.breaker.state
+        out["paused_for"] = round(self.bucket.paused_for(), 1)
+        return out
+
+# default requests/second and burst per source (overridable via <SOURCE>_RPS / <SOURCE>_BURST)
+SOURCE_LIMITS = {
+    "coinglass": (0.5, 2),
+    "debank": (1.0, 3),
+    "dexscreener": (4.0, 8),
+    "hyperdash": (1.0, 3),
+    # info API allows ~1200 weight/min per IP; clearinghouseState weighs 2
+    "hyperliquid": (8.0, 16),
+}
+SOURCE_GUARDS: Dict[str, SourceGuard] = {
+    name: SourceGuard(
+        name,
+        float(os.environ.get(f"{name.upper()}_RPS", rate)),
+        float(os.environ.get(f"{name.upper()}_BURST", burst)),
+    )
+    for name, (rate, burst) in SOURCE_LIMITS.items()
+}
+
+def _retry_after_seconds(value: Optional[str], default: float = 30.0) -> float:
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except Exception:
+        return default
+
+class _CacheEntry:
+    __slots__ = ("value", "stored_at", "ttl", "size", "etag", "last_modified")
+
+    def __init__(self, value: Any, headers, size: int, ttl: float):
+        self.value = value  # the Response, or what a streaming parser made of it
+        self.stored_at = time.monotonic()
+        self.ttl = ttl
+        self.size = size
+        self.etag = headers.get("ETag")
+        self.last_modified = headers.get("Last-Modified")
+
+    def fresh(self) -> bool:
+        return time.monotonic() - self.stored_at < self.ttl
+
+class ResponseCache:
+    """
+    Bounded LRU (entries and bytes) of successful responses, or the values streaming
+    parsers produced from them, with a per-source TTL.
+    Stale entries keep their ETag/Last-Modified so the next request can be conditional,
+    and concurrent requests for the same URL wait for a single upstream call.
+    """
+
+    def __init__(self, ttls: Dict[str, float], max_entries: int, max_bytes: int):
+        self.ttls = ttls
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._bytes = 0
+        self._inflight: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def count(self, source: str, result: str):
+        with self._lock:
+            st = self.stats.setdefault(source, {"hit": 0, "miss": 0, "revalidated": 0})
+            st[result] = st.get(result, 0) + 1
+
+    def get(self, key: str) -> Optional[_CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: str, value: Any, headers, size: int, ttl: float):
+        entry = _CacheEntry(value, headers, size, ttl)
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+
+    def refresh(self, key: str):
+        """Upstream answered 304: the cached body is valid for another TTL."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.stored_at = time.monotonic()
+
+    def begin(self, key: str) -> Optional[threading.Event]:
+        """Returns None if the caller should fetch `key`, else an event set when the fetching thread is done."""
+        with self._lock:
+            ev = self._inflight.get(key)
+            if ev is None:
+                self._inflight[key] = threading.Event()
+            return ev
+
+    def end(self, key: str):
+        with self._lock:
+            ev = self._inflight.pop(key, None)
+        if ev is not None:
+            ev.set()
+
+    def size(self) -> tuple:
+        with self._lock:
+            return len(self._entries), self._bytes
+
+SOURCE_CACHE_TTLS = {
+    "coinglass": 30.0,
+    "debank": 30.0,
+    "dexscreener": 120.0,  # pair search results for an address change slowly
+    "hyperdash": 30.0,
+    "hyperliquid": 10.0,
+}
+RESPONSE_CACHE = ResponseCache(
+    {name: float(os.environ.get(f"CACHE_TTL_{name.upper()}", ttl)) for name, ttl in SOURCE_CACHE_TTLS.items()},
+    CACHE_MAX_ENTRIES,
+    CACHE_MAX_BYTES,
+)
+
+def _guarded_request(source: str, method: str, url: str, **kwargs) -> requests.Response:
+    """app.session.request() behind the source's breaker and rate limiter."""
+    guard = SOURCE_GUARDS[source]
+    if guard.breaker.blocked():
+        guard.count("rejected")
+        raise SourceUnavailable(f"{source} circuit open")
+    # take the rate-limit token first: a half-open trial is only claimed for a request that is sent
+    if not guard.bucket.acquire(RATE_LIMIT_MAX_WAIT):
+        guard.count("rejected")
+        raise SourceUnavailable(f"{source} rate limited")
+    if not guard.breaker.allow():
+        guard.count("rejected")
+        raise SourceUnavailable(f"{source} circuit open")
+    guard.count("requests")
+    try:
+        r = app.session.request(method, url, **kwargs)
+    except requests.RequestException:
+        guard.count("failures")
+        guard.breaker.record_failure()
+        raise
+    if r.status_code == 429:
+        delay = _retry_after_seconds(r.headers.get("Retry-After"))
+        guard.count("throttled")
+        guard.bucket.pause(delay)
+        guard.breaker.record_throttled()
+        logger.warning("%s returned 429; pausing %.0fs", source, delay)
+    elif r.status_code >= 500:
+        guard.count("failures")
+        guard.breaker.record_failure()
+    else:
+        guard.count("ok")
+        guard.breaker.record_success()
+    return r
+
+def _parse_streamed(r: requests.Response, parse: Callable[[requests.Response], Any]) -> Any:
+    """Run a streaming parser over a stream=True response and release the connection."""
+    try:
+        r.raise_for_status()
+        return parse(r)
+    finally:
+        r.close()
+
+def _value_size(value: Any) -> int:
+    """Rough byte size of a parsed value, for the cache's byte budget."""
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return 1024
+
+def source_request(source: str, method: str, url: str, cache: bool = True,
+                   parse: Optional[Callable[[requests.Response], Any]] = None, **kwargs) -> Any:
+    """
+    Request through the shared response cache, then the source's breaker and rate limiter.
+    A fresh cached response is returned without any request; a stale GET is revalidated
+    with If-None-Match / If-Modified-Since when the upstream sent validators. POSTs are
+    cached by URL and JSON body (for read-only query APIs).
+    With `parse`, the body is streamed into parse(response) instead of being buffered, and
+    the parsed value (not the Response) is what gets cached and returned; HTTP errors raise.
+    Raises SourceUnavailable without touching the network when the source is open or throttled.
+    """
+    if parse is not None:
+        kwargs["stream"] = True
+    ttl = RESPONSE_CACHE.ttls.get(source, 0.0) if cache else 0.0
+    if ttl <= 0:
+        r = _guarded_request(source, method, url, **kwargs)
+        return r if parse is None else _parse_streamed(r, parse)
+    key = requests.Request(method, url, params=kwargs.get("params")).prepare().url
+    if method != "GET":
+        key = f"{method} {key} {json.dumps(kwargs.get('json'), sort_keys=True)}"
+    if parse is not None:
+        key = f"{key} #{parse.__name__}"
+    while True:
+        entry = RESPONSE_CACHE.get(key)
+        if entry is not None and entry.fresh():
+            RESPONSE_CACHE.count(source, "hit")
+            return entry.value
+        waiting = RESPONSE_CACHE.begin(key)
+        if waiting is None:
+            break
+        # another thread is fetching the same request; use its result
+        waiting.wait(timeout=REQUEST_TIMEOUT * 2)
+        entry = RESPONSE_CACHE.get(key)
+        if entry is not None and entry.fresh():
+            RESPONSE_CACHE.count(source, "hit")
+            return entry.value
+    try:
+        headers = dict(kwargs.pop("headers", None) or {})
+        if entry is not None and method == "GET":
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        r = _guarded_request(source, method, url, headers=headers, **kwargs)
+        if r.status_code == 304 and entry is not None:
+            r.close()
+            RESPONSE_CACHE.refresh(key)
+            RESPONSE_CACHE.count(source, "revalidated")
+            return entry.value
+        RESPONSE_CACHE.count(source, "miss")
+        if parse is not None:
+            status = r.status_code
+            value = _parse_streamed(r, parse)
+            if status == 200:
+                RESPONSE_CACHE.put(key, value, r.headers, _value_size(value), ttl)
+            return value
+        if r.status_code == 200:
+            RESPONSE_CACHE.put(key, r, r.headers, len(r.content or b""), ttl)
+        return r
+    finally:
+        RESPONSE_CACHE.end(key)
+
+def source_get(source: str, url: str, cache: bool = True, **kwargs) -> Any:
+    return source_request(source, "GET", url, cache=cache, **kwargs)
+
+def source_post(source: str, url: str, cache: bool = True, **kwargs) -> Any:
+    return source_request(source, "POST", url, cache=cache, **kwargs)
+
+def cache_status_lines() -> List[str]:
+    entries, size = RESPONSE_CACHE.size()
+    lines = [f"cache: {entries} entries, {size / 1024:.0f} KB"]
+    for name, st in sorted(list(RESPONSE_CACHE.stats.items())):
+        total = sum(st.values())
+        reused = st["hit"] + st["revalidated"]
+        lines.append(f"{name}: hit rate {100.0 * reused / total:.0f}% ({st['hit']} hit, {st['revalidated']} 304, {st['miss']} miss)")
+    return lines
+
+def _collect_source_metrics():
+    for name, guard in SOURCE_GUARDS.items():
+        st = guard.snapshot()
+        for k in ("requests", "ok", "failures", "throttled", "rejected"):
+            metrics.set("signalbot_source_requests_total", st[k], source=name, outcome=k)
+        metrics.set("signalbot_source_breaker_open", 0 if st["breaker"] == "closed" else 1, source=name)
+        metrics.set("signalbot_source_paused_seconds", st["paused_for"], source=name)
+
+def _collect_cache_metrics():
+    entries, size = RESPONSE_CACHE.size()
+    metrics.set("signalbot_cache_entries", entries)
+    metrics.set("signalbot_cache_bytes", size)
+    for name, st in list(RESPONSE_CACHE.stats.items()):
+        for result, n in st.items():
+            metrics.set("signalbot_cache_requests_total", n, source=name, result=result)
+
+metrics.add_collector(_collect_source_metrics)
+metrics.add_collector(_collect_cache_metrics)
+
+def source_status_lines() -> List[str]:
+    lines = []
+    for name, guard in SOURCE_GUARDS.items():
+        st = guard.snapshot()
+        throttled = f", paused {st['paused_for']:.0f}s" if st["paused_for"] else ""
+        lines.append(
+            f"{name}: {st['breaker']}{throttled} — req {st['requests']}, ok {st['ok']}, "
+            f"fail {st['failures']}, 429 {st['throttled']}, skipped {st['rejected']}"
+        )
+    return lines
+
+def metrics_status_lines() -> List[str]:
+    def q(name: str, **labels) -> str:
+        st = metrics.quantiles(name, **labels)
+        return f"p50 {st['p50']:.2f}s / p99 {st['p99']:.2f}s" if st else "n/a"
+    cycle = metrics.quantiles("signalbot_cycle_seconds")
+    lines = [
+        f"cycle: last {cycle['last']:.1f}s of {POLL_INTERVAL}s ({q('signalbot_cycle_seconds')})" if cycle else "cycle: n/a",
+        f"events last cycle: {metrics.value('signalbot_cycle_events'):.0f}",
+        f"wallet: {q('signalbot_wallet_seconds')}",
+        f"telegram send: {q('signalbot_telegram_send_seconds')}",
+    ]
+    lines += [f"fetch {name}: {q('signalbot_fetch_seconds', source=name)}" for name in SOURCE_GUARDS]
+    return lines
 
 # ---------------- storage helpers ----------------
 def _read_json(path: str, default: Any):
@@ -79,62 +765,808 @@ def _read_json(path: str, default: Any):
         return default
 
 def _write_json(path: str, data: Any):
+    # write to a temp file and rename so readers never see a half-written file
+    tmp = f"{path}.tmp"
     try:
-        with open(path, "w", encoding="utf-8") as f:
+        with open(tmp, "w", encoding="utf-8") as f:
             json.dump(data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp, path)
     except Exception as e:
         logger.error("write_json %s failed: %s", path, e)
 
+class JsonFileRegistry:
+    """
+    Base for thread-safe in-memory registries mirrored to a JSON file.
+    Lookups never touch the disk; changes are persisted once per `save_delay`
+    window, and external edits are picked up by checking the file mtime at most
+    every `check_interval` seconds. Subclasses keep the data and implement
+    _load() / _serialize(); methods that read or change it hold `_lock`, call
+    _maybe_reload() first and _changed() after a change.
+    """
+
+    unit = "entries"   # what _count() counts, for log lines
+
+    def __init__(self, path: str, save_delay: float = 2.0, check_interval: float = 5.0):
+        self.path = path
+        self.save_delay = save_delay
+        self.check_interval = check_interval
+        self._lock = threading.RLock()
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self._dirty = False
+        self._timer: Optional[threading.Timer] = None
+        self._reload()
+
+    def _load(self, data: Any):
+        """Replace the contents with the file's JSON (None if there is no file); raise on bad data."""
+        raise NotImplementedError
+
+    def _serialize(self) -> Any:
+        raise NotImplementedError
+
+    def _count(self) -> int:
+        raise NotImplementedError
+
+    def _file_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    def _reload(self):
+        mtime = self._file_mtime()
+        try:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except FileNotFoundError:
+                data = None
+            self._load(data)
+        except Exception as e:
+            # keep what we have rather than forgetting everything on a bad edit
+            logger.warning("cannot load %s, keeping %d cached %s: %s", self.path, self._count(), self.unit, e)
+        self._mtime = mtime
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        mtime = self._file_mtime()
+        if mtime != self._mtime:
+            if self._dirty:
+                logger.warning("%s changed on disk while local changes are pending; keeping local changes", self.path)
+                self._mtime = mtime
+            else:
+                self._reload()
+                logger.info("Reloaded %s (%d %s)", self.path, self._count(), self.unit)
+
+    def _changed(self):
+        self._dirty = True
+        if self.save_delay <= 0:
+            self.flush()
+        elif self._timer is None:
+            self._timer = threading.Timer(self.save_delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            self._timer = None
+            if not self._dirty:
+                return
+            _write_json(self.path, self._serialize())
+            self._dirty = False
+            self._mtime = self._file_mtime()
+
+class JsonSetRegistry(JsonFileRegistry):
+    """Thread-safe in-memory set (insertion ordered) mirrored to a JSON list file."""
+
+    def __init__(self, path: str, normalize: Callable[[Any], Hashable],
+                 save_delay: float = 2.0, check_interval: float = 5.0):
+        self.normalize = normalize
+        self._items: Dict[Hashable, None] = {}
+        super().__init__(path, save_delay, check_interval)
+
+    def _load(self, data: Any):
+        self._items = {self.normalize(x): None for x in data or ()}
+
+    def _serialize(self) -> Any:
+        return list(self._items)
+
+    def _count(self) -> int:
+        return len(self._items)
+
+    def items(self) -> List[Any]:
+        with self._lock:
+            self._maybe_reload()
+            return list(self._items)
+
+    def add(self, item: Any) -> bool:
+        item = self.normalize(item)
+        with self._lock:
+            self._maybe_reload()
+            if item in self._items:
+                return False
+            self._items[item] = None
+            self._changed()
+            return True
+
+    def add_many(self, items: List[Any]) -> List[Any]:
+        """Add all new items with a single persist; returns the ones that were added."""
+        added = []
+        with self._lock:
+            self._maybe_reload()
+            for item in items:
+                item = self.normalize(item)
+                if item not in self._items:
+                    self._items[item] = None
+                    added.append(item)
+            if added:
+                self._changed()
+        return added
+
+    def remove(self, item: Any) -> bool:
+        item = self.normalize(item)
+        with self._lock:
+            self._maybe_reload()
+            if item not in self._items:
+                return False
+            del self._items[item]
+            self._changed()
+            return True
+
+    def __contains__(self, item: Any) -> bool:
+        with self._lock:
+            self._maybe_reload()
+            return self.normalize(item) in self._items
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._maybe_reload()
+            return len(self._items)
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self.items())
+
+def _normalize_wallet(addr: Any) -> str:
+    return str(addr).strip().lower()
+
 def load_wallets() -> List[str]:
-    data = _read_json(WALLETS_FILE, [])
-    if isinstance(data, list):
-        return [w.lower() for w in data]
-    return []
+    return app.wallet_registry.items()
+
+class HashRing:
+    """
+    Consistent-hash ring of shard names with virtual nodes, so going from N to N+1
+    shards moves only about 1/(N+1) of the wallets to the new shard.
+    """
+    VNODES = 128
 
-def save_wallets(wallets: List[str]):
-    _write_json(WALLETS_FILE, wallets)
+    def __init__(self, shards: List[str], vnodes: int = VNODES):
+        points = sorted((self._hash(f"{shard}#{i}"), shard) for shard in shards for i in range(vnodes))
+        self._keys = [k for k, _ in points]
+        self._shards = [sh for _, sh in points]
+        self._owner: Dict[str, str] = {}
 
-def load_authorized_chats() -> Set[int]:
-    data = _read_json(AUTHORIZED_CHATS_FILE, [])
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+    def owner(self, key: str) -> str:
+        shard = self._owner.get(key)
+        if shard is None:
+            i = bisect.bisect(self._keys, self._hash(key)) % len(self._keys)
+            shard = self._owner[key] = self._shards[i]
+        return shard
+
+shard_ring = HashRing([str(i) for i in range(SHARD_COUNT)])
+_shard_known: Optional[Set[str]] = None
+
+def polls_wallet(addr: str) -> bool:
+    """True if this process is the one polling `addr`."""
+    return BOT_ROLE != "telegram" and (SHARD_COUNT == 1 or shard_ring.owner(addr) == str(SHARD_INDEX))
+
+def load_shard_wallets() -> List[str]:
+    """
+    The wallets this process polls. Wallets that newly join the shard (added by the
+    process that owns Telegram commands) get a background baseline, as /add does locally;
+    poll cycles skip them until it is stored.
+    """
+    global _shard_known
+    wallets = [w for w in load_wallets() if polls_wallet(w)]
+    if _shard_known is not None:
+        new = [w for w in wallets if w not in _shard_known and app.state_store.get_snapshot(w) is None]
+        if new:
+            prefetch_baselines(new)
+    _shard_known = set(wallets)
+    return wallets
+
+ADDRESS_RE = re.compile(r"0x[0-9a-fA-F]{40}")
+_ADDRESS_SPLIT_RE = re.compile(r"[\s,;|\"']+")
+
+def parse_wallet_list(text: str) -> tuple:
+    """
+    Split pasted text or a txt/csv file into (valid unique addresses in input order, invalid entries).
+    Only 0x-prefixed tokens count as invalid, so CSV headers and label columns are ignored.
+    """
+    valid: Dict[str, None] = {}
+    invalid = []
+    for tok in _ADDRESS_SPLIT_RE.split(text):
+        if not tok:
+            continue
+        if ADDRESS_RE.fullmatch(tok):
+            valid[tok.lower()] = None
+        elif tok[:2].lower() == "0x":
+            invalid.append(tok)
+    return list(valid), invalid
+
+# ---------------- snapshots ----------------
+def _to_float(v: Any) -> float:
     try:
-        return set(int(x) for x in data)
-    except Exception:
-        return set()
+        return float(v or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+@dataclass
+class Position:
+    __slots__ = ("symbol", "side", "size_usd")
+    symbol: Optional[str]
+    side: str          # lower-cased
+    size_usd: float
+
+    @property
+    def key(self) -> Tuple[Optional[str], str]:
+        return (self.symbol, self.side)
+
+@dataclass
+class Snapshot:
+    """
+    A wallet snapshot normalized once: float values, lower-cased sides and a
+    (symbol, side) -> Position map, so diffing needs no casting or list scans.
+    """
+    __slots__ = ("usd_total", "tokens", "positions", "position_map", "source", "updated_at")
+    usd_total: float
+    tokens: Dict[str, float]
+    positions: Tuple[Position, ...]
+    position_map: Dict[Tuple[Optional[str], str], Position]
+    source: Optional[str]
+    updated_at: Optional[str]
 
-def save_authorized_chats(chats: Set[int]):
-    _write_json(AUTHORIZED_CHATS_FILE, list(chats))
+    def to_state(self) -> Dict[str, Any]:
+        return {
+            "updated_at": self.updated_at,
+            "source": self.source,
+            "usd_total": self.usd_total,
+            "tokens": self.tokens,
+            "positions": [{"symbol": p.symbol, "size_usd": p.size_usd, "side": p.side} for p in self.positions],
+        }
+
+def normalize_snapshot(raw: Dict[str, Any]) -> Snapshot:
+    positions = tuple(
+        Position(p.get("symbol"), (p.get("side") or "").lower(), _to_float(p.get("size_usd")))
+        for p in (raw.get("positions") or [])
+    )
+    return Snapshot(
+        usd_total=_to_float(raw.get("usd_total")),
+        tokens={tok: _to_float(val) for tok, val in (raw.get("tokens") or {}).items()},
+        positions=positions,
+        # like the previous list-based lookup, the last duplicate of a key wins
+        position_map={p.key: p for p in positions},
+        source=raw.get("source"),
+        updated_at=raw.get("updated_at"),
+    )
+
+EMPTY_SNAPSHOT = normalize_snapshot({})
 
 # ---------------- state ----------------
 # Structure:
 # {
 #   "<wallet>": {
 #       "updated_at": "...",
+#       "source": "coinglass",
 #       "usd_total": 123.45,
 #       "tokens": {"TOKEN": amount, ...},
 #       "positions": [{"symbol":..., "size_usd":..., "side":...}, ...]
 #    }, ...
 # }
-state: Dict[str, Any] = _read_json(STATE_FILE, {})
+class StateStore:
+    """
+    Wallet snapshots kept in SQLite.
+    Wallets are loaded on first access and served from memory afterwards; updates are
+    marked dirty and written in one transaction per flush (write-behind), so a crash
+    can lose at most the last flush interval but never leaves a truncated store.
+    """
+
+    def __init__(self, path: str, legacy_json: Optional[str] = None):
+        self.path = path
+        self._lock = threading.RLock()      # guards the in-memory cache
+        self._db_lock = threading.Lock()    # serializes use of the sqlite connection
+        self._cache: Dict[str, Snapshot] = {}
+        self._missing: Set[str] = set()
+        self._dirty: Set[str] = set()
+        self._flusher: Optional[threading.Thread] = None
+        # shard processes share the file; wait for each other's write transactions
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._db_lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS wallet_state ("
+                "wallet TEXT PRIMARY KEY, updated_at TEXT, data TEXT NOT NULL)"
+            )
+        if legacy_json:
+            self._import_legacy(legacy_json)
+
+    def _import_legacy(self, path: str):
+        with self._db_lock:
+            if self._conn.execute("SELECT 1 FROM wallet_state LIMIT 1").fetchone():
+                return
+            data = _read_json(path, {})
+            if not isinstance(data, dict) or not data:
+                return
+            rows = [
+                (addr.lower(), (snap or {}).get("updated_at"), json.dumps(snap, separators=(",", ":"), ensure_ascii=False))
+                for addr, snap in data.items()
+            ]
+            with self._conn:
+                self._conn.executemany("INSERT OR REPLACE INTO wallet_state VALUES (?, ?, ?)", rows)
+        logger.info("Imported %d wallet states from %s into %s", len(rows), path, self.path)
+
+    def get_snapshot(self, addr: str) -> Optional[Snapshot]:
+        addr = addr.lower()
+        with self._lock:
+            if addr in self._cache:
+                return self._cache[addr]
+            if addr in self._missing:
+                return None
+        with self._db_lock:
+            row = self._conn.execute("SELECT data FROM wallet_state WHERE wallet = ?", (addr,)).fetchone()
+        snap = None
+        if row:
+            try:
+                snap = normalize_snapshot(json.loads(row[0]))
+            except Exception as e:
+                logger.error("state for %s is unreadable: %s", addr, e)
+        with self._lock:
+            # a concurrent set() wins over what was just read from disk
+            if addr in self._cache:
+                return self._cache[addr]
+            if snap is None:
+                self._missing.add(addr)
+            else:
+                self._cache[addr] = snap
+        return snap
+
+    def get(self, addr: str) -> Optional[Dict[str, Any]]:
+        snap = self.get_snapshot(addr)
+        return snap.to_state() if snap else None
+
+    def set(self, addr: str, snap: Union[Snapshot, Dict[str, Any]]):
+        if not isinstance(snap, Snapshot):
+            snap = normalize_snapshot(snap)
+        addr = addr.lower()
+        with self._lock:
+            self._cache[addr] = snap
+            self._missing.discard(addr)
+            self._dirty.add(addr)
+
+    def flush(self) -> int:
+        """Write all dirty wallets in a single transaction. Returns the number written."""
+        with metrics.time("signalbot_state_flush_seconds"):
+            n = self._flush()
+        if n:
+            metrics.inc("signalbot_state_rows_written_total", n)
+        return n
+
+    def _flush(self) -> int:
+        with self._lock:
+            if not self._dirty:
+                return 0
+            dirty = self._dirty
+            self._dirty = set()
+            rows = [
+                (addr, self._cache[addr].updated_at,
+                 json.dumps(self._cache[addr].to_state(), separators=(",", ":"), ensure_ascii=False))
+                for addr in dirty
+            ]
+        try:
+            with self._db_lock, self._conn:
+                self._conn.executemany("INSERT OR REPLACE INTO wallet_state VALUES (?, ?, ?)", rows)
+        except Exception as e:
+            logger.error("state flush failed: %s", e)
+            with self._lock:
+                self._dirty |= dirty
+            return 0
+        return len(rows)
+
+    def start_flusher(self, interval: float):
+        if interval <= 0 or self._flusher:
+            return
+        def loop():
+            while True:
+                time.sleep(interval)
+                self.flush()
+        self._flusher = threading.Thread(target=loop, name="state-flush", daemon=True)
+        self._flusher.start()
 
 def save_state():
-    _write_json(STATE_FILE, state)
+    app.state_store.flush()
 
 def get_wallet_state(addr: str) -> Dict[str, Any]:
-    return state.get(addr.lower(), {"tokens": {}, "positions": [], "usd_total": 0.0})
+    return app.state_store.get(addr) or {"tokens": {}, "positions": [], "usd_total": 0.0}
 
-def set_wallet_state(addr: str, snap: Dict[str, Any]):
-    state[addr.lower()] = snap
-    save_state()
+def get_wallet_snapshot(addr: str) -> Snapshot:
+    return app.state_store.get_snapshot(addr) or EMPTY_SNAPSHOT
 
-# ---------------- authorization ----------------
-authorized_chats: Set[int] = load_authorized_chats()
+def set_wallet_state(addr: str, snap: Union[Snapshot, Dict[str, Any]]):
+    app.state_store.set(addr, snap)
+    if STATE_FLUSH_INTERVAL <= 0:
+        save_state()
+
+# ---------------- history ----------------
+def encode_history_state(snap: Snapshot) -> Dict[str, Any]:
+    """Compact, JSON-able form of a snapshot; values are rounded to cents so float noise is no change."""
+    return {
+        "t": round(snap.usd_total, 2),
+        "k": {tok: round(v, 2) for tok, v in snap.tokens.items()},
+        "p": {f"{p.side}:{p.symbol or ''}": round(p.size_usd, 2) for p in snap.positions},
+    }
+
+def decode_history_state(state: Dict[str, Any]) -> Snapshot:
+    positions = []
+    for key, size in state["p"].items():
+        side, _, symbol = key.partition(":")
+        positions.append({"symbol": symbol or None, "side": side, "size_usd": size})
+    return normalize_snapshot({"usd_total": state["t"], "tokens": state["k"], "positions": positions, "source": "history"})
+
+def history_delta(prev: Dict[str, Any], now: Dict[str, Any]) -> Dict[str, Any]:
+    """What changed from prev to now: "k"/"p" hold changed or added entries, "kx"/"px" removed keys."""
+    delta: Dict[str, Any] = {}
+    if now["t"] != prev["t"]:
+        delta["t"] = now["t"]
+    for field in ("k", "p"):
+        old, new = prev[field], now[field]
+        changed = {key: v for key, v in new.items() if old.get(key) != v}
+        removed = [key for key in old if key not in new]
+        if changed:
+            delta[field] = changed
+        if removed:
+            delta[field + "x"] = removed
+    return delta
+
+def apply_history_delta(prev: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    state = {"t": delta.get("t", prev["t"]), "k": dict(prev["k"]), "p": dict(prev["p"])}
+    for field in ("k", "p"):
+        state[field].update(delta.get(field, {}))
+        for key in delta.get(field + "x", ()):
+            state[field].pop(key, None)
+    return state
+
+def _pack(obj: Dict[str, Any]) -> bytes:
+    return zlib.compress(json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+
+def _unpack(data: bytes) -> Dict[str, Any]:
+    return json.loads(zlib.decompress(data))
+
+@dataclass
+class _HistoryTail:
+    """The newest history entry of a wallet, kept in memory so appends need no reads."""
+    __slots__ = ("ts", "until", "key", "data", "state", "since_key")
+    ts: int              # ms, first time this state was seen
+    until: int           # ms, last time it was seen
+    key: bool            # keyframe (full state) or delta from the previous entry
+    data: bytes
+    state: Dict[str, Any]
+    since_key: int       # deltas since the last keyframe
+
+class HistoryStore:
+    """
+    Append-only history of wallet snapshots in SQLite, one table keyed by (wallet, ts).
+    An entry is stored only when a wallet's holdings change; an unchanged poll just
+    extends the newest entry's `until`, so quiet wallets cost one row however often they
+    are polled. Entries are zlib-compressed deltas from the previous entry with a full
+    keyframe every `keyframe_every` changes. Writes are buffered like StateStore's;
+    maintain() applies retention and thins old entries to one per bucket.
+
+    Offline use: HistoryStore(path).points(wallet) / .at(wallet, ts) / .snapshots(wallet).
+    """
+
+    def __init__(self, path: str, keyframe_every: int = 32):
+        self.path = path
+        self.keyframe_every = max(1, keyframe_every)
+        self._lock = threading.RLock()
+        self._db_lock = threading.Lock()
+        self._tails: Dict[str, Optional[_HistoryTail]] = {}
+        self._pending: Dict[Tuple[str, int], tuple] = {}   # (wallet, ts) -> row to upsert
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._db_lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS history ("
+                "wallet TEXT NOT NULL, ts INTEGER NOT NULL, until INTEGER NOT NULL, "
+                "key INTEGER NOT NULL, data BLOB NOT NULL, PRIMARY KEY (wallet, ts)) WITHOUT ROWID"
+            )
+
+    # ---- reading ----
+    def _rows(self, addr: str, since: Optional[int] = None, until: Optional[int] = None) -> List[tuple]:
+        """Rows from the last keyframe at or before `since` up to `until`, oldest first."""
+        q = "SELECT ts, until, key, data FROM history WHERE wallet = ?"
+        args: List[Any] = [addr]
+        if since is not None:
+            q += (" AND ts >= COALESCE((SELECT MAX(ts) FROM history WHERE wallet = ? AND key = 1 AND ts <= ?),"
+                  " (SELECT MIN(ts) FROM history WHERE wallet = ?))")
+            args += [addr, since, addr]
+        if until is not None:
+            q += " AND ts <= ?"
+            args.append(until)
+        with self._db_lock:
+            return self._conn.execute(q + " ORDER BY ts", args).fetchall()
+
+    @staticmethod
+    def _replay(rows: List[tuple]) -> Iterator[Tuple[int, int, bool, Dict[str, Any]]]:
+        state = None
+        for ts, until, key, data in rows:
+            obj = _unpack(data)
+            if key:
+                state = obj
+            elif state is None:
+                continue   # chain starts mid-way (should not happen after maintain())
+            else:
+                state = apply_history_delta(state, obj)
+            yield ts, until, bool(key), state
+
+    def _load_tail(self, addr: str) -> Optional[_HistoryTail]:
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT MAX(ts) FROM history WHERE wallet = ? AND key = 1", (addr,)).fetchone()
+        if not row or row[0] is None:
+            return None
+        rows = self._rows(addr, since=row[0])
+        tail = None
+        for n, (ts, until, key, state) in enumerate(self._replay(rows)):
+            tail = _HistoryTail(ts, until, key, rows[n][3], state, n)
+        return tail
+
+    def points(self, addr: str, since: Optional[float] = None,
+               until: Optional[float] = None) -> List[Tuple[float, float, Dict[str, Any]]]:
+        """(first seen, last seen, state) for each entry overlapping [since, until], in seconds, oldest first."""
+        addr = addr.lower()
+        self.flush()
+        lo = int(since * 1000) if since is not None else None
+        hi = int(until * 1000) if until is not None else None
+        return [
+            (ts / 1000, last / 1000, state)
+            for ts, last, _, state in self._replay(self._rows(addr, lo, hi))
+            if lo is None or last >= lo
+        ]
+
+    def at(self, addr: str, when: float) -> Optional[Snapshot]:
+        """What the wallet held at `when` (the newest entry first seen at or before it)."""
+        self.flush()
+        ms = int(when * 1000)
+        state = None
+        for _, _, _, state in self._replay(self._rows(addr.lower(), ms, ms)):
+            pass
+        return decode_history_state(state) if state is not None else None
+
+    def snapshots(self, addr: str, since: Optional[float] = None,
+                  until: Optional[float] = None) -> Iterator[Tuple[float, Snapshot]]:
+        """(time, Snapshot) per change, ready for diff_events() when replaying or backtesting."""
+        for ts, _, state in self.points(addr, since, until):
+            yield ts, decode_history_state(state)
+
+    def wallets(self) -> List[str]:
+        with self._db_lock:
+            return [r[0] for r in self._conn.execute("SELECT DISTINCT wallet FROM history")]
+
+    # ---- writing ----
+    def append(self, addr: str, snap: Snapshot, when: Optional[float] = None):
+        addr = addr.lower()
+        ts = int((when if when is not None else time.time()) * 1000)
+        state = encode_history_state(snap)
+        with self._lock:
+            if addr not in self._tails:
+                self._tails[addr] = self._load_tail(addr)
+            tail = self._tails[addr]
+            if tail is not None and ts <= tail.ts:
+                return   # clock went back or a stale poll finished late
+            if tail is not None and tail.state == state:
+                tail.until = ts
+            elif tail is None or tail.since_key + 1 >= self.keyframe_every:
+                tail = _HistoryTail(ts, ts, True, _pack(state), state, 0)
+            else:
+                tail = _HistoryTail(ts, ts, False, _pack(history_delta(tail.state, state)), state, tail.since_key + 1)
+            self._tails[addr] = tail
+            self._pending[(addr, tail.ts)] = (addr, tail.ts, tail.until, int(tail.key), tail.data)
+
+    def flush(self) -> int:
+        with self._lock:
+            if not self._pending:
+                return 0
+            pending, self._pending = self._pending, {}
+        rows = list(pending.values())
+        try:
+            with self._db_lock, self._conn:
+                self._conn.executemany("INSERT OR REPLACE INTO history VALUES (?, ?, ?, ?, ?)", rows)
+        except Exception as e:
+            logger.error("history flush failed: %s", e)
+            with self._lock:
+                for k, row in pending.items():
+                    self._pending.setdefault(k, row)
+            return 0
+        metrics.inc("signalbot_history_rows_written_total", len(rows))
+        return len(rows)
+
+    # ---- retention ----
+    def maintain(self, retention: float, downsample_after: float, bucket: float,
+                 now: Optional[float] = None, owns: Optional[Callable[[str], bool]] = None) -> int:
+        """
+        Drop entries last seen more than `retention` seconds ago and keep one entry per
+        `bucket` seconds among those older than `downsample_after`. Wallets that need it
+        are re-encoded from a fresh keyframe. With `owns`, only wallets it accepts are
+        touched (shards sharing one database each keep their own wallets' tails).
+        Returns the number of wallets rewritten.
+        """
+        now_ms = int((now if now is not None else time.time()) * 1000)
+        expire = now_ms - int(retention * 1000)
+        old = now_ms - int(downsample_after * 1000)
+        bucket_ms = max(1, int(bucket * 1000))
+        self.flush()
+        with self._db_lock:
+            wallets = [r[0] for r in self._conn.execute(
+                "SELECT wallet FROM history WHERE until < ? "
+                "UNION SELECT wallet FROM history WHERE ts < ? GROUP BY wallet, ts / ? HAVING COUNT(*) > 1",
+                (expire, old, bucket_ms))]
+        if owns is not None:
+            wallets = [addr for addr in wallets if owns(addr)]
+        for addr in wallets:
+            with self._lock:
+                self.flush()
+                kept: List[list] = []
+                for ts, until, _, state in self._replay(self._rows(addr)):
+                    if until < expire:
+                        continue
+                    if kept and ts < old and kept[-1][0] < old and kept[-1][0] // bucket_ms == ts // bucket_ms:
+                        # same old bucket: the bucket's entry spans both and shows the later state
+                        kept[-1][1:] = [until, state]
+                    else:
+                        kept.append([ts, until, state])
+                rows, prev = [], None
+                for n, (ts, until, state) in enumerate(kept):
+                    key = prev is None or n % self.keyframe_every == 0
+                    rows.append((addr, ts, until, int(key), _pack(state if key else history_delta(prev, state))))
+                    prev = state
+                with self._db_lock, self._conn:
+                    self._conn.execute("DELETE FROM history WHERE wallet = ?", (addr,))
+                    self._conn.executemany("INSERT INTO history VALUES (?, ?, ?, ?, ?)", rows)
+                self._tails.pop(addr, None)
+        if wallets:
+            logger.info("History maintenance rewrote %d wallets", len(wallets))
+        return len(wallets)
+
+    def start_flusher(self, interval: float, maintain_every: float = 3600.0):
+        def loop():
+            last_maintain = time.monotonic()
+            while True:
+                time.sleep(max(1.0, interval))
+                self.flush()
+                if time.monotonic() - last_maintain >= maintain_every:
+                    last_maintain = time.monotonic()
+                    try:
+                        self.maintain(HISTORY_RETENTION_DAYS * 86400, HISTORY_DOWNSAMPLE_AFTER * 3600,
+                                      HISTORY_DOWNSAMPLE_BUCKET, owns=polls_wallet)
+                    except Exception as e:
+                        logger.error("history maintenance failed: %s", e)
+        threading.Thread(target=loop, name="history-flush", daemon=True).start()
+
+def record_history(addr: str, snap: Snapshot):
+    if app.history is not None:
+        app.history.append(addr, snap)
+        if STATE_FLUSH_INTERVAL <= 0:
+            app.history.flush()
 
+# ---------------- authorization ----------------
 def authorize_chat(chat_id: int):
-    if chat_id not in authorized_chats:
-        authorized_chats.add(chat_id)
-        save_authorized_chats(authorized_chats)
+    app.authorized_chats.add(chat_id)
     return True
 
+# ---------------- subscriptions ----------------
+class SubscriptionRegistry(JsonFileRegistry):
+    """
+    Which chats follow which wallets, mirrored to a JSON object {chat_id: [wallet, ...]}.
+    A wallet -> chats index is kept next to it so routing a signal is one dict lookup.
+    """
+
+    unit = "chats"
+
+    def __init__(self, path: str, save_delay: float = 2.0, check_interval: float = 5.0):
+        self._by_chat: Dict[int, Dict[str, None]] = {}
+        self._by_wallet: Dict[str, Set[int]] = {}
+        self.existed = os.path.exists(path)
+        super().__init__(path, save_delay, check_interval)
+
+    def _load(self, data: Any):
+        by_chat = {int(chat): {_normalize_wallet(w): None for w in wallets} for chat, wallets in (data or {}).items()}
+        by_wallet: Dict[str, Set[int]] = {}
+        for chat, wallets in by_chat.items():
+            for w in wallets:
+                by_wallet.setdefault(w, set()).add(chat)
+        self._by_chat, self._by_wallet = by_chat, by_wallet
+
+    def _serialize(self) -> Any:
+        return {str(chat): list(wallets) for chat, wallets in self._by_chat.items() if wallets}
+
+    def _count(self) -> int:
+        return len(self._by_chat)
+
+    def subscribe_many(self, chat_id: int, addrs: List[str]) -> List[str]:
+        """Subscribe the chat to each wallet with a single persist; returns the newly subscribed ones."""
+        added = []
+        with self._lock:
+            self._maybe_reload()
+            mine = self._by_chat.setdefault(chat_id, {})
+            for addr in addrs:
+                addr = _normalize_wallet(addr)
+                if addr not in mine:
+                    mine[addr] = None
+                    self._by_wallet.setdefault(addr, set()).add(chat_id)
+                    added.append(addr)
+            if added:
+                self._changed()
+        return added
+
+    def unsubscribe(self, chat_id: int, addr: str) -> tuple:
+        """Returns (was subscribed, no chat follows the wallet any more)."""
+        addr = _normalize_wallet(addr)
+        with self._lock:
+            self._maybe_reload()
+            mine = self._by_chat.get(chat_id)
+            if not mine or addr not in mine:
+                return False, False
+            del mine[addr]
+            chats = self._by_wallet.get(addr, set())
+            chats.discard(chat_id)
+            if not chats:
+                self._by_wallet.pop(addr, None)
+            self._changed()
+            return True, not chats
+
+    def wallets_of(self, chat_id: int) -> List[str]:
+        with self._lock:
+            self._maybe_reload()
+            return list(self._by_chat.get(chat_id, ()))
+
+    def chats_for(self, addr: str) -> List[int]:
+        with self._lock:
+            self._maybe_reload()
+            return list(self._by_wallet.get(addr, ()))
+
+    def is_subscribed(self, chat_id: int, addr: str) -> bool:
+        with self._lock:
+            self._maybe_reload()
+            return _normalize_wallet(addr) in self._by_chat.get(chat_id, ())
+
+    def wallet_count(self) -> int:
+        with self._lock:
+            self._maybe_reload()
+            return len(self._by_wallet)
+
+def subscribe_wallets(chat_id: int, addrs: List[str]) -> List[str]:
+    """Subscribe a chat; wallets nobody polled before are added to the poll set and baselined."""
+    added = app.subscriptions.subscribe_many(chat_id, addrs)
+    new = [w for w in app.wallet_registry.add_many(added) if polls_wallet(w)]
+    if new:
+        prefetch_baselines(new)
+    return added
+
+def unsubscribe_wallet(chat_id: int, addr: str) -> bool:
+    """Unsubscribe a chat; a wallet no chat follows any more stops being polled."""
+    removed, orphaned = app.subscriptions.unsubscribe(chat_id, addr)
+    if orphaned and app.wallet_registry.remove(addr):
+        source_history.forget(addr)
+    return removed
+
 # ---------------- Telegram command handlers ----------------
 def cmd_add(update: Update, context: CallbackContext):
     chat_id = update.effective_chat.id
@@ -143,13 +1575,10 @@ def cmd_add(update: Update, context: CallbackContext):
         update.message.reply_text("Usage: /add <wallet_address>")
         return
     addr = context.args[0].strip().lower()
-    wallets = load_wallets()
-    if addr in wallets:
-        update.message.reply_text("آدرس قبلا وجود دارد.")
-    else:
-        wallets.append(addr)
-        save_wallets(wallets)
+    if subscribe_wallets(chat_id, [addr]):
         update.message.reply_text(f"آدرس {addr} اضافه شد ✅")
+    else:
+        update.message.reply_text("آدرس قبلا وجود دارد.")
 
 def cmd_remove(update: Update, context: CallbackContext):
     chat_id = update.effective_chat.id
@@ -158,10 +1587,7 @@ def cmd_remove(update: Update, context: CallbackContext):
         update.message.reply_text("Usage: /remove <wallet_address>")
         return
     addr = context.args[0].strip().lower()
-    wallets = load_wallets()
-    if addr in wallets:
-        wallets.remove(addr)
-        save_wallets(wallets)
+    if unsubscribe_wallet(chat_id, addr):
         update.message.reply_text(f"آدرس {addr} حذف شد ✅")
     else:
         update.message.reply_text("آدرس یافت نشد.")
@@ -169,14 +1595,36 @@ def cmd_remove(update: Update, context: CallbackContext):
 def cmd_list(update: Update, context: CallbackContext):
     chat_id = update.effective_chat.id
     authorize_chat(chat_id)
-    wallets = load_wallets()
+    wallets = app.subscriptions.wallets_of(chat_id)
     update.message.reply_text("فهرست کیف‌پول‌ها:\n" + ("\n".join(wallets) if wallets else "هیچ آدرسی ثبت نشده."))
 
 def cmd_status(update: Update, context: CallbackContext):
     chat_id = update.effective_chat.id
     authorize_chat(chat_id)
-    wallets = load_wallets()
-    update.message.reply_text(f"Bot running. Poll interval: {POLL_INTERVAL}s\nFollowed wallets: {len(wallets)}")
+    if ADAPTIVE_POLLING and BOT_ROLE == "telegram":
+        # the poller processes track the intervals; this one only writes the pins
+        poll = (f"Adaptive polling: {POLL_MIN_INTERVAL:.0f}..{POLL_MAX_INTERVAL:.0f}s, "
+                f"pinned {len(app.scheduler.overrides)} (intervals are tracked by the poller processes)")
+    elif ADAPTIVE_POLLING:
+        sm = app.scheduler.summary(time.time())
+        poll = (f"Adaptive polling: {POLL_MIN_INTERVAL:.0f}..{POLL_MAX_INTERVAL:.0f}s, "
+                f"intervals{' on this shard' if SHARD_COUNT > 1 else ''} min/median/max "
+                f"{sm['min'] or 0:.0f}/{sm['median'] or 0:.0f}/{sm['max'] or 0:.0f}s, "
+                f"overdue {sm['overdue']}, pinned {sm['overrides']}")
+    else:
+        poll = f"Poll interval: {POLL_INTERVAL}s"
+    if SHARD_COUNT > 1:
+        poll += f"\nShards: {SHARD_COUNT} (this process: {SHARD_INDEX}, role {BOT_ROLE})"
+    if STREAMING_ENABLED and BOT_ROLE != "telegram":
+        poll += (f"\nStreaming: {'connected' if app.position_stream.connected else 'disconnected'}, "
+                 f"{len(app.position_stream.subscribed)} wallets subscribed")
+    update.message.reply_text(
+        f"Bot running. {poll}\nFollowed wallets: {len(app.subscriptions.wallets_of(chat_id))} here, "
+        f"{len(app.wallet_registry)} polled in total\n\n"
+        + "Sources:\n" + "\n".join(source_status_lines())
+        + "\n\nCache:\n" + "\n".join(cache_status_lines())
+        + "\n\nMetrics:\n" + "\n".join(metrics_status_lines())
+    )
 
 def cmd_test(update: Update, context: CallbackContext):
     chat_id = update.effective_chat.id
@@ -185,6 +1633,9 @@ def cmd_test(update: Update, context: CallbackContext):
         update.message.reply_text("Usage: /test <wallet_address>")
         return
     addr = context.args[0].strip().lower()
+    if not app.subscriptions.is_subscribed(chat_id, addr):
+        update.message.reply_text("آدرس یافت نشد.")
+        return
     update.message.reply_text(f"Testing {addr} — checking sources...")
     # Run single fetch cycle for this wallet and report which sources returned data
     results = []
@@ -203,54 +1654,453 @@ def cmd_test(update: Update, context: CallbackContext):
         results.append(("DexScreener", bool(ds)))
     except Exception as e:
         results.append(("DexScreener", f"err:{e}"))
+    try:
+        hl = fetch_from_hyperliquid(addr)
+        results.append(("Hyperliquid", bool(hl)))
+    except Exception as e:
+        results.append(("Hyperliquid", f"err:{e}"))
     text = "\n".join(f"{k}: {v}" for k, v in results)
     update.message.reply_text("Test results:\n" + text)
 
-dispatcher.add_handler(CommandHandler("add", cmd_add, pass_args=True))
-dispatcher.add_handler(CommandHandler("remove", cmd_remove, pass_args=True))
-dispatcher.add_handler(CommandHandler("list", cmd_list))
-dispatcher.add_handler(CommandHandler("status", cmd_status))
-dispatcher.add_handler(CommandHandler("test", cmd_test, pass_args=True))
-dispatcher.add_handler(MessageHandler(Filters.text & ~Filters.command, lambda u, c: None))
+def _import_wallets(update: Update, text: str):
+    addrs, invalid = parse_wallet_list(text)
+    added = subscribe_wallets(update.effective_chat.id, addrs)
+    lines = [f"Added: {len(added)}", f"Already followed: {len(addrs) - len(added)}"]
+    if invalid:
+        sample = ", ".join(invalid[:5]) + (" ..." if len(invalid) > 5 else "")
+        lines.append(f"Invalid entries skipped: {len(invalid)} ({sample})")
+    update.message.reply_text("Import done ✅\n" + "\n".join(lines))
+
+def _read_document_text(update: Update, context: CallbackContext, document) -> Optional[str]:
+    if document.file_size and document.file_size > IMPORT_MAX_BYTES:
+        update.message.reply_text(f"File too large (max {IMPORT_MAX_BYTES // 1024} KB).")
+        return None
+    data = context.bot.get_file(document.file_id).download_as_bytearray()
+    return bytes(data).decode("utf-8", errors="replace")
+
+def cmd_addmany(update: Update, context: CallbackContext):
+    chat_id = update.effective_chat.id
+    authorize_chat(chat_id)
+    parts = (update.message.text or "").split(None, 1)
+    if len(parts) < 2:
+        update.message.reply_text("Usage: /addmany <addr> <addr> ... (spaces, commas or new lines)")
+        return
+    _import_wallets(update, parts[1])
+
+def cmd_import(update: Update, context: CallbackContext):
+    """/import <pasted list>, or /import as a reply to (or caption of) a .txt/.csv document."""
+    chat_id = update.effective_chat.id
+    authorize_chat(chat_id)
+    msg = update.message
+    document = msg.document or (msg.reply_to_message.document if msg.reply_to_message else None)
+    if document:
+        text = _read_document_text(update, context, document)
+        if text is not None:
+            _import_wallets(update, text)
+        return
+    parts = (msg.text or "").split(None, 1)
+    if len(parts) < 2:
+        msg.reply_text("Usage: send a .txt/.csv file with caption /import, reply /import to one, or /import <addr> ...")
+        return
+    _import_wallets(update, parts[1])
+
+def cmd_export(update: Update, context: CallbackContext):
+    chat_id = update.effective_chat.id
+    authorize_chat(chat_id)
+    wallets = app.subscriptions.wallets_of(chat_id)
+    if not wallets:
+        update.message.reply_text("هیچ آدرسی ثبت نشده.")
+        return
+    buf = io.BytesIO(("\n".join(wallets) + "\n").encode("utf-8"))
+    update.message.reply_document(document=buf, filename="wallets.txt", caption=f"{len(wallets)} wallets")
+
+def _history_line(ts: float, until: float, state: Dict[str, Any]) -> str:
+    when = datetime.fromtimestamp(ts, timezone.utc).strftime("%m-%d %H:%M")
+    held = f" (held {(until - ts) / 3600:.1f}h)" if until - ts >= 3600 else ""
+    top = sorted(state["p"].items(), key=lambda kv: -kv[1])[:2]
+    pos = ", ".join(f"{k.partition(':')[2]} {k.partition(':')[0].upper()} ${v:.0f}" for k, v in top)
+    return (f"{when} ${state['t']:.2f}, {len(state['k'])} tokens, {len(state['p'])} positions"
+            + (f" [{pos}]" if pos else "") + held)
+
+def cmd_history(update: Update, context: CallbackContext):
+    """/history <wallet> [hours] — the wallet's recorded changes (default: last 24h)."""
+    chat_id = update.effective_chat.id
+    authorize_chat(chat_id)
+    if not context.args:
+        update.message.reply_text("Usage: /history <wallet_address> [hours]")
+        return
+    if app.history is None:
+        update.message.reply_text("History is disabled (HISTORY_DB is empty).")
+        return
+    addr = context.args[0].strip().lower()
+    if not app.subscriptions.is_subscribed(chat_id, addr):
+        update.message.reply_text("آدرس یافت نشد.")
+        return
+    try:
+        hours = float(context.args[1]) if len(context.args) > 1 else 24.0
+    except ValueError:
+        update.message.reply_text("Hours must be a number.")
+        return
+    points = app.history.points(addr, since=time.time() - hours * 3600)
+    if not points:
+        update.message.reply_text(f"No history for {addr} in the last {hours:g}h.")
+        return
+    shown = points[-20:]
+    lines = [_history_line(*p) for p in shown]
+    more = f"\n... {len(points) - len(shown)} earlier changes" if len(points) > len(shown) else ""
+    update.message.reply_text(f"{addr} — {len(points)} states in the last {hours:g}h (UTC):{more}\n" + "\n".join(lines))
+
+def cmd_interval(update: Update, context: CallbackContext):
+    """/interval <wallet> [seconds|auto] — show or pin a wallet's poll interval (adaptive mode)."""
+    chat_id = update.effective_chat.id
+    authorize_chat(chat_id)
+    if not context.args:
+        update.message.reply_text("Usage: /interval <wallet_address> [seconds|auto]")
+        return
+    addr = context.args[0].strip().lower()
+    if not app.subscriptions.is_subscribed(chat_id, addr):
+        update.message.reply_text("آدرس یافت نشد.")
+        return
+    note = "" if ADAPTIVE_POLLING else "\n(adaptive polling is off; all wallets use POLL_INTERVAL)"
+    if len(context.args) < 2:
+        pinned = app.scheduler.overrides.get(addr)
+        if polls_wallet(addr):
+            cur = app.scheduler.interval_of(addr)
+            text = f"{addr}: interval {cur or POLL_INTERVAL:.0f}s" + (f" (pinned {pinned:.0f}s)" if pinned else " (auto)")
+        else:
+            # another process polls this wallet and tracks its current interval
+            text = (f"{addr}: " + (f"pinned {pinned:.0f}s" if pinned else "auto")
+                    + f" (polled by shard {shard_ring.owner(addr)})")
+        update.message.reply_text(text + note)
+        return
+    arg = context.args[1].strip().lower()
+    if arg == "auto":
+        app.scheduler.set_override(addr, None, time.time())
+        update.message.reply_text(f"{addr}: interval back to auto ✅" + note)
+        return
+    try:
+        seconds = float(arg)
+    except ValueError:
+        update.message.reply_text("Interval must be a number of seconds or 'auto'.")
+        return
+    if not POLL_MIN_INTERVAL <= seconds <= POLL_MAX_INTERVAL:
+        update.message.reply_text(
+            f"Interval must be between {POLL_MIN_INTERVAL:.0f} and {POLL_MAX_INTERVAL:.0f} seconds "
+            "(POLL_MIN_INTERVAL / POLL_MAX_INTERVAL).")
+        return
+    app.scheduler.set_override(addr, seconds, time.time())
+    update.message.reply_text(f"{addr}: interval pinned to {seconds:.0f}s ✅" + note)
+
+def register_handlers(dispatcher):
+    from telegram.ext import CommandHandler, MessageHandler, Filters
+    dispatcher.add_handler(CommandHandler("add", cmd_add, pass_args=True))
+    dispatcher.add_handler(CommandHandler("remove", cmd_remove, pass_args=True))
+    dispatcher.add_handler(CommandHandler("list", cmd_list))
+    dispatcher.add_handler(CommandHandler("status", cmd_status))
+    dispatcher.add_handler(CommandHandler("test", cmd_test, pass_args=True))
+    dispatcher.add_handler(CommandHandler("addmany", cmd_addmany))
+    dispatcher.add_handler(CommandHandler("import", cmd_import))
+    dispatcher.add_handler(CommandHandler("export", cmd_export))
+    dispatcher.add_handler(CommandHandler("interval", cmd_interval, pass_args=True))
+    dispatcher.add_handler(CommandHandler("history", cmd_history, pass_args=True))
+    dispatcher.add_handler(MessageHandler(Filters.document & Filters.caption_regex(r"^/import\b"), cmd_import))
+    dispatcher.add_handler(MessageHandler(Filters.text & ~Filters.command, lambda u, c: None))
+
+# ---------------- streaming parsers ----------------
+# HyperDash trader pages and DexScreener searches for busy wallets run to megabytes. They are
+# read in chunks and only the part we need is decoded, so concurrent fetches don't each hold
+# the whole body, its decoded text and a full JSON tree at once.
+STREAM_CHUNK_SIZE = 64 * 1024
+_NEXT_DATA_OPEN_RE = re.compile(r'<script id="__NEXT_DATA__" type="application/json">')
+_PAIRS_KEY_RE = re.compile(r'"pairs"\s*:\s*')
+_JSON_WS_RE = re.compile(r"\s*")
+# everything up to the next bracket, whole strings included (a string cut off by the chunk end stops it)
+_JSON_SKIP_RE = re.compile(r'(?:[^"\[\]{}]+|"[^"\\]*(?:\\.[^"\\]*)*")*', re.S)
+_JSON_STRING_BODY_RE = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*', re.S)
+_JSON_DECODER = json.JSONDecoder()
+
+def iter_text_chunks(r: requests.Response, encoding: Optional[str] = None,
+                     max_bytes: int = SCRAPE_MAX_BYTES) -> Iterator[str]:
+    """Decode a stream=True response chunk by chunk. Raises ValueError past `max_bytes`."""
+    try:
+        decoder = codecs.getincrementaldecoder(encoding or r.encoding or "utf-8")(errors="replace")
+    except LookupError:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    total = 0
+    for chunk in r.iter_content(STREAM_CHUNK_SIZE):
+        total += len(chunk)
+        if total > max_bytes:
+            raise ValueError(f"response body larger than {max_bytes} bytes")
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+def seek_pattern(chunks: Iterator[str], pattern: "re.Pattern", keep: int = 256) -> Optional[Iterator[str]]:
+    """
+    Advance a text stream past the first match of `pattern` (shorter than `keep`) and return
+    the rest of the stream, or None if it never matches. Text before the match is dropped.
+    """
+    chunks = iter(chunks)
+    buf = ""
+    for text in chunks:
+        buf = buf[-keep:] + text
+        m = pattern.search(buf)
+        if m:
+            return itertools.chain((buf[m.end():],), chunks)
+    return None
+
+class _ContainerEnd:
+    """
+    Finds where a JSON array/object ends, fed one chunk at a time: tracks bracket depth
+    and string state across chunk boundaries, jumping from bracket to bracket with a
+    regex instead of stepping through every character.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False    # the previous chunk ended on a backslash inside a string
+
+    def feed(self, text: str, i: int = 0) -> Optional[int]:
+        """Offset just past the closing bracket in `text`, or None if it hasn't arrived yet."""
+        n = len(text)
+        while i < n:
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                    i += 1
+                    continue
+                i = _JSON_STRING_BODY_RE.match(text, i).end()
+                if i >= n:
+                    return None
+                if text[i] == "\\":   # only left unmatched at the very end of the chunk
+                    self.escaped = True
+                    return None
+                self.in_string = False
+                i += 1
+                continue
+            i = _JSON_SKIP_RE.match(text, i).end()
+            if i >= n:
+                return None
+            c = text[i]
+            i += 1
+            if c == '"':    # a string the chunk cuts off
+                self.in_string = True
+            elif c in "[{":
+                self.depth += 1
+            else:
+                self.depth -= 1
+                if self.depth == 0:
+                    return i
+        return None
+
+class JsonStream:
+    """
+    Pull reader over a JSON document arriving as text chunks, for decoding only the parts
+    we need. Consumed text is dropped as it goes, so memory stays around one chunk plus the
+    largest single value decoded; containers being skipped are read one member at a time.
+    An array or object is collected until its closing bracket arrives and decoded once.
+    """
+
+    def __init__(self, chunks: Iterator[str]):
+        self._chunks = iter(chunks)
+        self._buf = ""
+        self._pos = 0
+
+    def _more(self) -> bool:
+        text = next(self._chunks, None)
+        if text is None:
+            return False
+        self._buf = self._buf[self._pos:] + text
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace character without consuming it ('' at end of input)."""
+        while True:
+            self._pos = _JSON_WS_RE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._more():
+                return ""
+
+    def expect(self, c: str):
+        if self.peek() != c:
+            raise ValueError(f"expected {c!r} in JSON stream")
+        self._pos += 1
+
+    def _container(self) -> Any:
+        # chunks are only collected (not concatenated) until the closing bracket is in
+        scanner = _ContainerEnd()
+        parts = [self._buf]
+        found = scanner.feed(self._buf, self._pos)
+        while found is None:
+            text = next(self._chunks, None)
+            if text is None:
+                raise ValueError("unexpected end of JSON stream")
+            parts.append(text)
+            found = scanner.feed(text)
+        if len(parts) > 1:
+            self._buf = "".join(parts)
+        value, self._pos = _JSON_DECODER.raw_decode(self._buf, self._pos)
+        return value
+
+    def value(self) -> Any:
+        """Decode the next complete value."""
+        if self.peek() in ("[", "{"):
+            return self._container()
+        while True:
+            if not self.peek():
+                raise ValueError("unexpected end of JSON stream")
+            try:
+                value, end = _JSON_DECODER.raw_decode(self._buf, self._pos)
+            except ValueError:
+                if not self._more():
+                    raise
+                continue
+            # a number cut by the chunk boundary ("12" of "12.5") decodes too early,
+            # so only accept a value once the separator after it has arrived
+            nxt = _JSON_WS_RE.match(self._buf, end).end()
+            if self._buf[nxt:nxt + 1] in (",", ":", "]", "}") or not self._more():
+                self._pos = end
+                return value
+
+    def _close(self, closing: str) -> bool:
+        c = self.peek()
+        self._pos += 1
+        if c == closing:
+            return True
+        if c != ",":
+            raise ValueError(f"expected ',' or {closing!r} in JSON stream")
+        return False
+
+    def items(self) -> Iterator[Any]:
+        """Decode an array one element at a time."""
+        self.expect("[")
+        if self.peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield self.value()
+            if self._close("]"):
+                return
+
+    def keys(self) -> Iterator[str]:
+        """Iterate an object's keys; consume each value (value() or skip()) before the next key."""
+        self.expect("{")
+        if self.peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+            if self._close("}"):
+                return
+
+    def skip(self):
+        c = self.peek()
+        if c == "[":
+            for _ in self.items():
+                pass
+        elif c == "{":
+            for _ in self.keys():
+                self.value()
+        else:
+            self.value()
+
+    def find(self, path: Tuple[str, ...]) -> Any:
+        """Decode only the value at `path` (nested object keys); None if it isn't there."""
+        for key in path:
+            if self.peek() != "{":
+                return None
+            for name in self.keys():
+                if name == key:
+                    break
+                self.skip()
+            else:
+                return None
+        return self.value()
+
+def parse_dexscreener_pairs(r: requests.Response) -> Dict[str, float]:
+    """Streaming parser: liquidity (usd) per base token symbol over a search's `pairs`."""
+    tokens: Dict[str, float] = {}
+    rest = seek_pattern(iter_text_chunks(r, "utf-8"), _PAIRS_KEY_RE)
+    if rest is None:
+        return tokens
+    stream = JsonStream(rest)
+    if stream.peek() != "[":  # "pairs": null
+        return tokens
+    for p in stream.items():
+        if not isinstance(p, dict):
+            continue
+        base = (p.get("baseToken") or {}).get("symbol")
+        if not base:
+            continue
+        try:
+            liquidity = float((p.get("liquidity") or {}).get("usd") or 0)
+        except Exception:
+            liquidity = 0
+        tokens[base] = tokens.get(base, 0.0) + liquidity
+    return tokens
+
+def parse_hyperdash_positions(r: requests.Response) -> List[Dict[str, Any]]:
+    """Streaming parser: positions from the trader object in a HyperDash page's __NEXT_DATA__."""
+    rest = seek_pattern(iter_text_chunks(r), _NEXT_DATA_OPEN_RE)
+    if rest is None:
+        return []
+    # the script body is the JSON document; stop reading once the trader object is decoded
+    trader = JsonStream(rest).find(("props", "pageProps", "trader"))
+    if not isinstance(trader, dict):
+        return []
+    positions = []
+    raw_positions = trader.get("positions") or []
+    if isinstance(raw_positions, dict):
+        raw_positions = list(raw_positions.values())
+    for p in raw_positions:
+        try:
+            symbol = p.get("symbol") or p.get("asset") or p.get("market")
+            size_usd = float(p.get("notional") or p.get("sizeUsd") or p.get("size") or 0)
+            side = p.get("side") or ("long" if p.get("isLong") else "short" if p.get("isShort") else "")
+            if size_usd >= MIN_POSITION_VALUE_USD:
+                positions.append({"symbol": symbol, "size_usd": size_usd, "side": side})
+        except Exception:
+            continue
+    return positions
 
 # ---------------- fetchers ----------------
 # Note: APIs change over time. These functions try a few endpoints and return normalized snapshots.
-DEXSCREENER_API = "https://api.dexscreener.com/latest/dex/search?q="
-DEBANK_API = "https://api.debank.com/user/total_balance?id="
-COINGLASS_BASE = "https://open-api-v4.coinglass.com"
-HYPERDASH_BASE = "https://hyperdash.info"
+# Base URLs can be pointed elsewhere (e.g. the bench/ fake upstream) through the environment.
+DEXSCREENER_API = os.environ.get("DEXSCREENER_API", "https://api.dexscreener.com/latest/dex/search?q=")
+DEBANK_API = os.environ.get("DEBANK_API", "https://api.debank.com/user/total_balance?id=")
+COINGLASS_BASE = os.environ.get("COINGLASS_BASE", "https://open-api-v4.coinglass.com")
+HYPERDASH_BASE = os.environ.get("HYPERDASH_BASE", "https://hyperdash.info")
+HYPERLIQUID_API = os.environ.get("HYPERLIQUID_API", "https://api.hyperliquid.xyz/info")
 
+@timed_fetcher("dexscreener")
 def fetch_from_dexscreener_addr(address: str) -> Optional[Dict[str, Any]]:
     """
     Dexscreener search for address; returns list of token-like entries with liquidity (usd)
     """
     try:
-        r = SESSION.get(DEXSCREENER_API + address, timeout=REQUEST_TIMEOUT)
-        r.raise_for_status()
-        j = r.json()
-        pairs = j.get("pairs") or []
-        tokens = {}
-        for p in pairs:
-            base = (p.get("baseToken") or {}).get("symbol")
-            if not base:
-                continue
-            try:
-                liquidity = float((p.get("liquidity") or {}).get("usd") or 0)
-            except Exception:
-                liquidity = 0
-            tokens[base] = tokens.get(base, 0.0) + liquidity
+        tokens = source_get("dexscreener", DEXSCREENER_API + address, parse=parse_dexscreener_pairs,
+                            timeout=REQUEST_TIMEOUT)
         if tokens:
-            return {"address": address, "tokens": tokens, "source": "dexscreener"}
+            return {"address": address, "tokens": dict(tokens), "source": "dexscreener"}
     except Exception as e:
         logger.debug("dexscreener err %s", e)
     return None
 
+@timed_fetcher("debank")
 def fetch_from_debank(address: str) -> Optional[Dict[str, Any]]:
     """
     Try DeBank total and assets if available.
     """
     try:
-        r = SESSION.get(DEBANK_API + address, timeout=REQUEST_TIMEOUT)
+        r = source_get("debank", DEBANK_API + address, timeout=REQUEST_TIMEOUT)
         r.raise_for_status()
         j = r.json()
         total = float(((j.get("data") or {}).get("total_usd_value")) or 0)
@@ -271,6 +2121,7 @@ def fetch_from_debank(address: str) -> Optional[Dict[str, Any]]:
         logger.debug("debank err %s", e)
     return None
 
+@timed_fetcher("coinglass")
 def fetch_from_coinglass(address: str) -> Optional[Dict[str, Any]]:
     """
     Use CoinGlass endpoints:
@@ -287,7 +2138,7 @@ def fetch_from_coinglass(address: str) -> Optional[Dict[str, Any]]:
     try:
         # exchange assets
         url_ex = f"{COINGLASS_BASE}/api/exchange/assets"
-        r = SESSION.get(url_ex, params={"wallet_address": address}, headers=headers, timeout=REQUEST_TIMEOUT)
+        r = source_get("coinglass", url_ex, params={"wallet_address": address}, headers=headers, timeout=REQUEST_TIMEOUT)
         if r.ok:
             j = r.json()
             if j.get("code") in (0, "0") and j.get("data"):
@@ -302,7 +2153,7 @@ def fetch_from_coinglass(address: str) -> Optional[Dict[str, Any]]:
                         usd_total += bal_usd
         # hyperliquid / futures positions
         url_hl = f"{COINGLASS_BASE}/api/hyperliquid/position"
-        r2 = SESSION.get(url_hl, params={"user": address}, headers=headers, timeout=REQUEST_TIMEOUT)
+        r2 = source_get("coinglass", url_hl, params={"user": address}, headers=headers, timeout=REQUEST_TIMEOUT)
         if r2.ok:
             j2 = r2.json()
             if j2.get("code") in (0, "0") and j2.get("data"):
@@ -323,45 +2174,150 @@ def fetch_from_coinglass(address: str) -> Optional[Dict[str, Any]]:
         logger.debug("coinglass err %s", e)
     return None
 
+@timed_fetcher("hyperdash")
 def fetch_from_hyperdash(address: str) -> Optional[Dict[str, Any]]:
     """
     Try to scrape HyperDash trader page to extract positions (best-effort).
     """
     try:
         url = f"{HYPERDASH_BASE}/trader/{address}"
-        r = SESSION.get(url, timeout=REQUEST_TIMEOUT)
-        if r.ok and r.text:
-            # try to find JSON in __NEXT_DATA__ or window.__INITIAL_STATE__
-            import re, json as _json
-            m = re.search(r'<script id="__NEXT_DATA__" type="application/json">(.+?)</script>', r.text, re.S)
-            if m:
-                try:
-                    data = _json.loads(m.group(1))
-                    # navigate to trader positions if possible
-                    trader = data.get("props", {}).get("pageProps", {}).get("trader")
-                    if trader:
-                        positions = []
-                        raw_positions = trader.get("positions") or []
-                        if isinstance(raw_positions, dict):
-                            raw_positions = list(raw_positions.values())
-                        for p in raw_positions:
-                            try:
-                                symbol = p.get("symbol") or p.get("asset") or p.get("market")
-                                size_usd = float(p.get("notional") or p.get("sizeUsd") or p.get("size") or 0)
-                                side = p.get("side") or ("long" if p.get("isLong") else "short" if p.get("isShort") else "")
-                                if size_usd >= MIN_POSITION_VALUE_USD:
-                                    positions.append({"symbol": symbol, "size_usd": size_usd, "side": side})
-                            except Exception:
-                                continue
-                        if positions:
-                            return {"address": address, "positions": positions, "source": "hyperdash"}
-                except Exception:
-                    pass
+        positions = source_get("hyperdash", url, parse=parse_hyperdash_positions, timeout=REQUEST_TIMEOUT)
+        if positions:
+            return {"address": address, "positions": [dict(p) for p in positions], "source": "hyperdash"}
     except Exception as e:
         logger.debug("hyperdash err %s", e)
     return None
 
+def parse_clearinghouse_state(address: str, j: Dict[str, Any], allow_empty: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Normalize a Hyperliquid clearinghouseState payload into the {symbol, size_usd, side} position shape.
+    With allow_empty a wallet without open positions yields an empty snapshot instead of None.
+    """
+    positions = []
+    for item in j.get("assetPositions") or []:
+        p = item.get("position") or {}
+        try:
+            szi = float(p.get("szi") or 0)
+            size_usd = abs(float(p.get("positionValue") or 0))
+        except (TypeError, ValueError):
+            continue
+        if szi and size_usd >= MIN_POSITION_VALUE_USD:
+            positions.append({"symbol": p.get("coin"), "size_usd": size_usd, "side": "long" if szi > 0 else "short"})
+    if positions or allow_empty:
+        return {"address": address, "positions": positions, "source": "hyperliquid"}
+    return None
+
+@timed_fetcher("hyperliquid")
+def fetch_from_hyperliquid(address: str) -> Optional[Dict[str, Any]]:
+    """
+    Futures positions straight from the Hyperliquid info API (clearinghouseState):
+    one small JSON document instead of a HyperDash page.
+    """
+    try:
+        r = source_post("hyperliquid", HYPERLIQUID_API, json={"type": "clearinghouseState", "user": address},
+                        timeout=REQUEST_TIMEOUT)
+        r.raise_for_status()
+        return parse_clearinghouse_state(address, r.json())
+    except Exception as e:
+        logger.debug("hyperliquid err %s", e)
+    return None
+
 # ---------------- detection logic ----------------
+# Sources in priority order. CoinGlass (exchange + futures) first, then DeBank,
+# DexScreener (liquidity view), the Hyperliquid info API and the HyperDash scrape
+# (trader positions).
+SNAPSHOT_SOURCES = [
+    ("coinglass", fetch_from_coinglass),
+    ("debank", fetch_from_debank),
+    ("dexscreener", fetch_from_dexscreener_addr),
+    ("hyperliquid", fetch_from_hyperliquid),
+    ("hyperdash", fetch_from_hyperdash),
+]
+
+def prefetch_hyperliquid(wallets: List[str]) -> int:
+    """
+    Start clearinghouseState queries for the wallets that will need them this cycle, all at
+    once (bounded by HYPERLIQUID_CONCURRENCY and the source's rate limit). Results land in the
+    response cache, so process_wallet picks them up (or joins the in-flight request) instead
+    of paying one round trip per wallet inside the worker pool. Returns the number started.
+    """
+    if "hyperliquid" in DISABLED_SOURCES or not HYPERLIQUID_PREFETCH:
+        return 0
+    if RESPONSE_CACHE.ttls.get("hyperliquid", 0.0) <= 0:
+        return 0  # nothing to hand the results over with
+    if FETCH_MODE in ("parallel", "merge"):
+        todo = wallets
+    else:
+        # sequential mode only reaches Hyperliquid for wallets the earlier sources do not cover
+        todo = []
+        for w in wallets:
+            prev = app.state_store.get_snapshot(w)
+            if prev is not None and prev.source and ("hyperliquid" in prev.source or "hyperdash" in prev.source):
+                todo.append(w)
+    for w in todo:
+        app.hyperliquid_pool.submit(fetch_from_hyperliquid, w)
+    return len(todo)
+
+def enabled_sources() -> List[tuple]:
+    return [(name, fn) for name, fn in SNAPSHOT_SOURCES if name not in DISABLED_SOURCES]
+
+def merge_snapshots(snaps: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Merge snapshots given in priority order: for tokens, positions (by symbol+side)
+    and usd_total the highest-priority source that reports a value wins.
+    """
+    if not snaps:
+        return None
+    if len(snaps) == 1:
+        return snaps[0]
+    tokens: Dict[str, Any] = {}
+    for sn in reversed(snaps):
+        tokens.update(sn.get("tokens") or {})
+    positions = []
+    seen = set()
+    for sn in snaps:
+        for p in sn.get("positions") or []:
+            key = (p.get("symbol"), (p.get("side") or "").lower())
+            if key not in seen:
+                seen.add(key)
+                positions.append(p)
+    usd_total = next((sn["usd_total"] for sn in snaps if sn.get("usd_total") is not None), 0.0)
+    return {
+        "address": snaps[0].get("address"),
+        "usd_total": usd_total,
+        "tokens": tokens,
+        "positions": positions,
+        "source": "+".join(sn.get("source", "?") for sn in snaps),
+    }
+
+def _fetch_fanout(addr: str, merge: bool) -> Optional[Dict[str, Any]]:
+    """
+    Query all enabled sources at once. Results are consumed in priority order, so the
+    call returns as soon as every higher-priority source has answered or failed;
+    slower calls are cancelled if not started yet and otherwise ignored.
+    """
+    futures = [(name, app.fanout_pool.submit(fn, addr)) for name, fn in enabled_sources()]
+    deadline = time.monotonic() + FETCH_BUDGET
+    results = []
+    try:
+        for name, f in futures:
+            try:
+                res = f.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FuturesTimeout:
+                logger.debug("%s exceeded fetch budget for %s", name, addr)
+                continue
+            except Exception as e:
+                logger.debug("%s fetch err %s", name, e)
+                continue
+            if res:
+                if not merge:
+                    return res
+                results.append(res)
+    finally:
+        for _, f in futures:
+            f.cancel()
+    return merge_snapshots(results)
+
 def detect_and_build_snapshots(addr: str) -> Optional[Dict[str, Any]]:
     """
     Try multiple sources in priority order and return a unified snapshot:
@@ -372,149 +2328,1299 @@ def detect_and_build_snapshots(addr: str) -> Optional[Dict[str, Any]]:
       "positions": [{symbol, size_usd, side}, ...],
       "source": "..."
     }
+    FETCH_MODE=parallel queries the sources concurrently (first by priority wins),
+    FETCH_MODE=merge combines every source that answered within FETCH_BUDGET.
     """
-    # Try CoinGlass (exchange + futures) first if available
-    cg = fetch_from_coinglass(addr)
-    if cg:
-        return cg
-    # Then DeBank
-    db = fetch_from_debank(addr)
-    if db:
-        return db
-    # Dexscreener (liquidity view)
-    ds = fetch_from_dexscreener_addr(addr)
-    if ds:
-        return ds
-    # HyperDash (trader positions)
-    hd = fetch_from_hyperdash(addr)
-    if hd:
-        return hd
+    if FETCH_MODE in ("parallel", "merge"):
+        return _fetch_fanout(addr, merge=FETCH_MODE == "merge")
+    for _, fetch in enabled_sources():
+        snap = fetch(addr)
+        if snap:
+            return snap
     return None
 
-def compare_and_generate_events(addr: str, snap: Dict[str, Any]) -> List[str]:
+@dataclass
+class Event:
+    """One detected change. text() renders the signal line."""
+    __slots__ = ("kind", "subject", "side", "before", "after", "source")
+    kind: str                # new_token | buy | sell | balance | open | increase | close
+    subject: Optional[str]   # token or position symbol (None for balance)
+    side: str                # position side, "" otherwise
+    before: float
+    after: float
+    source: Optional[str]
+
+    def text(self, addr: str) -> str:
+        k, sym, src = self.kind, self.subject, self.source
+        if k == "new_token":
+            return f"📥 New token detected: {sym} — approx ${self.after:.2f} (source: {src})"
+        if k == "buy":
+            return f"🟢 BUY detected: {sym} increased ${self.before:.2f} → ${self.after:.2f} (wallet: {addr}, src: {src})"
+        if k == "sell":
+            return f"🔴 SELL detected: {sym} decreased ${self.before:.2f} → ${self.after:.2f} (wallet: {addr}, src: {src})"
+        if k == "balance":
+            return (f"ℹ️ Balance change: ${self.before:.2f} → ${self.after:.2f} "
+                    f"(diff ${self.after - self.before:+.2f}) (src: {src})")
+        if k == "open":
+            return f"⚡ Position OPEN: {sym} {self.side.upper()} ${self.after:.0f} (src: {src})"
+        if k == "increase":
+            return f"⚡ Position INCREASE: {sym} {self.side.upper()} ${self.before:.0f} → ${self.after:.0f} (src: {src})"
+        return f"⚡ Position CLOSED: {sym} {self.side.upper()} (was ${self.before:.0f}) (src: {src})"
+
+    def signature(self, addr: str) -> tuple:
+        """Identity for dedupe: same wallet, kind, subject and (rounded) values."""
+        return (addr, self.kind, self.subject, self.side, round(self.before), round(self.after))
+
+def _token_move_is_noise(before: float, after: float) -> bool:
+    return abs(after - before) < max(1.0, 0.02 * max(before, after))
+
+def _balance_move_is_noise(before: float, after: float) -> bool:
+    return abs(after - before) < max(5.0, 0.05 * max(1.0, before))
+
+def diff_events(prev: Snapshot, now: Snapshot) -> List[Event]:
     """
-    Compare snap with previous state and generate human-readable event strings.
+    Events for the change prev -> now.
+    All lookups are map based, so this is linear in the number of tokens and positions.
     """
-    events: List[str] = []
-    prev = get_wallet_state(addr)
-    prev_tokens = prev.get("tokens", {}) or {}
-    prev_positions = prev.get("positions", []) or []
-    prev_total = float(prev.get("usd_total") or 0.0)
-
-    now_tokens = snap.get("tokens", {}) or {}
-    now_positions = snap.get("positions", []) or []
-    now_total = float(snap.get("usd_total") or 0.0)
+    events: List[Event] = []
+    src = now.source
+    prev_tokens = prev.tokens
+    now_tokens = now.tokens
+    prev_total = prev.usd_total
+    now_total = now.usd_total
 
     # 1) New token detection (token present now but not before)
     for tok, val in now_tokens.items():
-        if tok not in prev_tokens and (val or 0) >= MIN_POSITION_VALUE_USD:
-            events.append(f"📥 New token detected: {tok} — approx ${val:.2f} (source: {snap.get('source')})")
+        if tok not in prev_tokens and val >= MIN_POSITION_VALUE_USD:
+            events.append(Event("new_token", tok, "", 0.0, val, src))
 
     # 2) Buy / Sell detection via per-token delta
-    # We interpret increase in USD value as buy, decrease as sell (best-effort)
-    for tok in set(list(prev_tokens.keys()) + list(now_tokens.keys())):
-        prev_val = float(prev_tokens.get(tok) or 0)
-        now_val = float(now_tokens.get(tok) or 0)
+    # We interpret increase in USD value as buy (or received), decrease as sell (or transferred out)
+    for tok in [*prev_tokens, *(t for t in now_tokens if t not in prev_tokens)]:
+        prev_val = prev_tokens.get(tok, 0.0)
+        now_val = now_tokens.get(tok, 0.0)
         # ignore tiny noise
-        if abs(now_val - prev_val) < max(1.0, 0.02 * max(prev_val, now_val)):
+        if _token_move_is_noise(prev_val, now_val):
             continue
-        if now_val > prev_val:
-            # buy (or received)
-            events.append(f"🟢 BUY detected: {tok} increased ${prev_val:.2f} → ${now_val:.2f} (wallet: {addr}, src: {snap.get('source')})")
-        else:
-            # sell (or transferred out)
-            # if now_val is near zero and prev_val was significant -> token sold/removed
-            events.append(f"🔴 SELL detected: {tok} decreased ${prev_val:.2f} → ${now_val:.2f} (wallet: {addr}, src: {snap.get('source')})")
+        events.append(Event("buy" if now_val > prev_val else "sell", tok, "", prev_val, now_val, src))
 
     # 3) Balance change overall
-    if abs(now_total - prev_total) >= max(5.0, 0.05 * max(1.0, prev_total)):
-        events.append(f"ℹ️ Balance change: ${prev_total:.2f} → ${now_total:.2f} (diff ${now_total - prev_total:+.2f}) (src: {snap.get('source')})")
-
-    # 4) Futures positions: open/close/size change/direction change
-    # Build map of prev positions by (symbol, side)
-    prev_map = { (p.get("symbol"), (p.get("side") or "").lower()): p for p in prev_positions }
-    for p in now_positions:
-        sym = p.get("symbol")
-        side = (p.get("side") or "").lower()
-        size = float(p.get("size_usd") or 0)
-        key = (sym, side)
-        if key not in prev_map and size >= MIN_POSITION_VALUE_USD:
-            events.append(f"⚡ Position OPEN: {sym} {side.upper()} ${size:.0f} (src: {snap.get('source')})")
+    if not _balance_move_is_noise(prev_total, now_total):
+        events.append(Event("balance", None, "", prev_total, now_total, src))
+
+    # 4) Futures positions: open/increase, keyed by (symbol, side)
+    prev_map = prev.position_map
+    for p in now.positions:
+        old = prev_map.get(p.key)
+        if old is None and p.size_usd >= MIN_POSITION_VALUE_USD:
+            events.append(Event("open", p.symbol, p.side, 0.0, p.size_usd, src))
         else:
-            prev_size = float(prev_map.get(key, {}).get("size_usd") or 0)
-            if size > prev_size * 1.05 and size >= MIN_POSITION_VALUE_USD:
-                events.append(f"⚡ Position INCREASE: {sym} {side.upper()} ${prev_size:.0f} → ${size:.0f} (src: {snap.get('source')})")
+            prev_size = old.size_usd if old is not None else 0.0
+            if p.size_usd > prev_size * 1.05 and p.size_usd >= MIN_POSITION_VALUE_USD:
+                events.append(Event("increase", p.symbol, p.side, prev_size, p.size_usd, src))
 
     # detect closed positions: existed before but not present now (by symbol+side)
-    for pp in prev_positions:
-        key = (pp.get("symbol"), (pp.get("side") or "").lower())
-        found = False
-        for p in now_positions:
-            if p.get("symbol") == key[0] and (p.get("side") or "").lower() == key[1]:
-                found = True
-                break
-        if not found:
-            events.append(f"⚡ Position CLOSED: {key[0]} {key[1].upper()} (was ${pp.get('size_usd'):.0f}) (src: {snap.get('source')})")
+    now_map = now.position_map
+    for pp in prev.positions:
+        if pp.key not in now_map:
+            events.append(Event("close", pp.symbol, pp.side, pp.size_usd, 0.0, src))
 
     return events
 
+def diff_snapshots(addr: str, prev: Snapshot, now: Snapshot) -> List[str]:
+    """Generate human-readable event strings for the change prev -> now."""
+    return [e.text(addr) for e in diff_events(prev, now)]
+
+_np: Any = False   # numpy module once imported, None if unavailable
+
+def _numpy():
+    global _np
+    if _np is False:
+        try:
+            import numpy
+            _np = numpy
+        except ImportError:
+            logger.warning("batch detection needs numpy; detecting events per wallet")
+            _np = None
+    return _np
+
+_NO_POSITION = Position(None, "", 0.0)
+
+def diff_events_batch(pairs: List[Tuple[Snapshot, Snapshot]]) -> List[List[Event]]:
+    """
+    diff_events for many (prev, now) pairs at once, with identical output.
+    Tokens and positions of all pairs are laid out as flat rows, every threshold is
+    evaluated as one array operation, and Event objects are built only for the rows
+    that cross one. Pairs whose tokens are unchanged contribute no token rows at all.
+    Without numpy this is the per-pair loop.
+    """
+    np = _numpy()
+    if np is None or not pairs:
+        return [diff_events(prev, now) for prev, now in pairs]
+    out: List[List[Event]] = [[] for _ in pairs]
+    sources = [now.source for _, now in pairs]
+
+    # token rows, per pair in diff_events' order: previous tokens, then tokens new in `now`
+    keys: List[str] = []
+    before: List[float] = []
+    after: List[float] = []
+    segments: List[int] = []      # alternating row counts: previous tokens, new tokens
+    for prev, now in pairs:
+        pt, nt = prev.tokens, now.tokens
+        if pt == nt and math.isfinite(sum(nt.values())):
+            # equal finite values are always below the noise threshold (NaN and inf are not)
+            segments += (0, 0)
+            continue
+        new = [tok for tok in nt if tok not in pt] if pt.keys() != nt.keys() else []
+        keys += pt
+        keys += new
+        before += pt.values()
+        before += [0.0] * len(new)
+        after += map(nt.get, pt, itertools.repeat(0.0, len(pt)))
+        after += map(nt.__getitem__, new)
+        segments += (len(pt), len(new))
+    if keys:
+        owner = np.repeat(np.arange(len(pairs)), np.asarray(segments).reshape(-1, 2).sum(axis=1))
+        is_new = np.repeat(np.tile([False, True], len(pairs)), segments)
+        b = np.asarray(before)
+        a = np.asarray(after)
+        # thresholds are written as not(noise), like diff_events, so NaN/inf moves count;
+        # inf - inf is expected to give NaN here
+        with np.errstate(invalid="ignore"):
+            new_rows = is_new & (a >= MIN_POSITION_VALUE_USD)
+            moves = ~(np.abs(a - b) < np.maximum(1.0, 0.02 * np.maximum(b, a)))
+        hits = np.flatnonzero(new_rows)
+        for i, w in zip(hits.tolist(), owner[hits].tolist()):
+            out[w].append(Event("new_token", keys[i], "", 0.0, after[i], sources[w]))
+        hits = np.flatnonzero(moves)
+        for i, w in zip(hits.tolist(), owner[hits].tolist()):
+            out[w].append(Event("buy" if after[i] > before[i] else "sell", keys[i], "", before[i], after[i], sources[w]))
+
+    totals_before = [prev.usd_total for prev, _ in pairs]
+    totals_after = [now.usd_total for _, now in pairs]
+    tb, ta = np.asarray(totals_before), np.asarray(totals_after)
+    with np.errstate(invalid="ignore"):
+        balance = ~(np.abs(ta - tb) < np.maximum(5.0, 0.05 * np.maximum(1.0, tb)))
+    for w in np.flatnonzero(balance).tolist():
+        out[w].append(Event("balance", None, "", totals_before[w], totals_after[w], sources[w]))
+
+    # position rows: every position in `now`, against the same key in `prev` (or _NO_POSITION)
+    rows: List[Position] = []
+    olds: List[Position] = []
+    counts: List[int] = []
+    for prev, now in pairs:
+        rows += now.positions
+        # without duplicate keys the map holds the positions' keys in order
+        now_keys = now.position_map if len(now.position_map) == len(now.positions) else [p.key for p in now.positions]
+        olds += map(prev.position_map.get, now_keys, itertools.repeat(_NO_POSITION, len(now.positions)))
+        counts.append(len(now.positions))
+    if rows:
+        owner = np.repeat(np.arange(len(pairs)), counts)
+        size_of = attrgetter("size_usd")
+        size = np.fromiter(map(size_of, rows), float, len(rows))
+        prev_size = np.fromiter(map(size_of, olds), float, len(olds))
+        has_old = np.fromiter(map(is_not, olds, itertools.repeat(_NO_POSITION, len(olds))), bool, len(olds))
+        big = size >= MIN_POSITION_VALUE_USD
+        opened = ~has_old & big
+        grown = ~opened & (size > prev_size * 1.05) & big
+        hits = np.flatnonzero(opened | grown)
+        for i, w, is_open in zip(hits.tolist(), owner[hits].tolist(), opened[hits].tolist()):
+            p = rows[i]
+            if is_open:
+                out[w].append(Event("open", p.symbol, p.side, 0.0, p.size_usd, sources[w]))
+            else:
+                out[w].append(Event("increase", p.symbol, p.side, olds[i].size_usd, p.size_usd, sources[w]))
+
+    for w, (prev, now) in enumerate(pairs):
+        now_map = now.position_map
+        if prev.position_map.keys() <= now_map.keys():
+            continue
+        for pp in prev.positions:
+            if pp.key not in now_map:
+                out[w].append(Event("close", pp.symbol, pp.side, pp.size_usd, 0.0, sources[w]))
+    return out
+
+def compare_and_generate_events(addr: str, snap: Dict[str, Any], now: Optional[Snapshot] = None) -> List[str]:
+    """
+    Compare snap with previous state and generate human-readable event strings.
+    Pass `now` if the caller already normalized `snap`.
+    """
+    return diff_snapshots(addr, get_wallet_snapshot(addr), now or normalize_snapshot(snap))
+
+class SourceHistory:
+    """
+    Last snapshot per (wallet, source). When the answering source changes between
+    polls (e.g. CoinGlass failed and DeBank answered), diffing across sources shows
+    spurious SELL/BUY pairs for whatever the two disagree on; diffing against the new
+    source's own last snapshot shows only real changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snaps: Dict[str, Dict[Optional[str], Snapshot]] = {}
+
+    def previous(self, addr: str, now: Snapshot) -> Optional[Snapshot]:
+        """The snapshot to diff `now` against, or None if `now.source` has no history yet."""
+        stored = get_wallet_snapshot(addr)
+        if stored is EMPTY_SNAPSHOT or stored.source == now.source:
+            return stored
+        with self._lock:
+            return self._snaps.get(addr, {}).get(now.source)
+
+    def record(self, addr: str, snap: Snapshot):
+        with self._lock:
+            self._snaps.setdefault(addr, {})[snap.source] = snap
+
+    def overlay_positions(self, addr: str, now: Snapshot):
+        """
+        A streamed position update holds for every source: carry its positions into each
+        source's last snapshot, so the next poll doesn't signal the same change again.
+        """
+        with self._lock:
+            snaps = self._snaps.get(addr)
+            if not snaps:
+                return
+            for src, s in snaps.items():
+                snaps[src] = Snapshot(s.usd_total, s.tokens, now.positions, now.position_map, s.source, s.updated_at)
+
+    def forget(self, addr: str):
+        with self._lock:
+            self._snaps.pop(addr, None)
+
+source_history = SourceHistory()
+
+def detect_events(addr: str, now: Snapshot, base: Optional[Snapshot] = None) -> List[Event]:
+    """
+    Events for a wallet's new snapshot, diffed against the same source when EVENT_SOURCE_GUARD is on.
+    A caller that built `now` on top of a stored snapshot passes it as `base` to diff against it directly.
+    """
+    if base is not None:
+        # a partial update, not a full answer from now.source: keep it out of the source history,
+        # but let the sources' snapshots see its positions
+        if EVENT_SOURCE_GUARD:
+            source_history.overlay_positions(addr, now)
+        return diff_events(base, now)
+    prev = detection_base(addr, now)
+    return diff_events(prev, now) if prev is not None else []
+
+def detection_base(addr: str, now: Snapshot) -> Optional[Snapshot]:
+    """The snapshot to diff a full poll result against; None means no events this time."""
+    if not EVENT_SOURCE_GUARD:
+        return get_wallet_snapshot(addr)
+    prev = source_history.previous(addr, now)
+    source_history.record(addr, now)
+    if prev is None:
+        # first answer from this source: nothing comparable to diff against yet
+        metrics.inc("signalbot_events_suppressed_total", reason="source_switch")
+    return prev
+
+_TOKEN_KINDS = ("new_token", "buy", "sell")
+_POSITION_KINDS = ("open", "increase", "close")
+
+def collapse_events(events: List[Event]) -> List[Event]:
+    """
+    Merge related events of one wallet: moves of the same token or position fold into
+    one net change (first `before`, last `after`), a new token is not also reported as
+    a BUY, and the balance change is dropped when token events already explain it.
+    A token only counts as new if it was missing at the start of the window; one sold
+    out and bought back within it is judged on its net move like any other.
+    Order of first appearance is kept.
+    """
+    merged: "OrderedDict[tuple, list]" = OrderedDict()  # group key -> [first event, before, after, source]
+    for e in events:
+        group = "token" if e.kind in _TOKEN_KINDS else "position" if e.kind in _POSITION_KINDS else e.kind
+        key = (group, e.subject, e.side)
+        m = merged.get(key)
+        if m is None:
+            merged[key] = [e, e.before, e.after, e.source]
+        else:
+            m[2], m[3] = e.after, e.source
+    out: List[Event] = []
+    balance: Optional[Event] = None
+    for (group, subject, side), (first, before, after, src) in merged.items():
+        if group == "token":
+            if first.kind == "new_token":
+                if after >= MIN_POSITION_VALUE_USD:
+                    out.append(Event("new_token", subject, "", 0.0, after, src))
+            elif not _token_move_is_noise(before, after):
+                out.append(Event("buy" if after > before else "sell", subject, "", before, after, src))
+        elif group == "position":
+            if before <= 0 and after >= MIN_POSITION_VALUE_USD:
+                out.append(Event("open", subject, side, 0.0, after, src))
+            elif before > 0 and after <= 0:
+                out.append(Event("close", subject, side, before, 0.0, src))
+            elif before > 0 and after > before * 1.05 and after >= MIN_POSITION_VALUE_USD:
+                out.append(Event("increase", subject, side, before, after, src))
+        elif group == "balance":
+            if not _balance_move_is_noise(before, after):
+                balance = Event("balance", None, "", before, after, src)
+        else:
+            out.append(first)
+    if balance is not None and not any(e.kind in _TOKEN_KINDS for e in out):
+        out.append(balance)
+    return out
+
 # ---------------- sending signals ----------------
-def send_signal_to_chats(text: str):
-    if not authorized_chats:
-        logger.info("No authorized chats set; signal would be: %s", text)
+TELEGRAM_MAX_MESSAGE = 4096
+
+class OutboundQueue:
+    """
+    Outgoing Telegram messages, delivered by a dedicated sender thread.
+    Each chat gets at most one message per `chat_interval` seconds and all chats share
+    a global rate. RetryAfter and network errors re-queue the message with a delay,
+    so neither flood limits nor retries ever block the poller.
+    """
+
+    def __init__(self, chat_interval: float, global_rps: float, max_attempts: int):
+        self.chat_interval = chat_interval
+        self.max_attempts = max(1, max_attempts)
+        self.bucket = TokenBucket(global_rps, max(1.0, global_rps))
+        self._queues: Dict[int, deque] = {}   # chat_id -> FIFO of (text, attempts)
+        self._ready: Dict[int, float] = {}    # chat_id -> earliest time of its next send
+        self._heap: List[tuple] = []          # (ready_at, chat_id), one entry per chat with queued messages
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def _enqueue(self, chat_id: int, item: tuple, front: bool = False, delay: float = 0.0):
+        with self._cond:
+            now = time.monotonic()
+            if delay:
+                self._ready[chat_id] = max(self._ready.get(chat_id, 0.0), now + delay)
+            q = self._queues.setdefault(chat_id, deque())
+            if not q:
+                heapq.heappush(self._heap, (max(now, self._ready.get(chat_id, 0.0)), chat_id))
+            if front:
+                q.appendleft(item)
+            else:
+                q.append(item)
+            self._cond.notify()
+
+    def put(self, chat_id: int, text: str):
+        self._enqueue(chat_id, (text, 0))
+
+    def pending(self) -> int:
+        with self._cond:
+            return sum(len(q) for q in self._queues.values())
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name="telegram-sender", daemon=True)
+        self._thread.start()
+
+    def _next(self) -> tuple:
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if self._heap and self._heap[0][0] <= now:
+                    _, chat_id = heapq.heappop(self._heap)
+                    ready = self._ready.get(chat_id, 0.0)
+                    if ready > now:
+                        # chat was pushed back (RetryAfter) after it was scheduled
+                        heapq.heappush(self._heap, (ready, chat_id))
+                        continue
+                    q = self._queues[chat_id]
+                    text, attempts = q.popleft()
+                    self._ready[chat_id] = now + self.chat_interval
+                    if q:
+                        heapq.heappush(self._heap, (self._ready[chat_id], chat_id))
+                    else:
+                        del self._queues[chat_id]
+                    return chat_id, text, attempts
+                self._cond.wait(timeout=(self._heap[0][0] - now) if self._heap else None)
+
+    def _run(self):
+        # building the bot imports python-telegram-bot under the app lock; importing it
+        # from two threads at once (sender and updater) breaks its circular imports
+        bot = app.bot
+        from telegram.error import TelegramError, RetryAfter, NetworkError
+        while True:
+            chat_id, text, attempts = self._next()
+            self.bucket.acquire(timeout=3600)
+            result = "ok"
+            t0 = time.perf_counter()
+            try:
+                bot.send_message(chat_id=chat_id, text=text, parse_mode="Markdown")
+            except RetryAfter as e:
+                result = "retry_after"
+                delay = float(e.retry_after) + 0.5
+                logger.warning("flood limit for %s, retrying in %.0fs", chat_id, delay)
+                self._enqueue(chat_id, (text, attempts), front=True, delay=delay)
+            except NetworkError as e:
+                result = "network_error"
+                if attempts + 1 >= self.max_attempts:
+                    logger.error("send to %s failed after %d attempts: %s", chat_id, attempts + 1, e)
+                else:
+                    self._enqueue(chat_id, (text, attempts + 1), front=True, delay=min(300.0, 2.0 ** attempts))
+            except TelegramError as e:
+                result = "error"
+                logger.error("send to %s failed: %s", chat_id, e)
+            except Exception as e:
+                result = "error"
+                logger.error("sender error for %s: %s", chat_id, e)
+            metrics.observe("signalbot_telegram_send_seconds", time.perf_counter() - t0)
+            metrics.inc("signalbot_telegram_sent_total", result=result)
+
+
+def format_signals(addr: str, events: List[str], source: str) -> List[str]:
+    """
+    Coalesce one wallet's events from a cycle into as few messages as possible
+    (split only where a message would exceed Telegram's length limit).
+    """
+    ts = datetime.now(timezone.utc).astimezone().isoformat()
+    head = f"⚡ سیگنال — کیف‌پول: `{addr}`\n"
+    tail = f"\n_source: {source}\n_time: {ts}_"
+    room = TELEGRAM_MAX_MESSAGE - len(head) - len(tail)
+    texts, chunk = [], []
+    for e in events:
+        e = e[:room]
+        if chunk and len("\n".join(chunk + [e])) > room:
+            texts.append(head + "\n".join(chunk) + tail)
+            chunk = []
+        chunk.append(e)
+    if chunk:
+        texts.append(head + "\n".join(chunk) + tail)
+    return texts
+
+def send_signal_to_chats(text: str, addr: Optional[str] = None):
+    """
+    Queue `text` for the chats subscribed to `addr`. Signals for wallets nobody follows
+    (added to WALLETS_FILE by hand, or just removed while events were pending) and
+    signals without a wallet go to ADMIN_CHATS only, never to every authorized chat.
+    """
+    chats = app.subscriptions.chats_for(addr) if addr else []
+    if not chats:
+        chats = ADMIN_CHATS
+    if not chats:
+        logger.info("No chat follows %s; dropping signal: %s", addr, text)
         return
-    for cid in list(authorized_chats):
-        try:
-            bot.send_message(chat_id=cid, text=text, parse_mode="Markdown")
-        except TelegramError as e:
-            logger.error("send to %s failed: %s", cid, e)
+    for cid in chats:
+        app.outbound.put(cid, text)
+
+class EventAggregator:
+    """
+    Stage between event detection and sending. A wallet's events are held for `window`
+    seconds from the first one (0 sends right away), collapsed into net changes and
+    sent as one signal; events already sent within `dedupe_window` seconds are dropped
+    using a bounded index of recent event signatures.
+    """
+
+    def __init__(self, window: float, dedupe_window: float, dedupe_max: int):
+        self.window = window
+        self.dedupe_window = dedupe_window
+        self.dedupe_max = max(1, dedupe_max)
+        self._recent: "OrderedDict[tuple, float]" = OrderedDict()  # signature -> monotonic send time
+        self._pending: Dict[str, List[Event]] = {}
+        self._heap: List[tuple] = []   # (due_at, wallet), one entry per wallet with pending events
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, addr: str, events: List[Event]):
+        if not events:
+            return
+        if self.window <= 0:
+            self._emit(addr, events)
+            return
+        with self._cond:
+            if addr not in self._pending:
+                self._pending[addr] = []
+                heapq.heappush(self._heap, (time.monotonic() + self.window, addr))
+                self._cond.notify()
+            self._pending[addr].extend(events)
+        self.start()
+
+    def pending(self) -> int:
+        with self._cond:
+            return sum(len(v) for v in self._pending.values())
+
+    def flush(self):
+        """Send everything still held, regardless of the window."""
+        with self._cond:
+            pending, self._pending, self._heap = self._pending, {}, []
+        for addr, events in pending.items():
+            self._emit(addr, events)
+
+    def start(self):
+        with self._cond:
+            if self._thread:
+                return
+            self._thread = threading.Thread(target=self._run, name="event-window", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._cond.wait(timeout=(self._heap[0][0] - time.monotonic()) if self._heap else None)
+                _, addr = heapq.heappop(self._heap)
+                events = self._pending.pop(addr, [])
+            try:
+                self._emit(addr, events)
+            except Exception as e:
+                logger.error("event flush %s error: %s", addr, e)
+
+    def _fresh(self, addr: str, events: List[Event]) -> List[Event]:
+        now = time.monotonic()
+        out = []
+        with self._cond:
+            while self._recent:
+                sig, ts = next(iter(self._recent.items()))
+                if now - ts < self.dedupe_window and len(self._recent) <= self.dedupe_max:
+                    break
+                self._recent.popitem(last=False)
+            for e in events:
+                sig = e.signature(addr)
+                if sig in self._recent:
+                    continue
+                self._recent[sig] = now
+                out.append(e)
+        return out
+
+    def _emit(self, addr: str, events: List[Event]):
+        collapsed = collapse_events(events)
+        if len(collapsed) < len(events):
+            metrics.inc("signalbot_events_suppressed_total", len(events) - len(collapsed), reason="collapsed")
+        fresh = self._fresh(addr, collapsed) if self.dedupe_window > 0 else collapsed
+        if len(fresh) < len(collapsed):
+            metrics.inc("signalbot_events_suppressed_total", len(collapsed) - len(fresh), reason="duplicate")
+        if not fresh:
+            return
+        for text in format_signals(addr, [e.text(addr) for e in fresh], fresh[-1].source or "unknown"):
+            logger.info("SIGNAL: %s", text)
+            send_signal_to_chats(text, addr)
+
 
 # ---------------- poll & process ----------------
-def process_wallet(addr: str):
+def build_wallet_state(snap: Dict[str, Any]) -> Snapshot:
+    state_snap = normalize_snapshot(snap)
+    state_snap.updated_at = datetime.now(timezone.utc).isoformat()
+    return state_snap
+
+def apply_snapshot(addr: str, snap: Dict[str, Any], base: Optional[Snapshot] = None) -> int:
+    """Diff `snap` against the stored state (or `base`), store it and signal the events. Returns the event count."""
+    now = build_wallet_state(snap)
+    return commit_snapshot(addr, now, detect_events(addr, now, base))
+
+def commit_snapshot(addr: str, now: Snapshot, events: List[Event]) -> int:
+    # update state always (so changes are tracked next time)
+    set_wallet_state(addr, now)
+    record_history(addr, now)
+    if events:
+        metrics.inc("signalbot_events_total", len(events))
+        app.event_aggregator.submit(addr, events)
+    return len(events)
+
+def apply_snapshots(batch: List[Tuple[str, Dict[str, Any]]]) -> int:
+    """apply_snapshot for a whole cycle's results, detecting events in one batch. Returns the event count."""
+    nows = [build_wallet_state(snap) for _, snap in batch]
+    bases = [detection_base(addr, now) for (addr, _), now in zip(batch, nows)]
+    t0 = time.perf_counter()
+    diffs = iter(diff_events_batch([(b, n) for b, n in zip(bases, nows) if b is not None]))
+    metrics.observe("signalbot_detect_batch_seconds", time.perf_counter() - t0)
+    total = 0
+    for (addr, _), base, now in zip(batch, bases, nows):
+        try:
+            total += commit_snapshot(addr, now, next(diffs) if base is not None else [])
+        except Exception as e:
+            logger.error("apply %s error: %s", addr, e)
+    return total
+
+def process_wallet(addr: str) -> int:
+    """Fetch, diff, store and signal one wallet. Returns the number of events generated."""
+    t0 = time.perf_counter()
     try:
         snap = detect_and_build_snapshots(addr)
         if not snap:
             logger.debug("No data for %s", addr)
-            return
-        events = compare_and_generate_events(addr, snap)
-        # update state always (so changes are tracked next time)
-        new_state = {
-            "updated_at": datetime.now(timezone.utc).isoformat(),
-            "usd_total": float(snap.get("usd_total") or 0.0),
-            "tokens": snap.get("tokens", {}),
-            "positions": snap.get("positions", [])
-        }
-        set_wallet_state(addr, new_state)
-        if events:
-            ts = datetime.now(timezone.utc).astimezone().isoformat()
-            for e in events:
-                text = f"⚡ سیگنال — کیف‌پول: `{addr}`\n{e}\n_source: {snap.get('source','unknown')}\n_time: {ts}_"
-                logger.info("SIGNAL: %s", text)
-                send_signal_to_chats(text)
+            return 0
+        return apply_snapshot(addr, snap)
     except Exception as ex:
         logger.error("process_wallet %s error: %s", addr, ex)
+        return 0
+    finally:
+        metrics.observe("signalbot_wallet_seconds", time.perf_counter() - t0)
+
+# ---------------- poll engine ----------------
+# Wallets currently being processed. A wallet that overran the previous cycle's
+# deadline is skipped instead of being processed twice concurrently.
+_inflight: Set[str] = set()
+_inflight_lock = threading.Lock()
+
+def _release_wallet(addr: str):
+    with _inflight_lock:
+        _inflight.discard(addr)
+
+def _process_wallet_task(addr: str) -> int:
+    try:
+        return process_wallet(addr)
+    except Exception as e:
+        logger.error("poll error %s: %s", addr, e)
+        return 0
+    finally:
+        _release_wallet(addr)
+
+def _fetch_wallet_task(addr: str) -> Optional[Dict[str, Any]]:
+    """Batch mode: only fetch; the wallet stays in-flight until its snapshot is applied."""
+    t0 = time.perf_counter()
+    try:
+        return detect_and_build_snapshots(addr)
+    except Exception as e:
+        logger.error("poll error %s: %s", addr, e)
+        return None
+    finally:
+        metrics.observe("signalbot_wallet_seconds", time.perf_counter() - t0)
+
+def _apply_late(addr: str, f):
+    """A batch-mode fetch that outlived its cycle is applied on its own."""
+    try:
+        if not f.cancelled() and f.result():
+            apply_snapshot(addr, f.result())
+    except Exception as e:
+        logger.error("apply %s error: %s", addr, e)
+    finally:
+        _release_wallet(addr)
+
+def _claim_wallets(addrs: List[str]) -> List[str]:
+    """Mark the wallets in `addrs` that are not already being processed as in-flight; returns those."""
+    with _inflight_lock:
+        claimed = [a for a in dict.fromkeys(addrs) if a not in _inflight]
+        _inflight.update(claimed)
+    return claimed
+
+def _store_baseline(addr: str):
+    """Store a first snapshot for a claimed wallet without emitting any events, then release it."""
+    try:
+        if app.state_store.get_snapshot(addr) is not None:
+            return
+        snap = detect_and_build_snapshots(addr)
+        if snap:
+            set_wallet_state(addr, build_wallet_state(snap))
+    except Exception as e:
+        logger.debug("baseline %s err %s", addr, e)
+    finally:
+        _release_wallet(addr)
+
+def _baseline_wallet(addr: str):
+    """Store a first snapshot for a newly added wallet without emitting any events."""
+    if _claim_wallets([addr]):
+        _store_baseline(addr)
+
+def prefetch_baselines(addrs: List[str]):
+    """
+    Fetch baselines for new wallets in the background so they don't all fire "New token" next cycle.
+    The wallets are claimed before this returns, so a poll cycle started right after skips them
+    until their baseline is stored instead of diffing them against an empty snapshot.
+    """
+    claimed = _claim_wallets(addrs)
+    if not claimed:
+        return
+
+    def run():
+        with ThreadPoolExecutor(max_workers=POLL_WORKERS, thread_name_prefix="baseline") as pool:
+            list(pool.map(_store_baseline, claimed))
+        logger.info("Baseline snapshots fetched for %d new wallets", len(claimed))
+    threading.Thread(target=run, name="baseline", daemon=True).start()
+
+def run_poll_cycle(pool: ThreadPoolExecutor, wallets: List[str], deadline: float) -> Dict[str, int]:
+    """
+    Process `wallets` on `pool` and wait at most `deadline` seconds.
+    Wallets that have not started by then are cancelled; running ones finish in the background.
+    """
+    batch = DETECT_MODE == "batch"
+    futures = {}
+    skipped = 0
+    for w in wallets:
+        with _inflight_lock:
+            if w in _inflight:
+                skipped += 1
+                continue
+            _inflight.add(w)
+        futures[pool.submit(_fetch_wallet_task if batch else _process_wallet_task, w)] = w
+    done, not_done = wait(futures, timeout=max(0.0, deadline))
+    cancelled = 0
+    for f in not_done:
+        if f.cancel():
+            cancelled += 1
+            _release_wallet(futures[f])
+        elif batch:
+            f.add_done_callback(functools.partial(_apply_late, futures[f]))
+    if batch:
+        try:
+            events = apply_snapshots([(futures[f], f.result()) for f in done if f.result()])
+        finally:
+            for f in done:
+                _release_wallet(futures[f])
+    else:
+        events = sum(f.result() for f in done if not f.exception())
+    return {
+        "wallets": len(wallets),
+        "events": events,
+        "done": len(done),
+        "cancelled": cancelled,
+        "running": len(not_done) - cancelled,
+        "skipped": skipped,
+    }
+
+class AdaptiveScheduler:
+    """
+    Per-wallet poll schedule: a heap keyed by next-due time. After each poll the wallet's
+    interval shrinks (events seen) or grows (quiet), bounded by [min_interval, max_interval];
+    overrides pin a wallet to a fixed interval within the same bounds and are persisted
+    to `overrides_path`, which sync() reloads when another process (the one running
+    /interval) changes it.
+    """
+
+    def __init__(self, base: float, min_interval: float, max_interval: float,
+                 speedup: float, backoff: float, overrides_path: str):
+        self.base = base
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.speedup = speedup
+        self.backoff = backoff
+        self.overrides_path = overrides_path
+        self._overrides_mtime = self._file_mtime()
+        self.overrides: Dict[str, float] = {}
+        try:
+            self.overrides = self._read_overrides()
+        except Exception as e:
+            logger.warning("cannot load %s: %s", overrides_path, e)
+        self._heap: List[tuple] = []           # (due, addr); stale entries are skipped on pop
+        self._due: Dict[str, float] = {}       # addr -> current due time (absent while being polled)
+        self._interval: Dict[str, float] = {}
+        self._tracked: Set[str] = set()
+        self._cond = threading.Condition()
+
+    def _clamp(self, v: float) -> float:
+        return min(self.max_interval, max(self.min_interval, v))
+
+    def _file_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.overrides_path).st_mtime
+        except OSError:
+            return None
+
+    def _read_overrides(self) -> Dict[str, float]:
+        try:
+            with open(self.overrides_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        return {_normalize_wallet(k): self._clamp(float(v)) for k, v in (data or {}).items()}
+
+    def _maybe_reload_overrides(self, now: float):
+        mtime = self._file_mtime()
+        if mtime == self._overrides_mtime:
+            return
+        self._overrides_mtime = mtime
+        try:
+            overrides = self._read_overrides()
+        except Exception as e:
+            # keep the current pins rather than dropping them all on a bad edit
+            logger.warning("cannot load %s, keeping %d pinned intervals: %s", self.overrides_path, len(self.overrides), e)
+            return
+        for addr, seconds in overrides.items():
+            if self.overrides.get(addr) != seconds:
+                self._pin(addr, seconds, now)
+        self.overrides = overrides
+        logger.info("Reloaded %s (%d pinned intervals)", self.overrides_path, len(overrides))
+
+    def _schedule(self, addr: str, due: float):
+        self._due[addr] = due
+        heapq.heappush(self._heap, (due, addr))
+        self._cond.notify_all()
+
+    def sync(self, wallets: List[str], now: float):
+        """Start tracking new wallets (due immediately), forget removed ones and pick up changed pins."""
+        with self._cond:
+            self._maybe_reload_overrides(now)
+            current = set(wallets)
+            for addr in current - self._tracked:
+                self._interval.setdefault(addr, self.overrides.get(addr) or self._clamp(self.base))
+                self._schedule(addr, now)
+            for addr in self._tracked - current:
+                self._due.pop(addr, None)
+                self._interval.pop(addr, None)
+            self._tracked = current
+
+    def pop_due(self, now: float, limit: int) -> List[tuple]:
+        """Up to `limit` (addr, due) pairs that are due, most overdue first."""
+        out = []
+        with self._cond:
+            while self._heap and len(out) < limit and self._heap[0][0] <= now:
+                due, addr = heapq.heappop(self._heap)
+                if self._due.get(addr) != due:
+                    continue
+                del self._due[addr]
+                out.append((addr, due))
+        return out
+
+    def complete(self, addr: str, events: int, now: float):
+        with self._cond:
+            if addr not in self._tracked:
+                return
+            if addr in self.overrides:
+                interval = self.overrides[addr]
+            else:
+                cur = self._interval.get(addr, self.base)
+                interval = self._clamp(cur * (self.speedup if events else self.backoff))
+            self._interval[addr] = interval
+            self._schedule(addr, now + interval)
+
+    def defer(self, addr: str, seconds: float, now: float):
+        """Re-queue without touching the interval (e.g. the wallet is busy elsewhere)."""
+        with self._cond:
+            if addr in self._tracked:
+                self._schedule(addr, now + seconds)
+
+    def next_due(self) -> Optional[float]:
+        with self._cond:
+            while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def wait(self, timeout: float):
+        with self._cond:
+            self._cond.wait(timeout=max(0.0, timeout))
+
+    def _pin(self, addr: str, seconds: float, now: float):
+        if addr not in self._tracked:
+            return
+        self._interval[addr] = seconds
+        # pull the next poll forward if the new interval is shorter
+        if addr in self._due and self._due[addr] > now + seconds:
+            self._schedule(addr, now + seconds)
+
+    def set_override(self, addr: str, seconds: Optional[float], now: float):
+        addr = _normalize_wallet(addr)
+        with self._cond:
+            self._maybe_reload_overrides(now)
+            if seconds is None:
+                self.overrides.pop(addr, None)
+            else:
+                seconds = self._clamp(seconds)
+                self.overrides[addr] = seconds
+                self._pin(addr, seconds, now)
+            _write_json(self.overrides_path, self.overrides)
+            self._overrides_mtime = self._file_mtime()
+
+    def interval_of(self, addr: str) -> Optional[float]:
+        with self._cond:
+            return self._interval.get(_normalize_wallet(addr))
+
+    def summary(self, now: float) -> Dict[str, Any]:
+        with self._cond:
+            intervals = sorted(self._interval.values())
+            overdue = sum(1 for d in self._due.values() if d <= now)
+        return {
+            "wallets": len(self._tracked),
+            "overdue": overdue,
+            "min": intervals[0] if intervals else None,
+            "median": intervals[len(intervals) // 2] if intervals else None,
+            "max": intervals[-1] if intervals else None,
+            "overrides": len(self.overrides),
+        }
+
+def adaptive_poller_loop(pool: ThreadPoolExecutor):
+    """Poll each wallet when it is due instead of all wallets every POLL_INTERVAL."""
+    # keep only a short queue in the pool so newly due wallets are not stuck behind it
+    max_outstanding = POLL_WORKERS * 2
+    outstanding = [0]
+    lock = threading.Lock()
+
+    def run(addr: str, due: float):
+        metrics.observe("signalbot_schedule_lag_seconds", max(0.0, time.time() - due))
+        events = _process_wallet_task(addr)
+        app.scheduler.complete(addr, events, time.time())
+        with lock:
+            outstanding[0] -= 1
+
+    while True:
+        now = time.time()
+        app.scheduler.sync(load_shard_wallets(), now)
+        with lock:
+            free = max_outstanding - outstanding[0]
+        batch = app.scheduler.pop_due(now, free)
+        if batch:
+            prefetch_hyperliquid([addr for addr, _ in batch if addr not in _inflight])
+        for addr, due in batch:
+            with _inflight_lock:
+                busy = addr in _inflight
+                if not busy:
+                    _inflight.add(addr)
+            if busy:
+                app.scheduler.defer(addr, 5.0, now)
+                continue
+            with lock:
+                outstanding[0] += 1
+            pool.submit(run, addr, due)
+        summary = app.scheduler.summary(now)
+        metrics.set("signalbot_scheduled_wallets", summary["wallets"])
+        metrics.set("signalbot_overdue_wallets", summary["overdue"])
+        nxt = app.scheduler.next_due()
+        # wake up when the next wallet is due, or at least every second to pick up list changes
+        app.scheduler.wait(min(1.0, (nxt - time.time()) if nxt is not None else 1.0))
 
 def poller_thread():
-    logger.info("Poller started. Interval %s seconds", POLL_INTERVAL)
+    pool = ThreadPoolExecutor(max_workers=POLL_WORKERS, thread_name_prefix="poll")
+    if ADAPTIVE_POLLING:
+        logger.info("Adaptive poller started. Interval %s..%s seconds (start %s), %s workers",
+                    POLL_MIN_INTERVAL, POLL_MAX_INTERVAL, POLL_INTERVAL, POLL_WORKERS)
+        adaptive_poller_loop(pool)
+        return
+    logger.info("Poller started. Interval %s seconds, %s workers", POLL_INTERVAL, POLL_WORKERS)
+    deadline = min(POLL_CYCLE_DEADLINE, POLL_INTERVAL)
+    next_run = time.monotonic()
+    offset = 0
     while True:
-        wallets = load_wallets()
+        started = time.monotonic()
+        wallets = load_shard_wallets()
         if not wallets:
             logger.info("Polling wallets... count=0")
+        else:
+            # rotate the start so wallets at the tail are not always the ones cut by the deadline
+            offset = offset % len(wallets)
+            wallets = wallets[offset:] + wallets[:offset]
+            offset += 1
+            try:
+                prefetch_hyperliquid(wallets)
+                stats = run_poll_cycle(pool, wallets, deadline)
+                elapsed = time.monotonic() - started
+                logger.info("Poll cycle: %s in %.1fs", stats, elapsed)
+                metrics.observe("signalbot_cycle_seconds", elapsed)
+                metrics.set("signalbot_cycle_interval_ratio", elapsed / POLL_INTERVAL)
+                metrics.set("signalbot_cycle_events", stats["events"])
+                for k in ("done", "cancelled", "running", "skipped"):
+                    metrics.set("signalbot_cycle_wallets", stats[k], outcome=k)
+            except Exception as e:
+                logger.error("poll cycle error: %s", e)
+        # fixed-rate schedule: ticks stay on the original grid, overrun ticks are skipped
+        next_run += POLL_INTERVAL
+        now = time.monotonic()
+        if now >= next_run:
+            missed = int((now - next_run) // POLL_INTERVAL) + 1
+            logger.warning("Poll cycle overran the interval; skipping %d tick(s)", missed)
+            next_run += missed * POLL_INTERVAL
+        time.sleep(max(0.0, next_run - time.monotonic()))
+
+# ---------------- position streaming ----------------
+class PositionStream:
+    """
+    Long-lived Hyperliquid WebSocket subscribed to `userFills` for up to `max_wallets`
+    tracked wallets (those holding positions first). A live fill triggers a fresh
+    clearinghouseState read for that wallet, whose positions are applied through the
+    normal diff/signal path, so OPEN/CLOSE signals arrive seconds after the trade.
+    Disconnects are retried with backoff and every subscription is re-sent on reconnect;
+    the poller keeps running regardless, so nothing is missed while the stream is down.
+    """
+
+    RECV_TIMEOUT = 1.0
+    PING_INTERVAL = 30.0      # Hyperliquid drops connections idle for 60s
+    RESYNC_INTERVAL = 30.0    # how often the subscribed wallet set is re-evaluated
+
+    def __init__(self, url: str, max_wallets: int, debounce: float):
+        self.url = url
+        self.max_wallets = max_wallets
+        self.debounce = debounce
+        self.connected = False
+        self.subscribed: Set[str] = set()
+        self._pending: Set[str] = set()
+        self._pending_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name="position-stream", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def desired_wallets(self) -> List[str]:
+        wallets = load_shard_wallets()
+        # wallets holding positions first; one pass, no membership scans
+        with_positions: List[str] = []
+        rest: List[str] = []
         for w in wallets:
+            (with_positions if (app.state_store.get_snapshot(w) or EMPTY_SNAPSHOT).positions else rest).append(w)
+        return (with_positions + rest)[: self.max_wallets]
+
+    def _send(self, ws, method: str, user: str):
+        ws.send(json.dumps({"method": method, "subscription": {"type": "userFills", "user": user}}))
+
+    def _reconcile(self, ws):
+        desired = set(self.desired_wallets())
+        for user in self.subscribed - desired:
+            self._send(ws, "unsubscribe", user)
+        for user in desired - self.subscribed:
+            self._send(ws, "subscribe", user)
+        self.subscribed = desired
+
+    def _run(self):
+        try:
+            import websocket  # websocket-client
+        except ImportError:
+            logger.error("STREAMING_ENABLED needs the websocket-client package; streaming disabled")
+            return
+        backoff = 1.0
+        while not self._stop.is_set():
+            ws = None
             try:
-                process_wallet(w)
+                ws = websocket.create_connection(self.url, timeout=REQUEST_TIMEOUT)
+                ws.settimeout(self.RECV_TIMEOUT)
+                self.connected = True
+                self.subscribed = set()
+                metrics.set("signalbot_stream_connected", 1)
+                logger.info("Position stream connected to %s", self.url)
+                self._reconcile(ws)
+                backoff = 1.0
+                last_ping = last_sync = time.monotonic()
+                while not self._stop.is_set():
+                    try:
+                        raw = ws.recv()
+                    except websocket.WebSocketTimeoutException:
+                        raw = None
+                    if raw:
+                        self._on_message(raw)
+                    elif raw == "":
+                        raise ConnectionError("stream closed by server")
+                    now = time.monotonic()
+                    if now - last_ping >= self.PING_INTERVAL:
+                        ws.send(json.dumps({"method": "ping"}))
+                        last_ping = now
+                    if now - last_sync >= self.RESYNC_INTERVAL:
+                        self._reconcile(ws)
+                        last_sync = now
             except Exception as e:
-                logger.error("poll error %s: %s", w, e)
-        time.sleep(POLL_INTERVAL)
+                if self._stop.is_set():
+                    break
+                logger.warning("Position stream error: %s; reconnecting in %.0fs", e, backoff)
+                metrics.inc("signalbot_stream_reconnects_total")
+            finally:
+                self.connected = False
+                metrics.set("signalbot_stream_connected", 0)
+                if ws is not None:
+                    try:
+                        ws.close()
+                    except Exception:
+                        pass
+            self._stop.wait(backoff)
+            backoff = min(60.0, backoff * 2)
+
+    def _on_message(self, raw: str):
+        try:
+            msg = json.loads(raw)
+        except ValueError:
+            return
+        channel = msg.get("channel")
+        metrics.inc("signalbot_stream_messages_total", channel=channel or "unknown")
+        if channel != "userFills":
+            return
+        data = msg.get("data") or {}
+        # the first message after subscribing replays recent history
+        if data.get("isSnapshot"):
+            return
+        user = (data.get("user") or "").lower()
+        if user and data.get("fills"):
+            self._schedule_refresh(user)
+
+    def _schedule_refresh(self, addr: str, delay: Optional[float] = None):
+        with self._pending_lock:
+            if addr in self._pending:
+                return
+            self._pending.add(addr)
+        t = threading.Timer(self.debounce if delay is None else delay, self._refresh, (addr,))
+        t.daemon = True
+        t.start()
+
+    def _refresh(self, addr: str):
+        with self._pending_lock:
+            self._pending.discard(addr)
+        with _inflight_lock:
+            busy = addr in _inflight
+            if not busy:
+                _inflight.add(addr)
+        if busy:
+            # the poller is on this wallet right now; look again shortly
+            self._schedule_refresh(addr, delay=1.0)
+            return
+        try:
+            apply_position_update(addr)
+        except Exception as e:
+            logger.error("stream update %s error: %s", addr, e)
+        finally:
+            _release_wallet(addr)
+
+def apply_position_update(addr: str) -> int:
+    """
+    Re-read a wallet's Hyperliquid positions (bypassing the cache) and apply them on top
+    of its stored tokens and balance. Returns the number of events signalled.
+    """
+    r = source_post("hyperliquid", HYPERLIQUID_API, cache=False,
+                    json={"type": "clearinghouseState", "user": addr}, timeout=REQUEST_TIMEOUT)
+    r.raise_for_status()
+    fresh = parse_clearinghouse_state(addr, r.json(), allow_empty=True)
+    prev = get_wallet_snapshot(addr)
+    snap = {
+        "address": addr,
+        "usd_total": prev.usd_total,
+        "tokens": prev.tokens,
+        "positions": fresh["positions"],
+        "source": "hyperliquid",
+    }
+    return apply_snapshot(addr, snap, base=prev)
+
+# ---------------- application ----------------
+class _component:
+    """An App attribute built by the decorated factory on first access, once, under the app lock."""
+
+    def __init__(self, factory: Callable[["App"], Any]):
+        self.factory = factory
+        self.name = factory.__name__
+        self.__doc__ = factory.__doc__
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        with obj._lock:
+            if self.name not in obj.__dict__:
+                obj.__dict__[self.name] = self.factory(obj)
+        # later lookups find the instance attribute and never reach the descriptor
+        return obj.__dict__[self.name]
+
+class App:
+    """
+    The process-wide objects of a running bot. Each is built when first used, so
+    importing this module opens no files or connections, and a restart starts
+    polling from the persisted state before the Telegram client is even created.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+
+    def built(self) -> List[str]:
+        return [name for name, v in vars(App).items() if isinstance(v, _component) and name in self.__dict__]
+
+    @_component
+    def bot(self):
+        from telegram import Bot
+        from telegram.utils.request import Request
+        if not BOT_TOKEN:
+            raise RuntimeError("BOT_TOKEN environment variable is not set. Aborting.")
+        request = Request(proxy_url=PROXY_URL or None, connect_timeout=10.0, read_timeout=15.0)
+        return Bot(token=BOT_TOKEN, request=request, base_url=TELEGRAM_API_URL)
+
+    @_component
+    def updater(self):
+        from telegram.ext import Updater
+        updater = Updater(bot=self.bot, use_context=True)
+        register_handlers(updater.dispatcher)
+        return updater
+
+    @_component
+    def session(self) -> requests.Session:
+        return make_session(PROXIES_REQUESTS)
+
+    @_component
+    def fanout_pool(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(max_workers=max(1, FANOUT_WORKERS), thread_name_prefix="fanout")
+
+    @_component
+    def hyperliquid_pool(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(max_workers=HYPERLIQUID_CONCURRENCY, thread_name_prefix="hyperliquid")
+
+    @_component
+    def state_store(self) -> StateStore:
+        store = StateStore(STATE_DB, legacy_json=STATE_FILE)
+        atexit.register(store.flush)
+        return store
+
+    @_component
+    def history(self) -> Optional[HistoryStore]:
+        if not HISTORY_DB:
+            return None
+        store = HistoryStore(HISTORY_DB, HISTORY_KEYFRAME_EVERY)
+        atexit.register(store.flush)
+        return store
+
+    @_component
+    def wallet_registry(self) -> JsonSetRegistry:
+        registry = JsonSetRegistry(WALLETS_FILE, _normalize_wallet, REGISTRY_SAVE_DELAY, REGISTRY_RELOAD_INTERVAL)
+        atexit.register(registry.flush)
+        return registry
+
+    @_component
+    def authorized_chats(self) -> JsonSetRegistry:
+        registry = JsonSetRegistry(AUTHORIZED_CHATS_FILE, int, REGISTRY_SAVE_DELAY, REGISTRY_RELOAD_INTERVAL)
+        atexit.register(registry.flush)
+        return registry
+
+    @_component
+    def subscriptions(self) -> SubscriptionRegistry:
+        subs = SubscriptionRegistry(SUBSCRIPTIONS_FILE, REGISTRY_SAVE_DELAY, REGISTRY_RELOAD_INTERVAL)
+        atexit.register(subs.flush)
+        if not subs.existed:
+            # first start with subscriptions: every known chat keeps following every known wallet
+            wallets = self.wallet_registry.items()
+            for cid in self.authorized_chats:
+                subs.subscribe_many(cid, wallets)
+            subs.flush()
+        return subs
+
+    @_component
+    def outbound(self) -> OutboundQueue:
+        # every shard process sends its own wallets' signals, so they split the global budget
+        queue = OutboundQueue(TELEGRAM_CHAT_INTERVAL, TELEGRAM_GLOBAL_RPS / SHARD_COUNT, TELEGRAM_MAX_ATTEMPTS)
+        metrics.add_collector(lambda: metrics.set("signalbot_telegram_queue_depth", queue.pending()))
+        return queue
+
+    @_component
+    def event_aggregator(self) -> EventAggregator:
+        aggregator = EventAggregator(EVENT_WINDOW, EVENT_DEDUPE_WINDOW, EVENT_DEDUPE_MAX)
+        atexit.register(aggregator.flush)
+        metrics.add_collector(lambda: metrics.set("signalbot_events_pending", aggregator.pending()))
+        return aggregator
+
+    @_component
+    def scheduler(self) -> AdaptiveScheduler:
+        return AdaptiveScheduler(POLL_INTERVAL, POLL_MIN_INTERVAL, POLL_MAX_INTERVAL,
+                                 POLL_SPEEDUP, POLL_BACKOFF, POLL_OVERRIDES_FILE)
+
+    @_component
+    def position_stream(self) -> PositionStream:
+        return PositionStream(HYPERLIQUID_WS_URL, STREAM_MAX_WALLETS, STREAM_DEBOUNCE)
+
+app = App()
 
 # ---------------- start ----------------
 def main():
-    # start poller
-    threading.Thread(target=poller_thread, daemon=True).start()
+    check_config()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+    app.state_store.start_flusher(STATE_FLUSH_INTERVAL)
+    if app.history is not None:
+        app.history.start_flusher(STATE_FLUSH_INTERVAL)
+    app.outbound.start()
+    if METRICS_PORT:
+        port = METRICS_PORT + (SHARD_INDEX if SHARD_COUNT > 1 else 0)
+        try:
+            start_metrics_server(METRICS_HOST, port)
+        except OSError as e:
+            # e.g. another process on this host already serves the port; keep signalling without it
+            logger.error("Metrics server on %s:%s not started: %s", METRICS_HOST, port, e)
+    if BOT_ROLE != "telegram":
+        logger.info("Polling shard %d of %d", SHARD_INDEX, SHARD_COUNT)
+        threading.Thread(target=poller_thread, daemon=True).start()
+        if STREAMING_ENABLED:
+            app.position_stream.start()
+    if BOT_ROLE == "poller":
+        # Telegram updates are read by the process running with BOT_ROLE=all|telegram
+        while True:
+            time.sleep(3600)
     logger.info("Starting bot polling ...")
     # start telegram polling (blocking)
-    updater.start_polling()
-    updater.idle()
+    app.updater.start_polling()
+    app.updater.idle()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+
+# the bot reads its config and opens its state files on import; keep them out of the checkout
+_tmp = tempfile.mkdtemp(prefix="hyperdash-tests-")
+os.environ.setdefault("BOT_TOKEN", "123456:TEST")
+for _name, _file in (("WALLETS_FILE", "wallets.json"), ("AUTHORIZED_CHATS_FILE", "authorized_chats.json"),
+                     ("STATE_FILE", "state.json"), ("STATE_DB", "state.db")):
+    os.environ.setdefault(_name, os.path.join(_tmp, _file))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,266 @@
+"""Snapshot normalization and event detection (diff_snapshots)."""
+
+import random
+from typing import Any, Dict, List
+
+import pytest
+
+import hyperdash_telegram_bot_mtproto_coinglass as bot
+
+ADDR = "0x" + "ab" * 20
+
+
+def snap(tokens=None, positions=None, usd_total=0.0, source="coinglass") -> Dict[str, Any]:
+    return {"tokens": tokens or {}, "positions": positions or [], "usd_total": usd_total, "source": source}
+
+
+def pos(symbol, side, size) -> Dict[str, Any]:
+    return {"symbol": symbol, "side": side, "size_usd": size}
+
+
+def diff(prev: Dict[str, Any], now: Dict[str, Any]) -> List[str]:
+    return bot.diff_snapshots(ADDR, bot.normalize_snapshot(prev), bot.normalize_snapshot(now))
+
+
+KINDS = (("📥", "new_token"), ("🟢", "buy"), ("🔴", "sell"), ("ℹ️", "balance"),
+         ("⚡ Position OPEN", "open"), ("⚡ Position INCREASE", "increase"), ("⚡ Position CLOSED", "close"))
+
+
+def kinds(prev: Dict[str, Any], now: Dict[str, Any]) -> List[str]:
+    return [next(kind for prefix, kind in KINDS if text.startswith(prefix)) for text in diff(prev, now)]
+
+
+def reference_events(addr: str, prev: Dict[str, Any], snap: Dict[str, Any]) -> List[str]:
+    """compare_and_generate_events as it was before snapshots were normalized (O(n*m) closes)."""
+    events: List[str] = []
+    prev_tokens = prev.get("tokens", {}) or {}
+    prev_positions = prev.get("positions", []) or []
+    prev_total = float(prev.get("usd_total") or 0.0)
+    now_tokens = snap.get("tokens", {}) or {}
+    now_positions = snap.get("positions", []) or []
+    now_total = float(snap.get("usd_total") or 0.0)
+    for tok, val in now_tokens.items():
+        if tok not in prev_tokens and (val or 0) >= bot.MIN_POSITION_VALUE_USD:
+            events.append(f"📥 New token detected: {tok} — approx ${val:.2f} (source: {snap.get('source')})")
+    for tok in set(list(prev_tokens.keys()) + list(now_tokens.keys())):
+        prev_val = float(prev_tokens.get(tok) or 0)
+        now_val = float(now_tokens.get(tok) or 0)
+        if abs(now_val - prev_val) < max(1.0, 0.02 * max(prev_val, now_val)):
+            continue
+        if now_val > prev_val:
+            events.append(f"🟢 BUY detected: {tok} increased ${prev_val:.2f} → ${now_val:.2f} (wallet: {addr}, src: {snap.get('source')})")
+        else:
+            events.append(f"🔴 SELL detected: {tok} decreased ${prev_val:.2f} → ${now_val:.2f} (wallet: {addr}, src: {snap.get('source')})")
+    if abs(now_total - prev_total) >= max(5.0, 0.05 * max(1.0, prev_total)):
+        events.append(f"ℹ️ Balance change: ${prev_total:.2f} → ${now_total:.2f} (diff ${now_total - prev_total:+.2f}) (src: {snap.get('source')})")
+    prev_map = {(p.get("symbol"), (p.get("side") or "").lower()): p for p in prev_positions}
+    for p in now_positions:
+        sym = p.get("symbol")
+        side = (p.get("side") or "").lower()
+        size = float(p.get("size_usd") or 0)
+        key = (sym, side)
+        if key not in prev_map and size >= bot.MIN_POSITION_VALUE_USD:
+            events.append(f"⚡ Position OPEN: {sym} {side.upper()} ${size:.0f} (src: {snap.get('source')})")
+        else:
+            prev_size = float(prev_map.get(key, {}).get("size_usd") or 0)
+            if size > prev_size * 1.05 and size >= bot.MIN_POSITION_VALUE_USD:
+                events.append(f"⚡ Position INCREASE: {sym} {side.upper()} ${prev_size:.0f} → ${size:.0f} (src: {snap.get('source')})")
+    for pp in prev_positions:
+        key = (pp.get("symbol"), (pp.get("side") or "").lower())
+        found = False
+        for p in now_positions:
+            if p.get("symbol") == key[0] and (p.get("side") or "").lower() == key[1]:
+                found = True
+                break
+        if not found:
+            events.append(f"⚡ Position CLOSED: {key[0]} {key[1].upper()} (was ${pp.get('size_usd'):.0f}) (src: {snap.get('source')})")
+    return events
+
+
+def test_normalize_casts_once():
+    s = bot.normalize_snapshot({"usd_total": "12.5", "tokens": {"ETH": "3", "X": None},
+                                "positions": [{"symbol": "BTC", "side": "LONG", "size_usd": "100"}]})
+    assert s.usd_total == 12.5
+    assert s.tokens == {"ETH": 3.0, "X": 0.0}
+    assert s.positions[0] == bot.Position("BTC", "long", 100.0)
+    assert s.position_map == {("BTC", "long"): s.positions[0]}
+    assert bot.normalize_snapshot({}).positions == ()
+
+
+def test_new_token_threshold():
+    # below the threshold a new token is still a buy, just not a "new token"
+    assert kinds(snap(), snap({"ETH": 9.99})) == ["buy"]
+    assert diff(snap(), snap({"ETH": 10.0})) == [
+        "📥 New token detected: ETH — approx $10.00 (source: coinglass)",
+        f"🟢 BUY detected: ETH increased $0.00 → $10.00 (wallet: {ADDR}, src: coinglass)",
+    ]
+
+
+@pytest.mark.parametrize("before,after,expected", [
+    (10.0, 10.99, []),            # below the $1 floor
+    (10.0, 11.0, ["buy"]),
+    (1000.0, 1020.0, []),         # below 2% of the larger value
+    (1000.0, 1021.0, ["buy"]),
+    (1000.0, 979.0, ["sell"]),
+    (50.0, 0.0, ["sell"]),        # token gone
+])
+def test_buy_sell_thresholds(before, after, expected):
+    now = {"ETH": after} if after else {}
+    assert kinds(snap({"ETH": before}), snap(now)) == expected
+
+
+@pytest.mark.parametrize("before,after,event", [
+    (0.0, 4.99, False),           # below the $5 floor
+    (0.0, 5.0, True),
+    (1000.0, 1049.0, False),      # below 5% of the previous total
+    (1000.0, 1050.0, True),
+    (1000.0, 940.0, True),
+])
+def test_balance_threshold(before, after, event):
+    assert (kinds(snap(usd_total=before), snap(usd_total=after)) == ["balance"]) is event
+
+
+def test_balance_text():
+    assert diff(snap(usd_total=100), snap(usd_total=150.5)) == [
+        "ℹ️ Balance change: $100.00 → $150.50 (diff $+50.50) (src: coinglass)"]
+
+
+def test_position_open_increase_close():
+    prev = snap(positions=[pos("BTC", "long", 1000), pos("ETH", "short", 500)])
+    now = snap(positions=[pos("BTC", "LONG", 1051), pos("SOL", "long", 200)])
+    assert diff(prev, now) == [
+        "⚡ Position INCREASE: BTC LONG $1000 → $1051 (src: coinglass)",
+        "⚡ Position OPEN: SOL LONG $200 (src: coinglass)",
+        "⚡ Position CLOSED: ETH SHORT (was $500) (src: coinglass)",
+    ]
+
+
+@pytest.mark.parametrize("prev_size,size,expected", [
+    (1000, 1050, []),             # exactly 5% is not an increase
+    (1000, 900, []),              # decreases are not signalled
+    (None, 9, []),                # too small to open
+    (5, 9, []),                   # too small to count as an increase
+    (5, 20, ["increase"]),
+])
+def test_position_thresholds(prev_size, size, expected):
+    prev = snap(positions=[pos("BTC", "long", prev_size)] if prev_size is not None else [])
+    assert kinds(prev, snap(positions=[pos("BTC", "long", size)])) == expected
+
+
+def test_flipped_side_is_close_and_open():
+    prev = snap(positions=[pos("BTC", "long", 1000)])
+    now = snap(positions=[pos("BTC", "short", 1000)])
+    assert kinds(prev, now) == ["open", "close"]
+
+
+def test_duplicate_position_keys():
+    # the last duplicate of a key is the one compared against; every duplicate in prev can close
+    prev = snap(positions=[pos("BTC", "long", 5000), pos("BTC", "long", 100)])
+    now = snap(positions=[pos("BTC", "long", 200), pos("BTC", "long", 90)])
+    assert diff(prev, now) == ["⚡ Position INCREASE: BTC LONG $100 → $200 (src: coinglass)"]
+    assert diff(prev, snap()) == [
+        "⚡ Position CLOSED: BTC LONG (was $5000) (src: coinglass)",
+        "⚡ Position CLOSED: BTC LONG (was $100) (src: coinglass)",
+    ]
+
+
+def test_source_is_the_new_snapshots():
+    assert diff(snap({"ETH": 100}, source="debank"), snap({"ETH": 200}, source="coinglass")) == [
+        f"🟢 BUY detected: ETH increased $100.00 → $200.00 (wallet: {ADDR}, src: coinglass)"]
+
+
+def random_snapshot(rng: random.Random) -> Dict[str, Any]:
+    tokens = {f"T{rng.randrange(15)}": rng.choice([0.0, 0.5, 9.99, 10.0, 100.0, rng.uniform(0, 5000)])
+              for _ in range(rng.randrange(12))}
+    positions = [pos(rng.choice(["BTC", "ETH", "SOL", None]), rng.choice(["long", "SHORT", ""]),
+                     rng.choice([0, 9.99, 10, 100, 105, 105.01, rng.uniform(0, 1e5)]))
+                 for _ in range(rng.randrange(6))]
+    return snap(tokens, positions, rng.choice([0, 4.99, 100, rng.uniform(0, 1e5)]), rng.choice(["coinglass", "debank"]))
+
+
+def test_parity_with_previous_implementation():
+    rng = random.Random(8)
+    for _ in range(2000):
+        prev = random_snapshot(rng)
+        now = random_snapshot(rng) if rng.random() < 0.5 else {
+            **prev,
+            "tokens": {t: v * rng.choice([1, 1.01, 1.5, 0]) for t, v in prev["tokens"].items()},
+            "positions": [pos(p["symbol"], p["side"], p["size_usd"] * rng.choice([1, 1.06, 0.5]))
+                          for p in prev["positions"] if rng.random() < 0.8],
+        }
+        # the old code walked a set of tokens, so only the multiset of events is comparable
+        assert sorted(diff(prev, now)) == sorted(reference_events(ADDR, prev, now))
+
+
+def test_compare_and_generate_events_uses_stored_state(monkeypatch):
+    stored = bot.normalize_snapshot(snap({"ETH": 100}))
+    monkeypatch.setattr(bot, "get_wallet_snapshot", lambda addr: stored)
+    assert bot.compare_and_generate_events(ADDR, snap({"ETH": 300})) == [
+        f"🟢 BUY detected: ETH increased $100.00 → $300.00 (wallet: {ADDR}, src: coinglass)"]
+
+
+def test_streamed_positions_are_not_signalled_again_by_the_next_poll(monkeypatch):
+    stored = {}
+    monkeypatch.setattr(bot, "EVENT_SOURCE_GUARD", True)
+    monkeypatch.setattr(bot, "source_history", bot.SourceHistory())
+    monkeypatch.setattr(bot, "get_wallet_snapshot", lambda addr: stored.get(addr, bot.EMPTY_SNAPSHOT))
+
+    def apply(snapshot, base=None):
+        now = bot.normalize_snapshot(snapshot)
+        events = bot.detect_events(ADDR, now, base)
+        stored[ADDR] = now
+        return [e.text(ADDR) for e in events]
+
+    apply(snap({"ETH": 1000}, usd_total=1000))
+    prev = stored[ADDR]
+    streamed = apply(snap(prev.tokens, [pos("BTC", "long", 5000.4)], prev.usd_total, "hyperliquid"), base=prev)
+    assert streamed == ["⚡ Position OPEN: BTC LONG $5000 (src: hyperliquid)"]
+    assert apply(snap({"ETH": 1000}, [pos("BTC", "long", 5003)], 1000)) == []
+    # a real change after the stream update is still signalled against the poll source
+    assert apply(snap({"ETH": 1000}, [pos("BTC", "long", 6000)], 1000)) == [
+        "⚡ Position INCREASE: BTC LONG $5003 → $6000 (src: coinglass)"]
+
+
+NAN, INF = float("nan"), float("inf")
+
+
+@pytest.mark.parametrize("prev,now", [
+    (snap(usd_total=NAN), snap(usd_total=NAN)),
+    (snap(usd_total=INF), snap(usd_total=INF)),
+    (snap(usd_total=1), snap(usd_total=NAN)),
+    (snap(usd_total=1), snap(usd_total=INF)),
+    (snap({"A": NAN, "B": INF, "C": 5}), snap({"A": NAN, "B": INF, "C": NAN})),
+    (snap(positions=[pos("BTC", "long", NAN)]), snap(positions=[pos("BTC", "long", INF)])),
+])
+def test_batch_matches_per_wallet_on_non_finite_values(prev, now):
+    pytest.importorskip("numpy")
+    pairs = [(bot.normalize_snapshot(prev), bot.normalize_snapshot(now))]
+    assert [e.text(ADDR) for e in bot.diff_events_batch(pairs)[0]] == diff(prev, now)
+
+
+def test_batch_matches_per_wallet():
+    pytest.importorskip("numpy")
+    rng = random.Random(21)
+    pairs = [(bot.normalize_snapshot(random_snapshot(rng)), bot.normalize_snapshot(random_snapshot(rng)))
+             for _ in range(500)]
+    pairs += [(p, p) for p, _ in pairs[:50]]
+    batch = bot.diff_events_batch(pairs)
+    assert [[e.text(ADDR) for e in es] for es in batch] == [bot.diff_snapshots(ADDR, p, n) for p, n in pairs]
+
+
+def window(*snapshots) -> List[str]:
+    """Collapse the events of consecutive snapshots seen within one EVENT_WINDOW."""
+    snaps = [bot.normalize_snapshot(s) for s in snapshots]
+    events = [e for prev, now in zip(snaps, snaps[1:]) for e in bot.diff_events(prev, now)]
+    return [e.text(ADDR) for e in bot.collapse_events(events)]
+
+
+def test_collapsed_token_sold_out_and_bought_back_is_not_new():
+    assert window(snap({"ETH": 100}), snap(), snap({"ETH": 100})) == []
+    assert window(snap({"ETH": 100}), snap(), snap({"ETH": 300})) == [
+        f"🟢 BUY detected: ETH increased $100.00 → $300.00 (wallet: {ADDR}, src: coinglass)"]
+
+
+def test_collapsed_new_token_reports_its_last_value():
+    assert window(snap(), snap({"ETH": 50}), snap({"ETH": 80})) == [
+        "📥 New token detected: ETH — approx $80.00 (source: coinglass)"]
@@ -0,0 +1,68 @@
+"""Poll engine: baselines for wallets that join this process's shard."""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import hyperdash_telegram_bot_mtproto_coinglass as bot
+
+
+def wait_for(cond, timeout=5.0):
+    end = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < end, "timed out"
+        time.sleep(0.01)
+
+
+def test_new_shard_wallets_are_baselined_before_they_are_polled(monkeypatch):
+    known = ["0x" + "1" * 40]
+    joined = ["0x%040x" % (0xb0 + i) for i in range(8)]
+    gate = threading.Event()
+
+    def fetch(addr):
+        gate.wait(5)
+        return {"tokens": {"ETH": 100.0, "BTC": 250.0}, "positions": [], "usd_total": 350.0, "source": "coinglass"}
+
+    monkeypatch.setattr(bot, "detect_and_build_snapshots", fetch)
+    monkeypatch.setattr(bot, "load_wallets", lambda: known + joined)
+    monkeypatch.setattr(bot, "_shard_known", set(known))
+
+    wallets = bot.load_shard_wallets()
+    assert wallets == known + joined
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        # the first cycle runs while the baselines are still being fetched
+        stats = bot.run_poll_cycle(pool, joined, 0.5)
+        gate.set()
+        assert stats["skipped"] == len(joined) and stats["events"] == 0
+        wait_for(lambda: not set(joined) & bot._inflight)
+        assert all(bot.app.state_store.get_snapshot(w) is not None for w in joined)
+        stats = bot.run_poll_cycle(pool, joined, 5)
+    assert stats["done"] == len(joined) and stats["events"] == 0
+
+
+def test_scheduler_picks_up_pins_written_by_another_process(tmp_path):
+    path = str(tmp_path / "poll_overrides.json")
+    addr = "0x" + "c" * 40
+    poller = bot.AdaptiveScheduler(300, 60, 3600, 0.5, 1.5, path)
+    telegram = bot.AdaptiveScheduler(300, 60, 3600, 0.5, 1.5, path)
+    poller.sync([addr], 1000.0)
+    poller.pop_due(1000.0, 10)
+    poller.complete(addr, 0, 1000.0)
+    assert poller.next_due() == 1450.0
+
+    telegram.set_override(addr, 120, 1010.0)
+    poller.sync([addr], 1020.0)
+    assert poller.interval_of(addr) == 120 and poller.next_due() == 1140.0
+
+    telegram.set_override(addr, None, 1030.0)
+    poller.sync([addr], 1040.0)
+    assert poller.overrides == {}
+    poller.pop_due(1140.0, 10)
+    poller.complete(addr, 0, 1140.0)
+    assert poller.interval_of(addr) == 180.0    # adapts again from the pinned interval
+
+    with open(path, "w") as f:
+        f.write("{not json")
+    telegram.set_override(addr, 90, 1150.0)     # a bad hand edit is replaced by the next pin
+    poller.sync([addr], 1160.0)
+    assert poller.overrides == {addr: 90}
@@ -0,0 +1,47 @@
+"""JSON-file registries: debounced saves and reloading external edits."""
+
+import json
+
+import pytest
+
+import hyperdash_telegram_bot_mtproto_coinglass as bot
+
+W1, W2 = "0x" + "1" * 40, "0x" + "2" * 40
+
+
+def wallets(path):
+    return bot.JsonSetRegistry(path, bot._normalize_wallet, save_delay=0, check_interval=0)
+
+
+def subscriptions(path):
+    return bot.SubscriptionRegistry(path, save_delay=0, check_interval=0)
+
+
+def add(registry, addr):
+    if isinstance(registry, bot.SubscriptionRegistry):
+        registry.subscribe_many(1, [addr])
+    else:
+        registry.add(addr)
+
+
+def contents(registry):
+    return registry.wallets_of(1) if isinstance(registry, bot.SubscriptionRegistry) else registry.items()
+
+
+@pytest.mark.parametrize("make,edit", [
+    (wallets, [W2.upper()]),
+    (subscriptions, {"1": [W2.upper()]}),
+])
+def test_registry_reloads_external_edits_and_keeps_cache_on_bad_ones(tmp_path, make, edit):
+    path = str(tmp_path / "registry.json")
+    registry = make(path)
+    add(registry, W1)
+    assert contents(make(path)) == [W1]
+
+    with open(path, "w") as f:
+        json.dump(edit, f)
+    assert contents(registry) == [W2]
+
+    with open(path, "w") as f:
+        f.write("[not json")
+    assert contents(registry) == [W2]